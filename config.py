@@ -506,6 +506,7 @@ definitions = {
         ] + [
         ("fastLeaves", "fast leaves", True),
         ("roughGraphics", "rough graphics", False),
+        ("greedyMeshing", "greedy meshing", False),
         ("showChunkRedraw", "show chunk redraw", True),
         ("drawSky", "draw sky", True),
         ("drawFog", "draw fog", True),
@@ -518,6 +519,8 @@ definitions = {
         ("drawUnpopulatedChunks", "draw unpopulated chunks", True),
         ("drawChunkBorders", "draw chunk borders", False),
         ("vertexBufferLimit", "vertex buffer limit", 384),
+        ("vertexBuffers", "vertex buffers", False),
+        ("meshWorkers", "mesh workers", 2),
         ("vsync", "vertical sync", 0),
         ("viewMode", "View Mode", "Camera"),
         ("undoLimit", "Undo Limit", 20),
@@ -1159,8 +1159,5 @@ def createTileEntities(block, box, chunk, defsIds=None):
     tileEntity = chunk.world.tileEntityDefs.stringNames[block.stringID]
     for (x, y, z) in box.positions:
         if chunk.world.blockAt(x, y, z) == block.ID:
-            if chunk.tileEntityAt(x, y, z):
-                chunk.removeTileEntitiesInBox(BoundingBox((x, y, z), (1, 1, 1)))
-            tileEntityObject = TileEntity.Create(tileEntity, (x, y, z), defsIds=defsIds)
-            chunk.TileEntities.append(tileEntityObject)
-            chunk._fakeEntities = None
+            # replaces the tile entity already there
+            chunk.addTileEntity(TileEntity.Create(tileEntity, (x, y, z), defsIds=defsIds))
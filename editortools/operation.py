@@ -50,6 +50,8 @@ class Operation(object):
             return self.extractUndoSchematic(level, box)
 
         undoLevel = pymclevel.MCInfdevOldLevel(mkundotemp(), create=True)
+        # undo worlds are only ever read back by MCEdit
+        undoLevel.setCompression(*undoLevel.tempCompression)
         if not chunkCount:
             try:
                 chunkCount = len(chunks)
@@ -21,6 +21,7 @@ Pythonesque wrappers around certain OpenGL functions.
 from OpenGL import GL
 import numpy
 from contextlib import contextmanager
+import functools
 
 import weakref
 from OpenGL.GL import framebufferobjects as FBO
@@ -164,6 +165,107 @@ class DisplayList(object):
             GL.glCallLists(self._list)
 
 
+class BufferRange(object):
+    """ A range of bytes in one of the vertex buffers of a BufferPool """
+
+    def __init__(self, pool, buffer, offset, size):
+        self.pool = pool
+        self.buffer = buffer
+        self.offset = offset
+        self.size = size
+
+    def free(self):
+        if self.pool is not None:
+            self.pool.free(self)
+            self.pool = None
+
+
+class BufferPool(object):
+    """ Keeps vertex data in a few large vertex buffer objects, and gives out ranges of them. Uploading or freeing
+    the vertices of a chunk only changes part of a buffer, instead of creating or deleting one. Needs OpenGL 1.5. """
+
+    bufferSize = 4 << 20
+    alignment = 16
+
+    def __init__(self, bufferSize=None):
+        if bufferSize:
+            self.bufferSize = bufferSize
+        self.bufferSizes = {}  # maps buffer ids to their sizes
+        self.freeRanges = {}  # maps buffer ids to their free [offset, size] ranges, in order
+        self.usedBytes = 0
+
+    @staticmethod
+    def available():
+        return bool(GL.glGenBuffers)
+
+    def upload(self, data):
+        """ Copies the array data to a free range of a buffer and returns the BufferRange """
+        bufferRange = self.allocate(data.nbytes)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, bufferRange.buffer)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, bufferRange.offset, data.nbytes, data)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        return bufferRange
+
+    def allocate(self, size):
+        size = (size + self.alignment - 1) & ~(self.alignment - 1)
+        for buffer, freeRanges in self.freeRanges.iteritems():
+            for i, (offset, freeSize) in enumerate(freeRanges):
+                if freeSize >= size:
+                    if freeSize == size:
+                        del freeRanges[i]
+                    else:
+                        freeRanges[i] = [offset + size, freeSize - size]
+                    self.usedBytes += size
+                    return BufferRange(self, buffer, offset, size)
+
+        buffer = self.createBuffer(max(size, self.bufferSize))
+        if self.bufferSizes[buffer] > size:
+            self.freeRanges[buffer].append([size, self.bufferSizes[buffer] - size])
+        self.usedBytes += size
+        return BufferRange(self, buffer, 0, size)
+
+    def free(self, bufferRange):
+        buffer = bufferRange.buffer
+        if buffer not in self.freeRanges:
+            return
+        self.usedBytes -= bufferRange.size
+
+        # insert the range, then join it with the free ranges just before and after it
+        freeRanges = self.freeRanges[buffer]
+        i = 0
+        while i < len(freeRanges) and freeRanges[i][0] < bufferRange.offset:
+            i += 1
+        freeRanges.insert(i, [bufferRange.offset, bufferRange.size])
+        if i + 1 < len(freeRanges) and freeRanges[i][0] + freeRanges[i][1] == freeRanges[i + 1][0]:
+            freeRanges[i][1] += freeRanges.pop(i + 1)[1]
+        if i > 0 and freeRanges[i - 1][0] + freeRanges[i - 1][1] == freeRanges[i][0]:
+            freeRanges[i - 1][1] += freeRanges.pop(i)[1]
+
+        # keep one empty buffer for the next chunks
+        if freeRanges == [[0, self.bufferSizes[buffer]]] and len(self.bufferSizes) > 1:
+            self.deleteBuffer(buffer)
+
+    def createBuffer(self, size):
+        buffer = int(GL.glGenBuffers(1))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, size, None, GL.GL_DYNAMIC_DRAW)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self.bufferSizes[buffer] = size
+        self.freeRanges[buffer] = []
+        return buffer
+
+    def deleteBuffer(self, buffer):
+        GL.glDeleteBuffers(1, [buffer])
+        del self.bufferSizes[buffer]
+        del self.freeRanges[buffer]
+
+    def delete(self):
+        """ Deletes all of the buffers. Ranges still in use must not be drawn or freed afterwards. """
+        for buffer in self.bufferSizes.keys():
+            self.deleteBuffer(buffer)
+        self.usedBytes = 0
+
+
 class Texture(object):
     allTextures = []
     defaultFilter = GL.GL_NEAREST
@@ -201,6 +303,29 @@ class Texture(object):
         self.dirty = True
 
 
+def makeTileTextures(texture, unitsAcross):
+    """ Cuts a terrain texture whose width is unitsAcross texture units into a texture for each of its 16 unit square
+    tiles. Unlike the terrain texture, a tile texture repeats across a quad larger than one block. The tiles are kept
+    in texture.tileTextures, keyed by the s, t of their corner in the terrain texture. Does nothing for textures that
+    don't keep their data. """
+    data = getattr(texture, "data", None)
+    if data is None:
+        return
+
+    def loadTile(tile):
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, tile.shape[1], tile.shape[0], 0, GL.GL_RGBA,
+                        GL.GL_UNSIGNED_BYTE, tile)
+
+    h, w = data.shape[:2]
+    tileTextures = {}
+    for t in xrange(0, unitsAcross, 16):
+        for s in xrange(0, unitsAcross, 16):
+            tile = numpy.array(data[t * h / unitsAcross:(t + 16) * h / unitsAcross,
+                                    s * w / unitsAcross:(s + 16) * w / unitsAcross])
+            tileTextures[s, t] = Texture(functools.partial(loadTile, tile))
+    texture.tileTextures = tileTextures
+
+
 class FramebufferTexture(Texture):
     def __init__(self, width, height, drawFunc):
         tex = GL.glGenTextures(1)
@@ -828,8 +828,8 @@ class LevelEditor(GLViewport):
             for (chunk, slices, point) in level.getChunkSlices(box):
                 i += 1
                 yield i, box.chunkCount
-                blocks = numpy.array(chunk.Blocks[slices], dtype='uint16')
-                blocks |= (numpy.array(chunk.Data[slices], dtype='uint16') << 12)
+                blocks = numpy.array(chunk.readOnlyArray("Blocks", slices), dtype='uint16')
+                blocks |= (numpy.array(chunk.readOnlyArray("Data", slices), dtype='uint16') << 12)
                 b = numpy.bincount(blocks.ravel())
                 types[:b.shape[0]] = types[:b.shape[0]].astype(int) + b
 
@@ -14,6 +14,7 @@ import traceback
 import shlex
 import operator
 import codecs
+import multiprocessing
 
 from math import floor
 
@@ -66,7 +67,7 @@ class mce(object):
        {commandPrefix}createChunks <box>
        {commandPrefix}deleteChunks <box>
        {commandPrefix}prune <box>
-       {commandPrefix}relight [ <box> ]
+       {commandPrefix}relight [ <box> ] [ queue | sweep ] [ workers <count> ]
 
     World commands:
        {commandPrefix}create <filename>
@@ -77,6 +78,7 @@ class mce(object):
        {commandPrefix}heightmap <filename>
        {commandPrefix}randomseed [ <seed> ]
        {commandPrefix}gametype [ <player> [ <gametype> ] ]
+       {commandPrefix}compression [ <level> ]
 
     Editor commands:
        {commandPrefix}save
@@ -133,6 +135,7 @@ class mce(object):
         "heightmap",
         "randomseed",
         "gametype",
+        "compression",
 
         "save",
         "load",
@@ -229,6 +232,18 @@ class mce(object):
 
         return x, y, z
 
+    def chunksWithEntities(self, kind, ids):
+        """ Returns the positions of the chunks that may hold entities of the given kind, "Entities" or
+        "TileEntities", whose id is in ids. ids may also be a function returning True for the ids to find.
+        Uses the entity index of worlds that have one. """
+        if not hasattr(self.level, "getEntityIndex"):
+            return self.level.allChunks
+
+        index = self.level.getEntityIndex()
+        if callable(ids):
+            ids = [id for id in index.ids(kind) if ids(id)]
+        return index.findChunks(kind, ids)
+
     def readBlockInfo(self, command):
         keyword = command.pop(0)
 
@@ -612,7 +627,7 @@ class mce(object):
         print "Dumping signs..."
         signCount = 0
 
-        for i, cPos in enumerate(self.level.allChunks):
+        for i, cPos in enumerate(self.chunksWithEntities("TileEntities", ["Sign"])):
             try:
                 chunk = self.level.getChunk(*cPos)
             except mclevelbase.ChunkMalformed:
@@ -645,25 +660,7 @@ class mce(object):
         assert level.version
 
         def getFreeSectors(rf):
-            runs = []
-            start = None
-            count = 0
-            for i, free in enumerate(rf.freeSectors):
-                if free:
-                    if start is None:
-                        start = i
-                        count = 1
-                    else:
-                        count += 1
-                else:
-                    if start is None:
-                        pass
-                    else:
-                        runs.append((start, count))
-                        start = None
-                        count = 0
-
-            return runs
+            return rf.sectors.freeRuns()
 
         def printFreeSectors(runs):
 
@@ -771,7 +768,7 @@ class mce(object):
         print "Dumping chests..."
         chestCount = 0
 
-        for i, cPos in enumerate(self.level.allChunks):
+        for i, cPos in enumerate(self.chunksWithEntities("TileEntities", ["Chest"])):
             try:
                 chunk = self.level.getChunk(*cPos)
             except mclevelbase.ChunkMalformed:
@@ -857,7 +854,8 @@ class mce(object):
             print "Removing all entities except Painting..."
             match_type = ENT_MATCHTYPE_NONPAINTING
 
-        for cx, cz in self.level.allChunks:
+        chunks = self.chunksWithEntities("Entities", lambda entityID: match(entityID, match_type, match_words))
+        for cx, cz in chunks:
             chunk = self.level.getChunk(cx, cz)
             entitiesRemoved = 0
 
@@ -942,11 +940,29 @@ class mce(object):
 
     def _relight(self, command):
         """
-    relight [ <box> ]
+    relight [ <box> ] [ queue | sweep ] [ workers <count> ]
 
     Recalculates lights in the region specified. If omitted,
-    recalculates the entire world.
+    recalculates the entire world. The default, queue, only
+    visits blocks whose light changes. sweep spreads light
+    across every chunk until nothing changes.
+
+    With workers, the queue method lights the world in that
+    many processes at once.
     """
+        method = None
+        workers = 0
+        if len(command) > 1 and command[-2].lower() == "workers":
+            try:
+                workers = int(command.pop())
+            except ValueError:
+                raise UsageError("Expected a number of workers")
+            command.pop()
+        if len(command) and command[-1].lower() in ("queue", "sweep"):
+            method = command.pop().lower()
+        if workers > 1 and method == "sweep":
+            raise UsageError("Only the queue method can use workers")
+
         if len(command):
             box = self.readBox(command)
             chunks = itertools.product(range(box.mincx, box.maxcx), range(box.mincz, box.maxcz))
@@ -954,7 +970,7 @@ class mce(object):
         else:
             chunks = self.level.allChunks
 
-        self.level.generateLights(chunks)
+        self.level.generateLights(chunks, method, workers)
 
         print "Relit 0 chunks."
         self.needsSave = True
@@ -1119,6 +1135,29 @@ class mce(object):
         self.level.setPlayerGameType(gametype, player)
         self.needsSave = True
 
+    def _compression(self, command):
+        """
+    compression [ <level> ]
+
+    Set or display the zlib compression level, from 1 to 9, used for chunks
+    saved to this world. Higher levels make smaller files but save more
+    slowly. Chunks that are not changed keep their current compression.
+    """
+        if not isinstance(self.level, mclevel.MCInfdevOldLevel):
+            raise UsageError("Only Anvil worlds have a compression level")
+
+        if len(command):
+            try:
+                compressLevel = int(command[0])
+            except ValueError:
+                raise UsageError("Expected a compression level")
+            if not 1 <= compressLevel <= 9:
+                raise UsageError("Expected a compression level from 1 to 9")
+
+            self.level.setCompression(compressLevel=compressLevel)
+
+        print "Compression level: {0}".format(self.level.compressLevel)
+
     def _worldsize(self, command):
         """
     worldsize
@@ -1372,6 +1411,10 @@ class mce(object):
         else:
             self.level = mclevel.loadWorld(world)
 
+        if isinstance(self.level, pymclevel.infiniteworld.MCInfdevOldLevel):
+            # inflate and deflate chunks on every core while loading, relighting and saving
+            self.level.compressionWorkers = multiprocessing.cpu_count()
+
     level = None
 
     batchMode = False
@@ -0,0 +1,239 @@
+"""
+Times the CPU side of chunk rendering: ChunkCalculator and the block renderers making vertex arrays. OpenGL, pygame
+and a display are not needed, so it can run on a build server.
+
+    python meshbench.py [options] [world folder]
+
+Without a world folder, a world of random blocks is made in a temporary folder. The chunks are read before the
+timing starts, so only the meshing is timed. For each detail level, it reports the milliseconds per chunk, the
+vertices made per second, the kilobytes of vertex arrays per chunk, and the milliseconds per chunk spent in each block
+renderer class. "(chunk arrays)" is the rest of the time, mostly spent by ChunkCalculator on the area block, light and
+facing arrays. --greedy meshes with the Greedy Meshing graphics setting on.
+
+Use --output to write the results to a JSON file and --baseline to compare them with an earlier one. The exit status
+is 1 if a timing got slower than its baseline by more than --tolerance.
+"""
+
+from collections import defaultdict
+import json
+import math
+import optparse
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+import numpy
+
+import pymclevel
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from pymclevel.test.benchmark import compareResults
+import renderer
+
+RESULTS_VERSION = 1
+
+CHUNK = "(chunk)"
+CHUNK_ARRAYS = "(chunk arrays)"
+
+# Scattered over the synthetic world so most block renderers have something to do: water, leaves, glass, flowers,
+# torches, slabs, stairs, rails, ladders, redstone, doors, snow, cactus, fences, panes, vines and carpet.
+SCATTERED_BLOCKS = [9, 18, 20, 37, 38, 50, 44, 53, 66, 65, 55, 64, 78, 81, 85, 102, 106, 171]
+
+
+def makeWorld(filename, size, seed=0):
+    """ Creates a world of size by size chunks of stone and dirt under grass, with blocks of many kinds scattered
+    above it """
+    random = numpy.random.RandomState(seed)
+    level = MCInfdevOldLevel(filename=filename, create=True)
+    level.createChunksInBox(BoundingBox((0, 0, 0), (16 * size, 128, 16 * size)))
+    for chunk in level.getChunks():
+        heights = 60 + random.randint(0, 4, (16, 16))
+        for y in xrange(56, 64):
+            chunk.Blocks[:, :, y][y < heights] = 3
+            chunk.Blocks[:, :, y][y == heights] = 2
+        chunk.Blocks[:, :, :56] = 1
+
+        scattered = random.randint(0, 10, (16, 16, 8)) == 0
+        blocks = chunk.Blocks[:, :, 64:72]
+        blocks[scattered] = random.choice(SCATTERED_BLOCKS, scattered.sum())
+        chunk.Data[:, :, 64:72] = random.randint(0, 16, (16, 16, 8))
+        chunk.chunkChanged(False)
+    level.saveInPlace()
+    level.close()
+
+
+def pickChunks(level, count):
+    """ Returns up to count positions of chunks whose four neighbors exist, nearest the middle of the world first """
+    chunks = set(level.allChunks)
+    positions = [(cx, cz) for cx, cz in chunks
+                 if all((cx + dx, cz + dz) in chunks for dx, dz in ((1, 0), (-1, 0), (0, 1), (0, -1)))]
+    if not positions:
+        positions = list(chunks)
+    if not positions:
+        return []
+
+    mx = sum(cx for cx, cz in positions) / float(len(positions))
+    mz = sum(cz for cx, cz in positions) / float(len(positions))
+    positions.sort(key=lambda (cx, cz): ((cx - mx) ** 2 + (cz - mz) ** 2, cx, cz))
+    return positions[:count]
+
+
+def loadChunks(level, positions):
+    """ Reads the chunks and their neighbors, and returns them so they stay loaded while they are meshed """
+    chunks = []
+    for cx, cz in positions:
+        for dx, dz in ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)):
+            if level.containsChunk(cx + dx, cz + dz):
+                chunks.append(level.getChunk(cx + dx, cz + dz))
+    return chunks
+
+
+def vertexCount(chunkRenderer):
+    return sum(a.size // a.shape[-1] for br in chunkRenderer.blockRenderers for a in br.vertexArrays if a.size)
+
+
+def meshChunks(level, positions, detailLevel, repeat, greedy=False):
+    """ Meshes the chunks at the detail level, repeat times, and returns the seconds per chunk of the fastest run
+    for CHUNK, CHUNK_ARRAYS and the names of the block renderer classes, the vertices per chunk, and the bytes of
+    vertex arrays per chunk """
+    mesher = renderer.ChunkMesher(level, detailLevel)
+    mesher.chunkCalculator.greedyMeshing = greedy
+    best = None
+    for i in range(repeat):
+        timings = mesher.chunkCalculator.timings = defaultdict(float)
+        vertices = bufferSize = 0
+        start = default_timer()
+        for cx, cz in positions:
+            cr = mesher.meshChunk(cx, cz)
+            vertices += vertexCount(cr)
+            bufferSize += cr.bufferSize
+        seconds = default_timer() - start
+        if best is None or seconds < best[0]:
+            best = seconds, timings, vertices, bufferSize
+
+    seconds, timings, vertices, bufferSize = best
+    count = float(len(positions))
+    times = dict((cls.__name__, t / count) for cls, t in timings.iteritems())
+    times[CHUNK_ARRAYS] = (seconds - sum(timings.itervalues())) / count
+    times[CHUNK] = seconds / count
+    return times, vertices / count, bufferSize / count
+
+
+def runBenchmarks(level, chunkCount=64, detailLevels=(0, 1), repeat=3, greedy=False):
+    """ Returns (results, vertices, bufferSizes). results maps "lod0", "lod1"... to the times returned by
+    meshChunks, vertices maps them to the vertices made per second, and bufferSizes to the bytes of vertex arrays per
+    chunk """
+    positions = pickChunks(level, chunkCount)
+    chunks = loadChunks(level, positions)
+    results = {}
+    vertices = {}
+    bufferSizes = {}
+    for detailLevel in detailLevels:
+        key = "lod{0}".format(detailLevel)
+        results[key], perChunk, bufferSizes[key] = meshChunks(level, positions, detailLevel, repeat, greedy)
+        vertices[key] = perChunk / results[key][CHUNK] if results[key][CHUNK] else 0.0
+    del chunks
+    return results, vertices, bufferSizes
+
+
+def printResults(results, vertices, bufferSizes):
+    for key, times in sorted(results.iteritems()):
+        print "{0}: {1:.2f} ms per chunk, {2:.0f} vertices per second, {3:.1f} KB of vertex arrays per chunk".format(
+            key, times[CHUNK] * 1000, vertices[key], bufferSizes[key] / 1024.)
+        print "    {0:28} {1:>10} {2:>7}".format("block renderer", "ms/chunk", "share")
+        rows = sorted(((t, name) for name, t in times.iteritems() if name != CHUNK), reverse=True)
+        for t, name in rows:
+            print "    {0:28} {1:>10.3f} {2:>6.1f}%".format(name, t * 1000, 100 * t / times[CHUNK] if times[CHUNK] else 0)
+        print
+
+
+# --- Command line ---
+
+parser = optparse.OptionParser(usage="python meshbench.py [options] [world folder]")
+parser.add_option("--chunks", type="int", default=64, help="Number of chunks to mesh [default: %default]")
+parser.add_option("--detail", default="0,1",
+                  help="Detail levels to time, separated by commas: 0 is high detail, 1 low detail and 2 overhead "
+                       "[default: %default]")
+parser.add_option("--greedy", action="store_true", help="Merge the faces of opaque blocks, like the Greedy Meshing "
+                                                          "graphics setting")
+parser.add_option("--repeat", type="int", default=3, help="Runs per detail level, the fastest is kept "
+                                                          "[default: %default]")
+parser.add_option("--output", help="Write the results to this JSON file")
+parser.add_option("--baseline", help="Compare the results with this JSON file written by an earlier run")
+parser.add_option("--tolerance", type="float", default=0.25,
+                  help="Slowdown allowed before a timing counts as a regression [default: %default]")
+parser.add_option("--min-ms", dest="minMs", type="float", default=0.05,
+                  help="Timings under this many milliseconds per chunk in the baseline are too noisy to compare "
+                       "[default: %default]")
+
+
+def main(argv):
+    options, args = parser.parse_args(argv[1:])
+    if len(args) > 1:
+        parser.error("Give at most one world folder")
+    detailLevels = [int(d) for d in options.detail.split(",")]
+
+    tempFolder = None
+    if args:
+        worldFolder = args[0]
+    else:
+        tempFolder = tempfile.mkdtemp("meshbench")
+        worldFolder = os.path.join(tempFolder, "World")
+        size = int(math.ceil(math.sqrt(options.chunks))) + 2
+        print >> sys.stderr, "Making a world of {0} chunks...".format(size * size)
+        makeWorld(worldFolder, size)
+
+    try:
+        level = pymclevel.fromFile(worldFolder, readonly=True)
+        try:
+            results, vertices, bufferSizes = runBenchmarks(level, options.chunks, detailLevels, options.repeat,
+                                                           options.greedy)
+        finally:
+            level.close()
+    finally:
+        if tempFolder is not None:
+            shutil.rmtree(tempFolder, True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "world": os.path.abspath(worldFolder) if tempFolder is None else None,
+        "chunks": options.chunks,
+        "repeat": options.repeat,
+        "greedy": bool(options.greedy),
+        "results": results,
+        "verticesPerSecond": vertices,
+        "bufferBytesPerChunk": bufferSizes,
+    }
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    printResults(results, vertices, bufferSizes)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)["results"]
+        minSeconds = options.minMs / 1000
+        baseline = dict((key, dict((name, t) for name, t in times.iteritems() if t >= minSeconds))
+                        for key, times in baseline.iteritems())
+        rows, regressions = compareResults(results, baseline, options.tolerance)
+        print "{0:6} {1:28} {2:>12} {3:>12} {4:>8}".format("detail", "block renderer", "baseline ms", "ms", "ratio")
+        for key, name, baseSeconds, seconds, ratio in rows:
+            print "{0:6} {1:28} {2:>12.3f} {3:>12.3f} {4:>8.2f}{5}".format(
+                key, name, baseSeconds * 1000, seconds * 1000, ratio,
+                " REGRESSION" if ratio > 1 + options.tolerance else "")
+        if regressions:
+            print "{0} timings are slower than the baseline.".format(len(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
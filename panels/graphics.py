@@ -20,6 +20,8 @@ class GraphicsPanel(Dialog):
             config.settings.vertexBufferLimit: config.settings.vertexBufferLimit.get(),
             config.settings.fastLeaves: config.settings.fastLeaves.get(),
             config.settings.roughGraphics: config.settings.roughGraphics.get(),
+            config.settings.greedyMeshing: config.settings.greedyMeshing.get(),
+            config.settings.vertexBuffers: config.settings.vertexBuffers.get(),
             config.settings.enableMouseLag: config.settings.enableMouseLag.get(),
             config.settings.maxViewDistance: config.settings.maxViewDistance.get()
         }
@@ -43,6 +45,14 @@ class GraphicsPanel(Dialog):
                                                 ref=config.settings.roughGraphics,
                                                 tooltipText="All blocks are drawn the same way (overrides 'Fast Leaves')")
 
+        greedyMeshingRow = albow.CheckBoxLabel("Greedy Meshing",
+                                                ref=config.settings.greedyMeshing,
+                                                tooltipText="Faces of solid blocks are merged into larger faces, using less video memory ('Rough Graphics' overrides it)")
+
+        vertexBuffersRow = albow.CheckBoxLabel("Vertex Buffers",
+                                                ref=config.settings.vertexBuffers,
+                                                tooltipText="Keep the chunks in shared vertex buffers in a smaller format instead of display lists. Needs OpenGL 1.5")
+
         enableMouseLagRow = albow.CheckBoxLabel("Enable Mouse Lag",
                                                 ref=config.settings.enableMouseLag,
                                                 tooltipText="Enable choppy mouse movement for faster loading.")
@@ -66,6 +76,8 @@ class GraphicsPanel(Dialog):
 
         settingsColumn = albow.Column((fastLeavesRow,
                                        roughGraphicsRow,
+                                       greedyMeshingRow,
+                                       vertexBuffersRow,
                                        enableMouseLagRow,
                                        #                                  texturePackRow,
                                        self.fieldOfViewRow,
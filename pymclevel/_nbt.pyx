@@ -43,21 +43,18 @@ import gzip
 import zlib
 
 from cStringIO import StringIO
-from cpython cimport PyTypeObject, PyUnicode_DecodeUTF8, PyList_Append, PyString_FromStringAndSize
+from cpython cimport PyUnicode_DecodeUTF8, PyList_Append, PyString_FromStringAndSize
+from libc.string cimport memcpy
 from contextlib import contextmanager
 import numpy
 import logging
 logger = logging.getLogger(__name__)
 
-cdef extern from "cStringIO.h":
-    struct PycStringIO_CAPI:
-        int cwrite(object o, char * buf, Py_ssize_t len)
-        PyTypeObject * OutputType
-cdef extern from "cobject.h":
-    void * PyCObject_Import(char * module_name, char * cobject_name)
+# Saved data is collected in a buffer of this size before being passed on. Arrays at least SAVE_ARRAY_DIRECT bytes
+# long are passed on as buffers of their own memory instead.
 
-cdef PycStringIO_CAPI *PycStringIO = <PycStringIO_CAPI *> PyCObject_Import("cStringIO", "cStringIO_CAPI")
-cdef PyTypeObject * StringO = PycStringIO.OutputType
+DEF SAVE_BUFFER_SIZE = 65536
+DEF SAVE_ARRAY_DIRECT = 1024
 
 # Tag IDs
 
@@ -95,6 +92,9 @@ ID_SHORT_ARRAY = _ID_SHORT_ARRAY
 ID_LONG_ARRAY = _ID_LONG_ARRAY
 ID_MAX = _ID_MAX
 
+cdef class save_ctx
+
+
 class NBTFormatError (ValueError):
     """Indicates the NBT format is invalid."""
 
@@ -164,7 +164,7 @@ cdef class TAG_Value:
 cdef class TAG_Byte(TAG_Value):
     cdef public char value
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_byte(self.value, buf)
 
     def __init__(self, char value=0, name=""):
@@ -176,7 +176,7 @@ cdef class TAG_Byte(TAG_Value):
 cdef class TAG_Short(TAG_Value):
     cdef public short value
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_short(self.value, buf)
 
     def __init__(self, short value=0, name=""):
@@ -188,7 +188,7 @@ cdef class TAG_Short(TAG_Value):
 cdef class TAG_Int(TAG_Value):
     cdef public int value
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_int(self.value, buf)
 
     def __init__(self, int value=0, name=""):
@@ -200,7 +200,7 @@ cdef class TAG_Int(TAG_Value):
 cdef class TAG_Long(TAG_Value):
     cdef public long long value
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_long(self.value, buf)
 
     def __init__(self, long long value=0, name=""):
@@ -212,7 +212,7 @@ cdef class TAG_Long(TAG_Value):
 cdef class TAG_Float(TAG_Value):
     cdef public float value
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_float(self.value, buf)
 
     def __init__(self, float value=0., name=""):
@@ -224,7 +224,7 @@ cdef class TAG_Float(TAG_Value):
 cdef class TAG_Double(TAG_Value):
     cdef public double value
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_double(self.value, buf)
 
     def __init__(self, double value=0., name=""):
@@ -245,7 +245,7 @@ cdef class TAG_Byte_Array(TAG_Value):
         self.name = name
         self.tagID = _ID_BYTE_ARRAY
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_array(self.value, buf, 1)
 
     def __repr__(self):
@@ -273,7 +273,7 @@ cdef class TAG_Int_Array(TAG_Value):
         self.name = name
         self.tagID = _ID_INT_ARRAY
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_array(self.value, buf, 4)
 
     def __repr__(self):
@@ -301,7 +301,7 @@ cdef class TAG_Long_Array(TAG_Value):
         self.name = name
         self.tagID = _ID_LONG_ARRAY
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_array(self.value, buf, 8)
 
     def __repr__(self):
@@ -331,7 +331,7 @@ cdef class TAG_Short_Array(TAG_Value):
         self.name = name
         self.tagID = _ID_SHORT_ARRAY
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_array(self.value, buf, 2)
 
     def __repr__(self):
@@ -364,7 +364,7 @@ cdef class TAG_String(TAG_Value):
                 value = PyUnicode_DecodeUTF8(value, len(value), "strict")
             self._value = value
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         save_string(self._value.encode('utf-8'), buf)
 
 
@@ -426,7 +426,7 @@ cdef class _TAG_List(TAG_Value):
     def __delitem__(self, key):
         del self.value[key]
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         cdef char list_type = self.list_type
         cdef TAG_Value tag
 
@@ -513,7 +513,7 @@ cdef class _TAG_Compound(TAG_Value):
     def get_all(self, key):
         return [v for v in self.value if v.name == key]
 
-    cdef void save_value(self, buf):
+    cdef void save_value(self, save_ctx buf) except *:
         cdef TAG_Value subtag
         for subtag in self.value:
             save_tag_id(subtag.tagID, buf)
@@ -525,28 +525,48 @@ cdef class _TAG_Compound(TAG_Value):
         """
         Pass a filename to save the data to a file. Pass a file-like object (with a read() method)
         to write the data to that object. Pass nothing to return the data as a string.
+        The data is compressed while it is serialized, so the uncompressed data is never held in memory at once.
         """
-        io = StringIO()
-        save_tag_id(self.tagID, io)
-        save_tag_name(self, io)
-        save_tag_value(self, io)
-        data = io.getvalue()
+        if filename_or_buf is None or isinstance(filename_or_buf, basestring):
+            # a file is only opened once all of its data is ready, so an error cannot leave it half written
+            out = StringIO()
+        else:
+            out = filename_or_buf
+
         if compressed:
-            gzio = StringIO()
-            gz = gzip.GzipFile(fileobj=gzio, mode='wb')
-            gz.write(data)
+            gz = gzip.GzipFile(filename="", fileobj=out, mode='wb')
+            self.stream(gz.write)
             gz.close()
-            data = gzio.getvalue()
+        else:
+            self.stream(out.write)
 
         if filename_or_buf is None:
-            return data
+            return out.getvalue()
 
         if isinstance(filename_or_buf, basestring):
             f = open(filename_or_buf, "wb")
-            f.write(data)
+            f.write(out.getvalue())
             f.close()
-        else:
-            filename_or_buf.write(data)
+
+    def stream(self, write):
+        """
+        Serializes this tag as a root tag, passing the data to write() in pieces. Large arrays are passed as buffers
+        of their own memory without being copied.
+        """
+        cdef save_ctx ctx = save_ctx()
+        ctx.write = write
+        save_tag_id(self.tagID, ctx)
+        save_tag_name(self, ctx)
+        save_tag_value(self, ctx)
+        flush(ctx)
+
+    def save_deflated(self, level=6):
+        """ Returns the data of this tag as a root tag, compressed with zlib as in region files """
+        compressor = zlib.compressobj(level)
+        pieces = []
+        self.stream(lambda data: pieces.append(compressor.compress(data)))
+        pieces.append(compressor.flush())
+        return "".join(pieces)
 
     def isCompound(self):
         return True
@@ -589,15 +609,25 @@ cdef void swab(void * vbuf, int nbytes):
 # --- NBT Loading ---
 #
 
-def load(filename="", buf=None):
+def load(filename="", buf=None, views=False, paths=None):
     """
     Load an NBT tree from a file and return the root TAG_Compound. The root tag is the only tag that can have a name
     itself without being inside a TAG_Compound.
     If filename is given, loads NBT data from that file. If buf is given, loads NBT data from the bytes or filehandle.
+    If views is True, the values of array tags are numpy arrays viewing one writable copy of the whole buffer instead
+    of a copy each. The buffer is kept alive by those arrays, and each array only covers its own tag's bytes.
+    If paths is given, only the tags named by those paths are loaded, with everything inside them, and the other
+    tags are skipped without being parsed. Paths are tag names separated by slashes, starting below the root tag,
+    like "Level/xPos". A path going through a list applies to each of its items, so "Level/Entities/id" loads the
+    Entities list with only the id of each entity.
     :param filename: Filename to load data from
     :type filename: basestring
     :param buf: File-like object to load data from
     :type buf: file-like object | bytes
+    :param views: Load array tags as views into a single buffer
+    :type views: bool
+    :param paths: Paths of the tags to load
+    :type paths: list of basestring | None
     :return: Structured NBT data
     :rtype: TAG_Compound
     """
@@ -609,11 +639,15 @@ def load(filename="", buf=None):
         data = buf.read()
 
     data = try_gunzip(data)
+    if views:
+        data = bytearray(data)
 
     cdef load_ctx ctx = load_ctx()
     ctx.offset = 1
     ctx.buffer = data
     ctx.size = len(data)
+    if views:
+        ctx.owner = data
 
     if len(data) < 1:
         raise NBTFormatError("NBT Stream too short!")
@@ -624,7 +658,7 @@ def load(filename="", buf=None):
         raise NBTFormatError('Not an NBT file with a root TAG_Compound '
                              '(file starts with "%4s" (0x%08x)' % (ctx.buffer, magic_no[0]))
     name = load_name(ctx)
-    tag = load_compound(ctx)
+    tag = load_compound(ctx, path_selection(paths))
     tag.name = name
 
     if hasattr(buf, "close"):
@@ -640,6 +674,7 @@ cdef class load_ctx:
     cdef size_t offset
     cdef char * buffer
     cdef size_t size
+    cdef object owner  # the bytearray holding buffer when loading array tags as views
 
 IF UNICODE_CACHE:
     cdef dict u_cache = dict()
@@ -713,7 +748,26 @@ cdef TAG_Double load_double(load_ctx ctx):
 # --- Load container types ---
 
 
-cdef load_compound(load_ctx ctx):
+def path_selection(paths):
+    """ Turns load's paths into nested dicts mapping tag names to the selection inside that tag, or to None to load
+    the whole tag """
+    if paths is None:
+        return None
+    selection = {}
+    for path in paths:
+        names = path.split("/")
+        node = selection
+        for name in names[:-1]:
+            child = node.setdefault(name, {})
+            if child is None:
+                break
+            node = child
+        else:
+            node[names[-1]] = None
+    return selection
+
+
+cdef load_compound(load_ctx ctx, dict selection=None):
     cdef char tagID
     cdef _TAG_Compound root_tag = TAG_Compound()
     cdef TAG_Value tag
@@ -721,8 +775,16 @@ cdef load_compound(load_ctx ctx):
         tagID = read(ctx, 1)[0]
         if tagID == _ID_END:
             break
-        else:
+        elif selection is None:
             root_tag.value.append(load_named(ctx, tagID))
+        else:
+            name = load_name(ctx)
+            if name in selection:
+                tag = load_tag(tagID, ctx, selection[name])
+                tag._name = name
+                root_tag.value.append(tag)
+            else:
+                skip_tag(tagID, ctx)
 
     return root_tag
 
@@ -734,7 +796,7 @@ cdef load_named(load_ctx ctx, char tagID):
     return tag
 
 
-cdef load_list(load_ctx ctx):
+cdef load_list(load_ctx ctx, dict selection=None):
     cdef char list_type = read(ctx, 1)[0]
     cdef int * ptr = <int *> read(ctx, 4)
     cdef int length = ptr[0]
@@ -744,7 +806,7 @@ cdef load_list(load_ctx ctx):
     cdef list val = tag.value
     cdef int i
     for i in xrange(length):
-        PyList_Append(val, load_tag(list_type, ctx))
+        PyList_Append(val, load_tag(list_type, ctx, selection))
 
     return tag
 
@@ -787,51 +849,39 @@ ELSE:
 
 # --- Load array types ---
 
-cdef TAG_Byte_Array load_byte_array(load_ctx ctx):
+cdef object load_array_value(load_ctx ctx, object dtype):
     cdef int * ptr = <int *> read(ctx, 4)
     cdef int length = ptr[0]
     swab(&length, 4)
 
-    byte_length = length
+    cdef size_t offset = ctx.offset
+    byte_length = length * dtype.itemsize
     cdef char *arr = read(ctx, byte_length)
-    return TAG_Byte_Array(numpy.fromstring(arr[:byte_length], dtype=TAG_Byte_Array.dtype, count=length))
+    if ctx.owner is not None:
+        return numpy.frombuffer(ctx.owner, dtype=dtype, count=length, offset=offset)
+    return numpy.fromstring(arr[:byte_length], dtype=dtype, count=length)
 
-cdef TAG_Short_Array load_short_array(load_ctx ctx):
-    cdef int * ptr = <int *> read(ctx, 4)
-    cdef int length = ptr[0]
-    swab(&length, 4)
+cdef TAG_Byte_Array load_byte_array(load_ctx ctx):
+    return TAG_Byte_Array(load_array_value(ctx, TAG_Byte_Array.dtype))
 
-    byte_length = length * 2
-    cdef char *arr = read(ctx, byte_length)
+cdef TAG_Short_Array load_short_array(load_ctx ctx):
     dtype = '>u2' if _BIG_ENDIAN else '<u2'
-    return TAG_Short_Array(numpy.fromstring(arr[:byte_length], dtype=numpy.dtype(dtype), count=length))
+    return TAG_Short_Array(load_array_value(ctx, numpy.dtype(dtype)))
 
 cdef TAG_Int_Array load_int_array(load_ctx ctx):
-    cdef int * ptr = <int *> read(ctx, 4)
-    cdef int length = ptr[0]
-    swab(&length, 4)
-
-    byte_length = length * 4
-    cdef char *arr = read(ctx, byte_length)
     dtype = '>u4' if _BIG_ENDIAN else '<u4'
-    return TAG_Int_Array(numpy.fromstring(arr[:byte_length], dtype=numpy.dtype(dtype), count=length))
+    return TAG_Int_Array(load_array_value(ctx, numpy.dtype(dtype)))
 
 cdef TAG_Long_Array load_long_array(load_ctx ctx):
-    cdef int * ptr = <int *> read(ctx, 4)
-    cdef int length = ptr[0]
-    swab(&length, 4)
-
-    byte_length = length * 8
-    cdef char *arr = read(ctx, byte_length)
     dtype = '>q' if _BIG_ENDIAN else '<q'
-    return TAG_Long_Array(numpy.fromstring(arr[:byte_length], dtype=numpy.dtype(dtype), count=length))
+    return TAG_Long_Array(load_array_value(ctx, numpy.dtype(dtype)))
 
 
 
 
 # --- Identify tag type and load tag ---
 
-cdef load_tag(char tagID, load_ctx ctx):
+cdef load_tag(char tagID, load_ctx ctx, dict selection=None):
     if tagID == _ID_BYTE:
         return load_byte(ctx)
 
@@ -857,10 +907,10 @@ cdef load_tag(char tagID, load_ctx ctx):
         return TAG_String(load_string(ctx))
 
     if tagID == _ID_LIST:
-        return load_list(ctx)
+        return load_list(ctx, selection)
 
     if tagID == _ID_COMPOUND:
-        return load_compound(ctx)
+        return load_compound(ctx, selection)
 
     if tagID == _ID_INT_ARRAY:
         return load_int_array(ctx)
@@ -872,6 +922,86 @@ cdef load_tag(char tagID, load_ctx ctx):
         return load_short_array(ctx)
 
 
+# --- Skip tags not selected by load's paths ---
+
+cdef int fixed_size(char tagID):
+    if tagID == _ID_BYTE:
+        return 1
+    if tagID == _ID_SHORT:
+        return 2
+    if tagID == _ID_INT or tagID == _ID_FLOAT:
+        return 4
+    if tagID == _ID_LONG or tagID == _ID_DOUBLE:
+        return 8
+    return -1
+
+cdef int array_item_size(char tagID):
+    if tagID == _ID_BYTE_ARRAY:
+        return 1
+    if tagID == _ID_SHORT_ARRAY:
+        return 2
+    if tagID == _ID_INT_ARRAY:
+        return 4
+    if tagID == _ID_LONG_ARRAY:
+        return 8
+    return -1
+
+cdef unsigned int read_length(load_ctx ctx) except? 0:
+    cdef int * ptr = <int *> read(ctx, 4)
+    cdef int length = ptr[0]
+    swab(&length, 4)
+    if length < 0:
+        return 0
+    return length
+
+cdef int skip_tag(char tagID, load_ctx ctx) except -1:
+    cdef unsigned short * name_length
+    cdef unsigned short length
+    cdef char list_type
+    cdef unsigned int i, count
+    cdef int size = fixed_size(tagID)
+    if size > 0:
+        read(ctx, size)
+        return 0
+
+    size = array_item_size(tagID)
+    if size > 0:
+        count = read_length(ctx)
+        read(ctx, <size_t>count * size)
+        return 0
+
+    if tagID == _ID_STRING:
+        name_length = <unsigned short *> read(ctx, 2)
+        length = name_length[0]
+        swab(&length, 2)
+        read(ctx, length)
+        return 0
+
+    if tagID == _ID_LIST:
+        list_type = read(ctx, 1)[0]
+        count = read_length(ctx)
+        size = fixed_size(list_type)
+        if size > 0:
+            read(ctx, <size_t>count * size)
+        else:
+            for i in range(count):
+                skip_tag(list_type, ctx)
+        return 0
+
+    if tagID == _ID_COMPOUND:
+        while True:
+            tagID = read(ctx, 1)[0]
+            if tagID == _ID_END:
+                return 0
+            name_length = <unsigned short *> read(ctx, 2)
+            length = name_length[0]
+            swab(&length, 2)
+            read(ctx, length)
+            skip_tag(tagID, ctx)
+
+    raise NBTFormatError("Unknown tag type {0} at offset {1}".format(tagID, ctx.offset))
+
+
 def hexdump(src, length=8):
     FILTER=''.join([(len(repr(chr(x)))==3) and chr(x) or '.' for x in xrange(256)])
     N=0
@@ -885,16 +1015,37 @@ def hexdump(src, length=8):
     return result
 
 
-cdef void cwrite(obj, char *buf, size_t len):
-    #print "cwrite %s %s %d" % (map(ord, buf[:min(4, len)]), buf[:min(4, len)].decode('ascii', 'replace'), len)
-    PycStringIO.cwrite(obj, buf, len)
+# Output stream, collects small writes in a buffer and passes them to a write function in pieces.
+
+cdef class save_ctx:
+    cdef object write
+    cdef char buffer[SAVE_BUFFER_SIZE]
+    cdef size_t size
+
+
+cdef int flush(save_ctx ctx) except -1:
+    if ctx.size:
+        ctx.write(PyString_FromStringAndSize(ctx.buffer, ctx.size))
+        ctx.size = 0
+    return 0
+
+
+cdef int cwrite(save_ctx ctx, char *buf, size_t len) except -1:
+    if ctx.size + len > SAVE_BUFFER_SIZE:
+        flush(ctx)
+        if len > SAVE_BUFFER_SIZE:
+            ctx.write(PyString_FromStringAndSize(buf, len))
+            return 0
+    memcpy(ctx.buffer + ctx.size, buf, len)
+    ctx.size += len
+    return 0
 
 
-cdef void save_tag_id(char tagID, object buf):
+cdef void save_tag_id(char tagID, save_ctx buf) except *:
     cwrite(buf, &tagID, 1)
 
 
-cdef save_tag_name(TAG_Value tag, object buf):
+cdef save_tag_name(TAG_Value tag, save_ctx buf):
     IF UNICODE_NAMES:
         cdef unicode name = tag.name
         save_string(name.encode('utf-8'), buf)
@@ -902,7 +1053,7 @@ cdef save_tag_name(TAG_Value tag, object buf):
         save_string(tag.name, buf)
 
 
-cdef void save_string(bytes value, object buf):
+cdef void save_string(bytes value, save_ctx buf) except *:
     cdef short length = <short>len(value)
     cdef char * s = value
     swab(&length, 2)
@@ -910,45 +1061,51 @@ cdef void save_string(bytes value, object buf):
     cwrite(buf, s, len(value))
 
 
-cdef void save_array(object value, object buf, char size):
-    value = value.tostring()
-    cdef char * s = value
-    cdef int length = <int>len(value) / size
+cdef void save_array(object value, save_ctx buf, char size) except *:
+    value = numpy.ascontiguousarray(value)
+    cdef int length = <int>value.nbytes / size
     swab(&length, 4)
     cwrite(buf, <char *> &length, 4)
-    cwrite(buf, s, len(value))
+    if value.nbytes >= SAVE_ARRAY_DIRECT:
+        flush(buf)
+        buf.write(buffer(value))
+        return
+
+    data = value.tostring()
+    cdef char * s = data
+    cwrite(buf, s, len(data))
 
 
-cdef void save_byte(char value, object buf):
+cdef void save_byte(char value, save_ctx buf) except *:
     cwrite(buf, <char *> &value, 1)
 
 
-cdef void save_short(short value, object buf):
+cdef void save_short(short value, save_ctx buf) except *:
     swab(&value, 2)
     cwrite(buf, <char *> &value, 2)
 
 
-cdef void save_int(int value, object buf):
+cdef void save_int(int value, save_ctx buf) except *:
     swab(&value, 4)
     cwrite(buf, <char *> &value, 4)
 
 
-cdef void save_long(long long value, object buf):
+cdef void save_long(long long value, save_ctx buf) except *:
     swab(&value, 8)
     cwrite(buf, <char *> &value, 8)
 
 
-cdef void save_float(float value, object buf):
+cdef void save_float(float value, save_ctx buf) except *:
     swab(&value, 4)
     cwrite(buf, <char *> &value, 4)
 
 
-cdef void save_double(double value, object buf):
+cdef void save_double(double value, save_ctx buf) except *:
     swab(&value, 8)
     cwrite(buf, <char *> &value, 8)
 
 
-cdef void save_tag_value(TAG_Value tag, object buf):
+cdef void save_tag_value(TAG_Value tag, save_ctx buf) except *:
     cdef char tagID = tag.tagID
     if tagID == _ID_BYTE:
         (<TAG_Byte> tag).save_value(buf)
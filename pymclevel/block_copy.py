@@ -8,6 +8,7 @@ from box import BoundingBox
 from mclevelbase import exhaust
 import materials
 from entity import Entity, TileEntity
+from level import lightChangedMask
 from copy import deepcopy
 
 
@@ -91,6 +92,8 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
                 continue
 
         destChunk = destLevel.getChunk(*destCpos)
+        # blocks whose light absorption or emission changed, so copying decorative blocks doesn't relight the chunk
+        lightChanged = numpy.zeros(destChunk.Blocks.shape, dtype='bool')
 
         i += 1
         yield (i, chunkCount)
@@ -118,7 +121,10 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
             mask = sourceMask(sourceBlocks)
             convertedSourceBlocks, convertedSourceData = convertBlocks(destLevel, sourceLevel, sourceBlocks, sourceData)
 
-            destChunk.Blocks[destSlices][mask] = convertedSourceBlocks[mask]
+            destBlocks = destChunk.Blocks[destSlices]
+            lightChanged[destSlices][mask] = lightChangedMask(destLevel.materials, destBlocks[mask],
+                                                              convertedSourceBlocks[mask])
+            destBlocks[mask] = convertedSourceBlocks[mask]
             if convertedSourceData is not None:
                 destChunk.Data[destSlices][mask] = convertedSourceData[mask]
 
@@ -160,7 +166,7 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
             if biomes and hasattr(destChunk, 'Biomes') and hasattr(sourceChunk, 'Biomes'):
                 destChunk.Biomes[destSlices[:2]] = sourceChunk.Biomes[sourceSlices[:2]]
 
-        destChunk.chunkChanged()
+        destChunk.blocksChanged((slice(None), slice(None), slice(None)), lightChanged)
 
     log.info("Duration: {0}".format(datetime.now() - startTime))
     log.info("Copied {0} entities and {1} tile entities and {2} tile ticks".format(e, t, tt))
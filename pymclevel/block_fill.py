@@ -9,6 +9,7 @@ from mclevelbase import exhaust
 import blockrotation
 from box import BoundingBox
 from entity import TileEntity
+from level import lightChangedMask
 
 
 def blockReplaceTable(blocksToReplace):
@@ -78,10 +79,15 @@ def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
         data = chunk.Data[slices]
         mask = slice(None)
 
-        needsLighting = changesLighting
+        # only the blocks whose light absorption or emission changes need relighting
+        if changesLighting:
+            changed = lightChangedMask(level.materials, blocks, blockInfo.ID)
+        else:
+            changed = numpy.zeros(blocks.shape, dtype='bool')
 
         if blocktable is not None:
             mask = blocktable[blocks, data]
+            changed &= mask
 
             blockCount = mask.sum()
             replaced += blockCount
@@ -93,7 +99,6 @@ def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
                     data[mask] = blockInfo.blockData
             else:
                 skipped += 1
-                needsLighting = False
 
             def include(tileEntity):
                 p = TileEntity.pos(tileEntity)
@@ -116,7 +121,7 @@ def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
             chunk.addTileEntity(tileEntityObject)
             blocksList.remove(tileEntityObject)
 
-        chunk.chunkChanged(needsLighting)
+        chunk.blocksChanged(slices, changed)
 
     if len(blocksToReplace):
         log.info(u"Replace: Skipped {0} chunks, replaced {1} blocks".format(skipped, replaced))
@@ -0,0 +1,243 @@
+"""
+An index of the entities and tile entities in each chunk of a world, kept in the world folder next to the region files.
+
+For each chunk saved in the world folder, the index remembers the ids of its entities and tile entities, and the values
+of a few string fields of them, like the ids of the items in a chest. Searches for ids or field values then only load
+the chunks that may match.
+
+Each entry also remembers the chunk's offset and timestamp from its region file header, which change whenever the
+chunk is written by MCEdit or by the game. Entries that no longer match are found again by reading the chunk. Chunks
+that were edited but not saved yet are always included in search results.
+"""
+
+import logging
+import os
+
+from mclevelbase import ChunkMalformed, ChunkNotPresent, exhaust
+import nbt
+
+log = logging.getLogger(__name__)
+
+_separator = u"\n"
+
+
+def _fieldValues(tag, path):
+    # the values found by following the names in path through compounds and lists of compounds
+    for i, name in enumerate(path):
+        if isinstance(tag, nbt.TAG_List):
+            for item in tag:
+                for value in _fieldValues(item, path[i:]):
+                    yield value
+            return
+        if not isinstance(tag, nbt.TAG_Compound) or name not in tag:
+            return
+        tag = tag[name]
+
+    if isinstance(tag, nbt.TAG_List):
+        for item in tag:
+            yield unicode(item.value)
+    elif not isinstance(tag, nbt.TAG_Compound):
+        yield unicode(tag.value)
+
+
+def chunkKeys(levelTag, fields=()):
+    """ Returns the set of keys for the entities and tile entities in a chunk's Level tag. Keys are (kind, id) and
+    (kind, id, field, value) tuples, where kind is "Entities" or "TileEntities". fields are names of string tags,
+    with dots between the names of the compounds or lists of compounds holding them, like "Items.id". """
+    keys = set()
+    for kind in ("Entities", "TileEntities"):
+        if kind not in levelTag:
+            continue
+        for tag in levelTag[kind]:
+            if "id" not in tag:
+                continue
+            id = unicode(tag["id"].value)
+            keys.add((kind, id))
+            for field in fields:
+                for value in _fieldValues(tag, field.split(".")):
+                    keys.add((kind, id, field, value))
+    return keys
+
+
+class EntityIndex(object):
+    """ The entity and tile entity index of an MCInfdevOldLevel's world folder. Use MCInfdevOldLevel.getEntityIndex
+    to get one. """
+
+    fileName = "##MCEDIT.ENTITYINDEX##.dat"
+    version = 1
+    _paths = ["Level/Entities", "Level/TileEntities"]  # the only tags read from chunks being indexed
+
+    def __init__(self, level, fields=()):
+        self.level = level
+        self.fields = tuple(fields)
+        self._entries = None  # maps (cx, cz) to [offset, timestamp, keys]
+        self._dirty = False
+        self._evictedKeys = {}  # maps (cx, cz) to the keys of chunks written to the work folder
+        self.chunksRead = 0  # chunks read from the world folder because their entries were missing or stale
+
+    @property
+    def path(self):
+        return self.level.worldFolder.getFilePath(self.fileName)
+
+    def _getEntries(self):
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+        path = self.path
+        if os.path.exists(path):
+            try:
+                indexTag = nbt.load(path)
+                if (indexTag["Version"].value == self.version and
+                        tuple(t.value for t in indexTag["Fields"]) == self.fields):
+                    for chunkTag in indexTag["Chunks"]:
+                        keys = frozenset(tuple(t.value.split(_separator)) for t in chunkTag["Keys"])
+                        self._entries[chunkTag["X"].value, chunkTag["Z"].value] = [
+                            chunkTag["Offset"].value, chunkTag["Time"].value, keys]
+            except Exception as e:
+                log.warning(u"Ignoring unreadable entity index {0}: {1!r}".format(path, e))
+                self._entries = {}
+
+        return self._entries
+
+    def save(self):
+        """ Writes the index if it has changed since it was read """
+        if not self._dirty or self.level.readonly:
+            return
+
+        chunksTag = nbt.TAG_List()
+        for (cx, cz), (offset, timestamp, keys) in sorted(self._entries.iteritems()):
+            chunkTag = nbt.TAG_Compound()
+            chunkTag["X"] = nbt.TAG_Int(cx)
+            chunkTag["Z"] = nbt.TAG_Int(cz)
+            chunkTag["Offset"] = nbt.TAG_Long(offset)
+            chunkTag["Time"] = nbt.TAG_Long(timestamp)
+            chunkTag["Keys"] = nbt.TAG_List([nbt.TAG_String(_separator.join(key)) for key in sorted(keys)],
+                                            list_type=nbt.TAG_STRING)
+            chunksTag.append(chunkTag)
+
+        indexTag = nbt.TAG_Compound()
+        indexTag["Version"] = nbt.TAG_Int(self.version)
+        indexTag["Fields"] = nbt.TAG_List([nbt.TAG_String(field) for field in self.fields], list_type=nbt.TAG_STRING)
+        indexTag["Chunks"] = chunksTag
+        try:
+            indexTag.save(self.path)
+            self._dirty = False
+        except (IOError, OSError) as e:
+            log.warning(u"Could not save the entity index for {0}: {1!r}".format(self.level.filename, e))
+
+    def _stamp(self, cx, cz, stamps):
+        offsets, timestamps = stamps
+        i = (cx & 0x1f) + (cz & 0x1f) * 32
+        return int(offsets[i]), int(timestamps[i])
+
+    def _update(self, cx, cz, stamps, keys):
+        offset, timestamp = self._stamp(cx, cz, stamps)
+        self._getEntries()[cx, cz] = [offset, timestamp, frozenset(keys)]
+        self._dirty = True
+
+    def unsavedChunks(self):
+        """ Returns the positions of the chunks whose entities may differ from the world folder """
+        level = self.level
+        chunks = set(cPos for cPos, chunkData in level._loadedChunkData.iteritems() if chunkData.dirty)
+        chunks.update(level._writeBehind.pending)
+        if not level.readonly:
+            chunks.update(level.unsavedWorkFolder.listChunks())
+        return chunks
+
+    def refreshIter(self):
+        """ Reads the chunks of the world folder that are missing from the index or changed since they were indexed.
+        Yields (done, total) progress tuples. """
+        worldFolder = self.level.worldFolder
+        entries = self._getEntries()
+
+        regions = {}
+        for cx, cz in worldFolder.listChunks():
+            regions.setdefault((cx >> 5, cz >> 5), []).append((cx, cz))
+
+        present = set()
+        stale = []
+        for (rx, rz), positions in regions.iteritems():
+            stamps = worldFolder.chunkStamps(rx, rz)
+            for cx, cz in positions:
+                present.add((cx, cz))
+                entry = entries.get((cx, cz))
+                if entry is None or self._stamp(cx, cz, stamps) != tuple(entry[:2]):
+                    stale.append((cx, cz, stamps))
+
+        for cPos in set(entries) - present:
+            del entries[cPos]
+            self._dirty = True
+
+        for i, (cx, cz, stamps) in enumerate(stale):
+            try:
+                levelTag = nbt.load(buf=worldFolder.readChunk(cx, cz), paths=self._paths)["Level"]
+            except (ChunkNotPresent, ChunkMalformed, nbt.NBTFormatError, KeyError) as e:
+                log.warning(u"Skipping chunk {0} while indexing entities: {1!r}".format((cx, cz), e))
+                entries.pop((cx, cz), None)
+                continue
+            self._update(cx, cz, stamps, chunkKeys(levelTag, self.fields))
+            self.chunksRead += 1
+            yield i + 1, len(stale)
+
+        if stale:
+            log.info(u"Indexed the entities of {0} chunks".format(len(stale)))
+        self.save()
+
+    def refresh(self):
+        return exhaust(self.refreshIter())
+
+    def findChunks(self, kind, ids=None, field=None, values=None):
+        """ Returns the positions of the chunks that may have an entity of the given kind, "Entities" or
+        "TileEntities", whose id is in ids, or any id if ids is None. If field is one of the index's fields, the entity
+        must also have one of the values in that field. The chunks that were changed and not saved yet are always
+        returned. """
+        self.refresh()
+        if ids is not None:
+            ids = set(unicode(id) for id in ids)
+        if field not in self.fields:
+            field = None
+        if field is not None:
+            values = set(unicode(value) for value in values)
+
+        def matches(key):
+            if key[0] != kind or (ids is not None and key[1] not in ids):
+                return False
+            if field is None:
+                return len(key) == 2
+            return len(key) == 4 and key[2] == field and key[3] in values
+
+        chunks = self.unsavedChunks()
+        chunks.update(cPos for cPos, (offset, timestamp, keys) in self._entries.iteritems()
+                      if any(matches(key) for key in keys))
+        return sorted(chunks)
+
+    def ids(self, kind):
+        """ Returns the set of ids of the given kind, "Entities" or "TileEntities", found in the index. Chunks changed
+        and not saved yet are not included. """
+        self.refresh()
+        return set(key[1] for offset, timestamp, keys in self._entries.itervalues() for key in keys
+                   if key[0] == kind)
+
+    # --- Called by the level ---
+
+    def chunkEvicted(self, chunkData):
+        """ Remembers the keys of a dirty chunk written to the level's work folder """
+        self._evictedKeys[chunkData.chunkPosition] = chunkKeys(chunkData.root_tag["Level"], self.fields)
+
+    def chunksSaved(self, chunks):
+        """ Updates the entries of chunks just saved to the world folder. chunks holds (cx, cz, chunkData) tuples,
+        with chunkData None for the chunks copied from the work folder. """
+        self._getEntries()
+        worldFolder = self.level.worldFolder
+        for cx, cz, chunkData in chunks:
+            if chunkData is not None:
+                keys = chunkKeys(chunkData.root_tag["Level"], self.fields)
+            else:
+                keys = self._evictedKeys.pop((cx, cz), None)
+            if keys is None:
+                # read again the next time the index is used
+                if self._entries.pop((cx, cz), None) is not None:
+                    self._dirty = True
+                continue
+            self._update(cx, cz, worldFolder.chunkStamps(cx >> 5, cz >> 5), keys)
@@ -9,10 +9,13 @@ from datetime import datetime
 import itertools
 from logging import getLogger
 from math import floor
+from multiprocessing.pool import ThreadPool
 import os
+import Queue
 import random
 import shutil
 import struct
+import threading
 import time
 import traceback
 import weakref
@@ -21,12 +24,14 @@ import sys
 
 from box import BoundingBox
 from entity import Entity, TileEntity, TileTick
+from entityindex import EntityIndex
 from faces import FaceXDecreasing, FaceXIncreasing, FaceZDecreasing, FaceZIncreasing
 from level import LightedChunk, EntityLevel, computeChunkHeightMap, MCLevel, ChunkBase, GAME_PLATFORM_JAVA
+import lighting
 import materials
 from mclevelbase import ChunkMalformed, ChunkNotPresent, ChunkAccessDenied,ChunkConcurrentException,exhaust, PlayerNotFound
 import nbt
-from numpy import array, clip, maximum, zeros, asarray, unpackbits, arange
+from numpy import array, clip, concatenate, flatnonzero, fromstring, maximum, packbits, zeros, asarray, unpackbits, arange, ndarray
 from regionfile import MCRegionFile
 import logging
 from uuid import UUID
@@ -99,6 +104,40 @@ def sanitizeBlocks(chunk):
         chunk.Blocks[:, :, 1:][badsnow] = chunk.materials.Air.ID
 
 
+def _copyArrayViews(tag):
+    """ Replaces the values of the array tags in tag that are views into a loaded buffer with copies of their own """
+    value = tag.value
+    if isinstance(value, list):
+        for child in value:
+            _copyArrayViews(child)
+    elif isinstance(value, ndarray) and not value.flags.owndata:
+        tag.value = value.copy()
+
+
+class _SectionArray(object):
+    """
+    One of AnvilChunkData's block or light arrays. The array is decoded from the chunk's sections the first time it
+    is used and stored in the instance's __dict__, where it hides this descriptor from then on. Until then, no array is
+    allocated at all.
+    """
+
+    def __init__(self, name, dtype, fill=0):
+        self.name = name
+        self.dtype = dtype
+        self.fill = fill
+
+    def __get__(self, chunkData, owner):
+        if chunkData is None:
+            return self
+        arr = chunkData._decodeSections(self.name, self.dtype, self.fill)
+        chunkData.__dict__[self.name] = arr
+        if all(name in chunkData.__dict__ for name in chunkData.sectionArrayNames):
+            # every array is decoded, so the sections are no longer needed
+            chunkData._sections = {}
+        chunkData._resized()
+        return arr
+
+
 class AnvilChunkData(object):
     """ This is the chunk data backing an AnvilChunk. Chunk data is retained by the MCInfdevOldLevel until its
     AnvilChunk is no longer used, then it is either cached in memory, discarded, or written to disk according to
@@ -109,17 +148,24 @@ class AnvilChunkData(object):
      not keep references to a whole lot of chunks or else it will run out of memory.
     """
 
-    def __init__(self, world, chunkPosition, root_tag=None, create=False):
+    # The block and light arrays are only allocated when they are first used. Until then, the chunk keeps the Sections
+    # it was loaded with in _sections, and savedTagData saves them again as they are if none of the arrays were used.
+    Blocks = _SectionArray("Blocks", 'uint16')
+    Data = _SectionArray("Data", 'uint8')
+    BlockLight = _SectionArray("BlockLight", 'uint8')
+    SkyLight = _SectionArray("SkyLight", 'uint8', 15)
+
+    sectionArrayNames = ("Blocks", "Data", "BlockLight", "SkyLight")
+
+    def __init__(self, world, chunkPosition, root_tag=None, create=False, bufferSize=0):
+        """ If root_tag was loaded with views, bufferSize is the size of the buffer its arrays view. """
         self.chunkPosition = chunkPosition
         self.world = world
         self.root_tag = root_tag
         self.dirty = False
-
-        self.Blocks = zeros((16, 16, world.Height), 'uint16')
-        self.Data = zeros((16, 16, world.Height), 'uint8')
-        self.BlockLight = zeros((16, 16, world.Height), 'uint8')
-        self.SkyLight = zeros((16, 16, world.Height), 'uint8')
-        self.SkyLight[:] = 15
+        self._sections = {}  # maps section Y to the section's TAG_Compound
+        self._sectionPieces = {}  # maps (array name, section Y) to single decoded sections, see readOnlyArray
+        self._bufferSize = bufferSize
 
         if create:
             self._create()
@@ -166,41 +212,118 @@ class AnvilChunkData(object):
         self.root_tag = root_tag
 
         for sec in self.root_tag["Level"].pop("Sections", []):
-            y = sec["Y"].value * 16
-
-            values_to_get = ["SkyLight", "BlockLight"]
-            if "Blocks" in sec and "Data" in sec:
-                values_to_get.extend(["Blocks", "Data"])
+            if "Blocks" not in sec or "Data" not in sec:
+                self._get_blocks_and_data_from_blockstates(sec)
+
+            self._sections[sec["Y"].value] = sec
+
+        # only the sections may keep the loaded buffer alive, so it is freed once they are all decoded
+        _copyArrayViews(self.root_tag)
+
+    def _decodeSections(self, name, dtype, fill):
+        arr = zeros((16, 16, self.world.Height), dtype)
+        if fill:
+            arr[:] = fill
+
+        for secY, sec in self._sections.iteritems():
+            y = secY * 16
+            piece = self._sectionPieces.get((name, secY))
+            if piece is None:
+                piece = self._decodeSection(name, sec)
+            arr[..., y:y + 16] = piece
+
+        for key in [key for key in self._sectionPieces if key[0] == name]:
+            del self._sectionPieces[key]
+        return arr
+
+    def _decodeSection(self, name, sec):
+        """ Returns the named array of one section, indexed [x,z,y] """
+        secarray = sec[name].value
+        if name == "Blocks":
+            secarray = array(secarray.reshape((16, 16, 16)), 'uint16')
+            tag = sec.get("Add")
+            if tag is not None:
+                add = unpackNibbleArray(tag.value.reshape((16, 16, 8)))
+                secarray |= array(add, 'uint16') << 8
+        else:
+            secarray = unpackNibbleArray(secarray.reshape((16, 16, 8)))
+
+        return secarray.swapaxes(0, 2)
+
+    def _sectionPiece(self, name, secY):
+        """ Returns one section of the named array without decoding the rest. Pieces are kept until the whole array is
+        decoded. """
+        piece = self._sectionPieces.get((name, secY))
+        if piece is None:
+            sec = self._sections.get(secY)
+            if sec is None:
+                arrayType = getattr(type(self), name)
+                piece = zeros((16, 16, 16), arrayType.dtype)
+                piece[:] = arrayType.fill
             else:
-                Blocks, Data = self._get_blocks_and_data_from_blockstates(sec)
-                self.Blocks[..., y:y + 16], self.Data[..., y:y + 16] = Blocks, Data
-
-            for name in values_to_get:
-                arr = getattr(self, name)
-                secarray = sec[name].value
-                if name == "Blocks":
-                    secarray.shape = (16, 16, 16)
-                else:
-                    secarray.shape = (16, 16, 8)
-                    secarray = unpackNibbleArray(secarray)
+                piece = self._decodeSection(name, sec)
+            piece.flags.writeable = False
+            self._sectionPieces[name, secY] = piece
+            self._resized()
+        return piece
+
+    def _resized(self):
+        resized = getattr(self.world, "_chunkDataResized", None)
+        if resized is not None:
+            resized(self)
+
+    def isDecoded(self, name):
+        """ Returns True if the named block or light array has been used and is held in memory """
+        return name in self.__dict__
+
+    def readOnlyArray(self, name, slices):
+        """
+        Returns the named array indexed by the (x, z, y) slices, decoding only the sections the y slice covers if the
+        whole array has not been decoded yet. In that case the result is a read-only copy.
+        """
+        if self.isDecoded(name):
+            return self.__dict__[name][slices]
 
-                arr[..., y:y + 16] = secarray.swapaxes(0, 2)
+        xSlice, zSlice, ySlice = slices
+        miny, maxy, step = ySlice.indices(self.world.Height)
+        if step != 1 or maxy <= miny:
+            return getattr(self, name)[slices]
 
-            tag = sec.get("Add")
-            if tag is not None:
-                tag.value.shape = (16, 16, 8)
-                add = unpackNibbleArray(tag.value)
-                self.Blocks[..., y:y + 16] |= (array(add, 'uint16') << 8).swapaxes(0, 2)
+        pieces = [self._sectionPiece(name, secY) for secY in xrange(miny >> 4, ((maxy - 1) >> 4) + 1)]
+        result = concatenate(pieces, axis=2)[xSlice, zSlice, miny & 0xf:(miny & 0xf) + maxy - miny]
+        result.flags.writeable = False
+        return result
+
+    def arrayValueAt(self, name, x, z, y):
+        """ Returns one value of the named array, decoding only the section that contains it """
+        if self.isDecoded(name):
+            return self.__dict__[name][x, z, y]
+        return self._sectionPiece(name, y >> 4)[x, z, y & 0xf]
 
     def savedTagData(self):
         """ does not recalculate any data or light """
+        return self._saveTag(lambda root_tag: root_tag.save(compressed=False))
+
+    def compressedTagData(self, compressMode, compressLevel):
+        """ Returns the saved data compressed for a region file. Deflated data is compressed while the tags are
+        serialized, so the uncompressed data is never held in memory at once. """
+        if compressMode == MCRegionFile.VERSION_DEFLATE:
+            return self._saveTag(lambda root_tag: root_tag.save_deflated(compressLevel))
+        return MCRegionFile.compressWith(self.savedTagData(), compressMode, compressLevel)
 
+    def _saveTag(self, save):
         log.debug(u"Saving chunk: {0}".format(self))
         # pcm1k - this should either be removed or be optional
 #        sanitizeBlocks(self)
 
         sections = nbt.TAG_List()
         append = sections.append
+        if not any(self.isDecoded(name) for name in self.sectionArrayNames):
+            # none of the arrays were used, so the sections are unchanged
+            for secY in sorted(self._sections):
+                append(self._sections[secY])
+            return self._saveWithSections(sections, save)
+
         for y in xrange(0, self.world.Height, 16):
             section = nbt.TAG_Compound()
 
@@ -230,13 +353,33 @@ class AnvilChunkData(object):
             section["Y"] = nbt.TAG_Byte(y / 16)
             append(section)
 
+        return self._saveWithSections(sections, save)
+
+    def _saveWithSections(self, sections, save):
         self.root_tag["Level"]["Sections"] = sections
-        data = self.root_tag.save(compressed=False)
-        del self.root_tag["Level"]["Sections"]
+        try:
+            data = save(self.root_tag)
+        finally:
+            del self.root_tag["Level"]["Sections"]
 
         log.debug(u"Saved chunk {0}".format(self))
         return data
 
+    def memoryUsage(self):
+        """ Returns an estimate of the number of bytes used by this chunk's block and light arrays, counting the packed
+        sections for arrays that have not been decoded. Sections loaded as views count the whole buffer they view. """
+        usage = sum(piece.nbytes for piece in self._sectionPieces.itervalues())
+        sectionsInBuffer = bool(self._sections and self._bufferSize)
+        if sectionsInBuffer:
+            usage += self._bufferSize
+        for name in self.sectionArrayNames:
+            arr = self.__dict__.get(name)
+            if arr is not None:
+                usage += arr.nbytes
+            elif not sectionsInBuffer:
+                usage += sum(sec[name].value.nbytes for sec in self._sections.itervalues())
+        return usage
+
     @property
     def materials(self):
         return self.world.materials
@@ -270,9 +413,23 @@ class AnvilChunk(LightedChunk):
     @needsLighting.setter
     def needsLighting(self, value):
         if value:
+            if not self.needsLighting:
+                self.world.chunkLightChanges.pop(self.chunkPosition, None)
             self.world.chunksNeedingLighting.add(self.chunkPosition)
         else:
             self.world.chunksNeedingLighting.discard(self.chunkPosition)
+            self.world.chunkLightChanges.pop(self.chunkPosition, None)
+
+    @property
+    def lightChanges(self):
+        return self.world.chunkLightChanges.get(self.chunkPosition)
+
+    @lightChanges.setter
+    def lightChanges(self, value):
+        if value is None:
+            self.world.chunkLightChanges.pop(self.chunkPosition, None)
+        else:
+            self.world.chunkLightChanges[self.chunkPosition] = value
 
     def generateHeightMap(self):
         computeChunkHeightMap(self.materials, self.Blocks, self.HeightMap)
@@ -309,6 +466,12 @@ class AnvilChunk(LightedChunk):
 
     # --- AnvilChunkData accessors ---
 
+    def readOnlyArray(self, name, slices):
+        return self.chunkData.readOnlyArray(name, slices)
+
+    def arrayValueAt(self, name, x, z, y):
+        return self.chunkData.arrayValueAt(name, x, z, y)
+
     @property
     def root_tag(self):
         return self.chunkData.root_tag
@@ -445,7 +608,7 @@ class ChunkedLevelMixin(MCLevel):
         zInChunk = z & 0xf
         ch = self.getChunk(xc, zc)
 
-        return ch.BlockLight[xInChunk, zInChunk, y]
+        return ch.arrayValueAt("BlockLight", xInChunk, zInChunk, y)
 
     def setBlockLightAt(self, x, y, z, newLight):
         '''
@@ -500,7 +663,7 @@ class ChunkedLevelMixin(MCLevel):
         except ChunkNotPresent:
             return 0
 
-        return ch.Data[xInChunk, zInChunk, y]
+        return ch.arrayValueAt("Data", xInChunk, zInChunk, y)
 
     def setBlockDataAt(self, x, y, z, newdata):
         '''
@@ -533,6 +696,7 @@ class ChunkedLevelMixin(MCLevel):
         ch.Data[xInChunk, zInChunk, y] = newdata
         ch.dirty = True
         ch.needsLighting = True
+        ch.lightChanges = None
 
     def blockAt(self, x, y, z):
         """returns 0 for blocks outside the loadable chunks.  automatically loads chunks."""
@@ -550,7 +714,7 @@ class ChunkedLevelMixin(MCLevel):
             return 0
         if y >= ch.Height:
             return 0
-        return ch.Blocks[xInChunk, zInChunk, y]
+        return ch.arrayValueAt("Blocks", xInChunk, zInChunk, y)
 
     def setBlockAt(self, x, y, z, blockID):
         """returns 0 for blocks outside the loadable chunks.  automatically loads chunks."""
@@ -570,6 +734,7 @@ class ChunkedLevelMixin(MCLevel):
         ch.Blocks[xInChunk, zInChunk, y] = blockID
         ch.dirty = True
         ch.needsLighting = True
+        ch.lightChanges = None
 
     def skylightAt(self, x, y, z):
 
@@ -583,7 +748,7 @@ class ChunkedLevelMixin(MCLevel):
 
         ch = self.getChunk(xc, zc)
 
-        return ch.SkyLight[xInChunk, zInChunk, y]
+        return ch.arrayValueAt("SkyLight", xInChunk, zInChunk, y)
 
     def setSkylightAt(self, x, y, z, lightValue):
         if y < 0 or y >= self.Height:
@@ -606,14 +771,43 @@ class ChunkedLevelMixin(MCLevel):
 
     createChunk = NotImplemented
 
-    def generateLights(self, dirtyChunkPositions=None):
-        return exhaust(self.generateLightsIter(dirtyChunkPositions))
+    # "queue" floods light out from the blocks whose light changed. "sweep" spreads light across every dirty chunk
+    # and its neighbors until nothing changes.
+    lightingMethods = ("queue", "sweep")
+    lightingMethod = "queue"
 
-    def generateLightsIter(self, dirtyChunkPositions=None):
+    # chunks along each side of the tiles lit by each worker process
+    lightingTileSize = 8
+
+    def generateLights(self, dirtyChunkPositions=None, method=None, workers=0):
+        return exhaust(self.generateLightsIter(dirtyChunkPositions, method, workers))
+
+    def prefetchChunks(self, positions):
+        """ Hint that the given chunks will be loaded soon. Levels that can read ahead override this. """
+        pass
+
+    def generateLightsIter(self, dirtyChunkPositions=None, method=None, workers=0):
         """ dirtyChunks may be an iterable yielding (xPos,zPos) tuples
         if none, generate lights for all chunks that need lighting
+
+        method is one of lightingMethods and defaults to lightingMethod. If workers is more than 1, the queue method
+        lights the chunks in that many processes.
         """
 
+        method = method or self.lightingMethod
+        if method == "queue":
+            if workers > 1:
+                lightChunks = lambda chunkPositions: lighting.parallelLightsIter(self, chunkPositions, workers,
+                                                                                 self.lightingTileSize)
+            else:
+                lightChunks = self._queueLightsIter
+        elif method == "sweep":
+            if workers > 1:
+                raise ValueError("Only the queue lighting method can use worker processes")
+            lightChunks = self._generateLightsIter
+        else:
+            raise ValueError("Unknown lighting method {0!r}".format(method))
+
         startTime = datetime.now()
 
         if dirtyChunkPositions is None:
@@ -667,9 +861,10 @@ class ChunkedLevelMixin(MCLevel):
             log.info(u"Batch {0}/{1}".format(i, len(chunkLists)))
 
             dc = sorted(dc)
+            self.prefetchChunks(dc)
             workTotal = sum(estimatedTotals)
             t = 0
-            for c, t, p in self._generateLightsIter(dc):
+            for c, t, p in lightChunks(dc):
                 yield c + workDone, t + workTotal - estimatedTotals[i], p
 
             estimatedTotals[i] = t
@@ -683,6 +878,9 @@ class ChunkedLevelMixin(MCLevel):
 
         return
 
+    def _queueLightsIter(self, dirtyChunkPositions):
+        return lighting.queueLightsIter(self, dirtyChunkPositions)
+
     def _generateLightsIter(self, dirtyChunkPositions):
         la = array(self.materials.lightAbsorption)
         clip(la, 1, 15, la)
@@ -967,6 +1165,26 @@ class AnvilWorldFolder(object):
         self.filename = filename
         self.regionFiles = {}
 
+    # --- Compression ---
+
+    compressMode = MCRegionFile.compressMode
+    compressLevel = MCRegionFile.compressLevel
+
+    def setCompression(self, compressMode, compressLevel):
+        """
+        Sets the codec and zlib level used to save chunks to this folder's region files. Chunks already saved keep
+        their format until they are saved again.
+        """
+        self.compressMode = compressMode
+        self.compressLevel = compressLevel
+        for regionFile in self.regionFiles.itervalues():
+            self._setRegionCompression(regionFile)
+
+    def _setRegionCompression(self, regionFile):
+        regionFile.compressMode = self.compressMode
+        regionFile.compressLevel = self.compressLevel
+        return regionFile
+
     # --- File paths ---
 
     def getFilePath(self, path):
@@ -992,7 +1210,7 @@ class AnvilWorldFolder(object):
         if regionFile:
             return regionFile
         regionFile = MCRegionFile(self.getRegionFilename(rx, rz), (rx, rz))
-        self.regionFiles[rx, rz] = regionFile
+        self.regionFiles[rx, rz] = self._setRegionCompression(regionFile)
         return regionFile
 
     def getRegionForChunk(self, cx, cz):
@@ -1001,15 +1219,132 @@ class AnvilWorldFolder(object):
         return self.getRegionFile(rx, rz)
 
     def closeRegions(self):
+        self.saveChunkIndex()
         for rf in self.regionFiles.values():
             rf.close()
 
         self.regionFiles = {}
 
+    # --- Chunk index ---
+
+    # The chunk index records which chunks each region file contains, along with the region file's modification time
+    # and size when it was read. Regions whose time and size still match are listed without opening them, so
+    # listChunks and containsChunk only need to stat the region files. The index is only written when the folder's
+    # regions are closed or its level is saved, never by a listing.
+
+    chunkIndexName = "##MCEDIT.CHUNKINDEX##.dat"
+    chunkIndexVersion = 1
+
+    useChunkIndex = True  # read the index from disk and write it back
+    writeChunkIndex = True  # False for worlds opened read only
+
+    _chunkIndex = None  # maps (rx, rz) to [mtime, size, chunks]. chunks is a bool array indexed like region offsets.
+    _chunkIndexDirty = False
+
+    def _getChunkIndex(self):
+        if self._chunkIndex is not None:
+            return self._chunkIndex
+
+        self._chunkIndex = {}
+        path = self.getFilePath(self.chunkIndexName)
+        if self.useChunkIndex and os.path.exists(path):
+            try:
+                indexTag = nbt.load(path)
+                if indexTag["Version"].value == self.chunkIndexVersion:
+                    for regionTag in indexTag["Regions"]:
+                        chunks = unpackbits(regionTag["Chunks"].value).astype(bool)
+                        self._chunkIndex[regionTag["X"].value, regionTag["Z"].value] = [
+                            regionTag["MTime"].value, regionTag["Size"].value, chunks]
+            except Exception as e:
+                log.warning(u"Ignoring unreadable chunk index {0}: {1!r}".format(path, e))
+                self._chunkIndex = {}
+
+        return self._chunkIndex
+
+    def saveChunkIndex(self):
+        """ Writes the chunk index if it has changed since it was read """
+        if not (self._chunkIndexDirty and self.useChunkIndex and self.writeChunkIndex):
+            return
+
+        regionsTag = nbt.TAG_List()
+        for (rx, rz), entry in sorted(self._chunkIndex.iteritems()):
+            regionFile = self.regionFiles.get((rx, rz))
+            if regionFile is not None:
+                entry[2] = regionFile.offsets > 0
+            if entry[0] is None:
+                # changed by this folder since it was last checked
+                path = self.getRegionFilename(rx, rz)
+                if not os.path.exists(path):
+                    continue
+                st = os.stat(path)
+                entry[0], entry[1] = st.st_mtime, st.st_size
+
+            regionTag = nbt.TAG_Compound()
+            regionTag["X"] = nbt.TAG_Int(rx)
+            regionTag["Z"] = nbt.TAG_Int(rz)
+            regionTag["MTime"] = nbt.TAG_Double(entry[0])
+            regionTag["Size"] = nbt.TAG_Long(entry[1])
+            regionTag["Chunks"] = nbt.TAG_Byte_Array(packbits(entry[2]))
+            regionsTag.append(regionTag)
+
+        indexTag = nbt.TAG_Compound()
+        indexTag["Version"] = nbt.TAG_Int(self.chunkIndexVersion)
+        indexTag["Regions"] = regionsTag
+        try:
+            indexTag.save(self.getFilePath(self.chunkIndexName))
+            self._chunkIndexDirty = False
+        except (IOError, OSError) as e:
+            log.warning(u"Could not save the chunk index for {0}: {1!r}".format(self.filename, e))
+
+    def _regionChunks(self, rx, rz, path):
+        """ Returns a bool array of the chunks present in the region file at path, indexed like its offsets """
+        index = self._getChunkIndex()
+        entry = index.get((rx, rz))
+        if entry is not None:
+            if entry[0] is None:
+                return entry[2]
+            st = os.stat(path)
+            if entry[0] == st.st_mtime and entry[1] == st.st_size:
+                return entry[2]
+
+        # stat before reading, so a write made after the read leaves the entry stale
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            header = f.read(MCRegionFile.SECTOR_BYTES)
+        header += "\0" * (MCRegionFile.SECTOR_BYTES - len(header))
+        chunks = fromstring(header, '>u4') > 0
+
+        index[rx, rz] = [st.st_mtime, st.st_size, chunks]
+        self._chunkIndexDirty = True
+        return chunks
+
+    def _regionChanged(self, regionFile):
+        # called after this folder writes to a region file
+        self._getChunkIndex()[regionFile.regionCoords] = [None, None, regionFile.offsets > 0]
+        self._chunkIndexDirty = True
+
+    def chunkStamps(self, rx, rz):
+        """ Returns the offsets and timestamps of the chunks in a region file as two arrays indexed like its offsets,
+        or None if the region file does not exist. Both change whenever a chunk is written. """
+        regionFile = self.regionFiles.get((rx, rz))
+        if regionFile is not None:
+            return regionFile.offsets, regionFile.modTimes
+
+        path = self.getRegionFilename(rx, rz)
+        if not os.path.exists(path):
+            return None
+        headerSize = MCRegionFile.SECTOR_BYTES * 2
+        with open(path, "rb") as f:
+            header = f.read(headerSize)
+        header += "\0" * (headerSize - len(header))
+        stamps = fromstring(header, '>u4')
+        return stamps[:MCRegionFile.SECTOR_INTS], stamps[MCRegionFile.SECTOR_INTS:]
+
     # --- Chunks and chunk listing ---
 
     @staticmethod
-    def tryLoadRegionFile(filepath):
+    def parseRegionFilename(filepath):
+        """ Returns (rx, rz) for a region file's path, or None if it is not named like a region file """
         filename = os.path.basename(filepath)
         bits = filename.split('.')
         if len(bits) < 4 or bits[0] != 'r' or bits[3] != "mca":
@@ -1020,7 +1355,15 @@ class AnvilWorldFolder(object):
         except ValueError:
             return None
 
-        return MCRegionFile(filepath, (rx, rz))
+        return rx, rz
+
+    @classmethod
+    def tryLoadRegionFile(cls, filepath):
+        regionCoords = cls.parseRegionFilename(filepath)
+        if regionCoords is None:
+            return None
+
+        return MCRegionFile(filepath, regionCoords)
 
     def findRegionFiles(self):
         regionDir = self.getFolderPath("region", generation=True)
@@ -1031,49 +1374,68 @@ class AnvilWorldFolder(object):
 
     def listChunks(self):
         chunks = set()
+        index = self._getChunkIndex()
+        found = set()
 
         for filepath in self.findRegionFiles():
-            regionFile = self.tryLoadRegionFile(filepath)
-            if regionFile is None:
+            regionCoords = self.parseRegionFilename(filepath)
+            if regionCoords is None:
                 continue
 
-            if regionFile.offsets.any():
-                rx, rz = regionFile.regionCoords
-                self.regionFiles[rx, rz] = regionFile
+            rx, rz = regionCoords
+            regionFile = self.regionFiles.get(regionCoords)
+            if regionFile is not None:
+                regionChunks = regionFile.offsets > 0
+            else:
+                regionChunks = self._regionChunks(rx, rz, filepath)
 
-                for index, offset in enumerate(regionFile.offsets):
-                    if offset:
-                        cx = index & 0x1f
-                        cz = index >> 5
+            if regionChunks.any():
+                found.add(regionCoords)
+                for index_ in flatnonzero(regionChunks):
+                    cx = index_ & 0x1f
+                    cz = index_ >> 5
 
-                        cx += rx << 5
-                        cz += rz << 5
+                    cx += rx << 5
+                    cz += rz << 5
 
-                        chunks.add((cx, cz))
+                    chunks.add((int(cx), int(cz)))
             else:
                 log.info(u"Removing empty region file {0}".format(filepath))
-                regionFile.close()
-                os.unlink(regionFile.path)
+                if regionFile is not None:
+                    regionFile.close()
+                    del self.regionFiles[regionCoords]
+                os.unlink(filepath)
+
+        for regionCoords in set(index) - found:
+            del index[regionCoords]
+            self._chunkIndexDirty = True
 
         return chunks
 
     def containsChunk(self, cx, cz):
         rx = cx >> 5
         rz = cz >> 5
-        if not os.path.exists(self.getRegionFilename(rx, rz)):
+        regionFile = self.regionFiles.get((rx, rz))
+        if regionFile is not None:
+            return regionFile.containsChunk(cx, cz)
+
+        path = self.getRegionFilename(rx, rz)
+        if not os.path.exists(path):
             return False
 
-        return self.getRegionForChunk(cx, cz).containsChunk(cx, cz)
+        return bool(self._regionChunks(rx, rz, path)[(cx & 0x1f) + (cz & 0x1f) * 32])
 
     def deleteChunk(self, cx, cz):
         r = cx >> 5, cz >> 5
         rf = self.getRegionFile(*r)
         if rf:
             rf.setOffset(cx & 0x1f, cz & 0x1f, 0)
+            self._regionChanged(rf)
             if (rf.offsets == 0).all():
                 rf.close()
                 os.unlink(rf.path)
                 del self.regionFiles[r]
+                self._getChunkIndex().pop(r, None)
 
     def readChunk(self, cx, cz):
         if not self.containsChunk(cx, cz):
@@ -1084,11 +1446,286 @@ class AnvilWorldFolder(object):
     def saveChunk(self, cx, cz, data):
         regionFile = self.getRegionForChunk(cx, cz)
         regionFile.saveChunk(cx, cz, data)
+        self._regionChanged(regionFile)
+
+    def readCompressedChunk(self, cx, cz):
+        if not self.containsChunk(cx, cz):
+            raise ChunkNotPresent((cx, cz))
+
+        return self.getRegionForChunk(cx, cz).readCompressedChunk(cx, cz)
+
+    def compressChunk(self, data):
+        """ Returns (compressedData, format) for chunk data using this folder's compression. Safe to call from any
+        thread. """
+        compressMode = self.compressMode
+        return MCRegionFile.compressWith(data, compressMode, self.compressLevel), compressMode
+
+    def compressChunkData(self, chunkData):
+        """ Like compressChunk, but takes an AnvilChunkData and serializes it while compressing it """
+        compressMode = self.compressMode
+        return chunkData.compressedTagData(compressMode, self.compressLevel), compressMode
+
+    def saveCompressedChunk(self, cx, cz, data, format):
+        regionFile = self.getRegionForChunk(cx, cz)
+        regionFile._saveChunk(cx, cz, data, format)
+        self._regionChanged(regionFile)
+
+    def saveChunks(self, chunks, mapFunc=map):
+        """
+        Saves an iterable of (cx, cz, data) tuples with one batched write per region file. See
+        MCRegionFile.saveChunks for data and mapFunc.
+        """
+        regions = collections.defaultdict(list)
+        for cx, cz, data in chunks:
+            regions[cx >> 5, cz >> 5].append((cx, cz, data))
+
+        for (rx, rz), regionChunks in regions.iteritems():
+            regionFile = self.getRegionFile(rx, rz)
+            regionFile.saveChunks(regionChunks, mapFunc)
+            self._regionChanged(regionFile)
 
     def copyChunkFrom(self, worldFolder, cx, cz):
         fromRF = worldFolder.getRegionForChunk(cx, cz)
         rf = self.getRegionForChunk(cx, cz)
         rf.copyChunkFrom(fromRF, cx, cz)
+        self._regionChanged(rf)
+
+
+class ChunkDataCache(object):
+    """
+    Maps (cx, cz) positions to AnvilChunkData, ordered from least to most recently used, and keeps a running total
+    of the memory used by the chunks. Choosing which chunks to evict is left to the level, which knows which chunks
+    are in use and how to write dirty ones out.
+
+    Chunks may be pinned by position to keep them from being evicted, whether or not they are loaded yet.
+
+    Chunk data may decode its arrays, and so change size, on the compression pool or the write-behind thread. The
+    lock keeps those size updates from racing with the level's own thread adding and removing chunks.
+    """
+
+    def __init__(self):
+        self._chunks = collections.OrderedDict()
+        self._sizes = {}
+        self._pins = collections.defaultdict(int)
+        self._lock = threading.RLock()
+        self.byteSize = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, cPos):
+        return cPos in self._chunks
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __getitem__(self, cPos):
+        return self._chunks[cPos]
+
+    def __setitem__(self, cPos, chunkData):
+        with self._lock:
+            self.pop(cPos, None)
+            self._chunks[cPos] = chunkData
+            self._sizes[cPos] = chunkData.memoryUsage()
+            self.byteSize += self._sizes[cPos]
+
+    def __delitem__(self, cPos):
+        with self._lock:
+            del self._chunks[cPos]
+            self.byteSize -= self._sizes.pop(cPos)
+
+    def get(self, cPos, default=None):
+        return self._chunks.get(cPos, default)
+
+    def pop(self, cPos, *default):
+        if cPos not in self._chunks:
+            if default:
+                return default[0]
+            raise KeyError(cPos)
+        chunkData = self._chunks[cPos]
+        del self[cPos]
+        return chunkData
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._sizes.clear()
+            self.byteSize = 0
+
+    def iterkeys(self):
+        return self._chunks.iterkeys()
+
+    def itervalues(self):
+        return self._chunks.itervalues()
+
+    def iteritems(self):
+        return self._chunks.iteritems()
+
+    def keys(self):
+        return self._chunks.keys()
+
+    def values(self):
+        return self._chunks.values()
+
+    def items(self):
+        return self._chunks.items()
+
+    def lookup(self, cPos):
+        """ Returns the chunk at cPos, or None, and counts a hit or miss. A hit becomes the most recently used. """
+        chunkData = self._chunks.get(cPos)
+        if chunkData is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.touch(cPos)
+        return chunkData
+
+    def touch(self, cPos):
+        """ Marks the chunk as the most recently used and updates its size """
+        with self._lock:
+            self._chunks[cPos] = self._chunks.pop(cPos)
+            self.updateSize(cPos)
+
+    def updateSize(self, cPos, chunkData=None):
+        """ Recounts the memory used by the chunk at cPos. If chunkData is given, does nothing unless it is still the
+        chunk cached there. May be called from any thread. """
+        with self._lock:
+            cached = self._chunks.get(cPos)
+            if cached is None or (chunkData is not None and cached is not chunkData):
+                return
+            size = cached.memoryUsage()
+            self.byteSize += size - self._sizes[cPos]
+            self._sizes[cPos] = size
+
+    def oldest(self):
+        """ Returns the least recently used (cPos, chunkData) """
+        return next(self._chunks.iteritems())
+
+    def evict(self, cPos):
+        del self[cPos]
+        self.evictions += 1
+
+    def isOverLimit(self, chunkLimit, byteLimit):
+        return len(self._chunks) > chunkLimit or (byteLimit > 0 and self.byteSize > byteLimit)
+
+    # --- Pinning ---
+
+    def pin(self, cPos):
+        self._pins[cPos] += 1
+
+    def unpin(self, cPos):
+        count = self._pins.get(cPos, 0) - 1
+        if count > 0:
+            self._pins[cPos] = count
+        else:
+            self._pins.pop(cPos, None)
+
+    def isPinned(self, cPos):
+        return cPos in self._pins
+
+    def stats(self):
+        return dict(chunks=len(self._chunks), bytes=self.byteSize, pinned=len(self._pins), hits=self.hits,
+                    misses=self.misses, evictions=self.evictions, writebacks=self.writebacks)
+
+
+class _WriteJob(object):
+    def __init__(self, chunkData):
+        self.chunkData = chunkData
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+
+class ChunkWriteBehind(object):
+    """
+    Serializes and compresses dirty chunks evicted from a level's chunk cache on a background thread. The finished
+    chunks are written to the work folder by the level's own thread when it calls writeFinished or writeOldest, so
+    the region files are never touched by two threads.
+
+    Until it is written, a chunk can be taken back with reclaim, which waits for the background thread to finish with
+    it. The chunk data is still dirty, so it will be saved again later.
+    """
+
+    def __init__(self, compress):
+        self.compress = compress  # returns (data, format) for an AnvilChunkData
+        self.pending = collections.OrderedDict()  # maps (cx, cz) to _WriteJob, oldest first
+        self._queue = Queue.Queue()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, cPos):
+        return cPos in self.pending
+
+    def put(self, chunkData):
+        cPos = chunkData.chunkPosition
+        assert cPos not in self.pending, "Chunk {0} is already waiting to be written".format(cPos)
+        job = _WriteJob(chunkData)
+        self.pending[cPos] = job
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ChunkWriteBehind")
+            self._thread.daemon = True
+            self._thread.start()
+        self._queue.put(job)
+
+    def reclaim(self, cPos):
+        """ Removes the chunk from the queue without writing it and returns its chunk data, or None """
+        job = self.pending.pop(cPos, None)
+        if job is None:
+            return None
+        with job.lock:
+            # blocks until the background thread is done with the chunk if it already started on it
+            job.cancelled = True
+        return job.chunkData
+
+    def writeOldest(self, write):
+        """ Waits for the oldest chunk to be finished and passes it to write(cx, cz, data, format) """
+        cPos, job = next(self.pending.iteritems())
+        job.done.wait()
+        self._write(cPos, job, write)
+
+    def writeFinished(self, write, wait=False):
+        """ Passes each chunk that is finished to write(cx, cz, data, format). If wait is True, writes every chunk. """
+        for cPos, job in self.pending.items():
+            if not (wait or job.done.is_set()):
+                break
+            job.done.wait()
+            self._write(cPos, job, write)
+
+    def _write(self, cPos, job, write):
+        del self.pending[cPos]
+        if job.error is not None:
+            raise job.error[0], job.error[1], job.error[2]
+        cx, cz = cPos
+        write(cx, cz, *job.result)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with job.lock:
+                try:
+                    if not job.cancelled:
+                        job.result = self.compress(job.chunkData)
+                except Exception:
+                    job.error = sys.exc_info()
+                finally:
+                    job.done.set()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
 
 
 class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
@@ -1137,6 +1774,8 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
             raise IOError('File is not a Minecraft Alpha world')
 
         self.worldFolder = AnvilWorldFolder(filename)
+        self.worldFolder.setCompression(self.compressMode, self.compressLevel)
+        self.worldFolder.writeChunkIndex = not readonly
         self.filename = self.worldFolder.getFilePath("%s.dat" % dat_name)
         self.readonly = readonly
         if not readonly:
@@ -1153,6 +1792,11 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
 
             self.unsavedWorkFolder = AnvilWorldFolder(workFolderPath)
             self.fileEditsFolder = AnvilWorldFolder(workFolderPath2)
+            self.unsavedWorkFolder.setCompression(*self.tempCompression)
+            self.fileEditsFolder.setCompression(*self.tempCompression)
+            # the work folders are emptied on every save, so an index on disk would never be reused
+            self.unsavedWorkFolder.useChunkIndex = False
+            self.fileEditsFolder.useChunkIndex = False
 
             self.editFileNumber = 1
 
@@ -1160,10 +1804,18 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         self._loadedChunks = weakref.WeakValueDictionary()
 
         # maps (cx, cz) pairs to AnvilChunkData
-        self._loadedChunkData = {}
+        self._loadedChunkData = ChunkDataCache()
         self.recentChunks = collections.deque(maxlen=20)
 
+        # maps (cx, cz) pairs to AsyncResults for chunks being inflated by the worker pool, oldest first
+        self._prefetchedChunks = collections.OrderedDict()
+
+        # dirty chunks evicted from _loadedChunkData that are not yet written to the work folder
+        self._writeBehind = ChunkWriteBehind(self._compressWorkChunk)
+
         self.chunksNeedingLighting = set()
+        # maps (cx, cz) to the lightChanges of chunks that need only part of their lighting recomputed
+        self.chunkLightChanges = {}
         self._allChunks = None
         self.dimensions = {}
 
@@ -1294,23 +1946,46 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
             for _ in MCInfdevOldLevel.saveInPlaceGen(level):
                 yield
 
-        dirtyChunkCount = 0
-        for chunk in self._loadedChunkData.itervalues():
-            cx, cz = chunk.chunkPosition
-            if chunk.dirty:
-                data = chunk.savedTagData()
-                dirtyChunkCount += 1
-                self.worldFolder.saveChunk(cx, cz, data)
-                chunk.dirty = False
-            yield
+        self._prefetchedChunks.clear()
+        self.flushWriteBehind()
 
-        for cx, cz in self.unsavedWorkFolder.listChunks():
-            if (cx, cz) not in self._loadedChunkData:
-                data = self.unsavedWorkFolder.readChunk(cx, cz)
-                self.worldFolder.saveChunk(cx, cz, data)
-                dirtyChunkCount += 1
-            yield
+        # Chunks are saved one region at a time so each region file gets a single batched write
+        def byRegion(items, position=lambda pos: pos):
+            regions = collections.defaultdict(list)
+            for item in items:
+                cx, cz = position(item)
+                regions[cx >> 5, cz >> 5].append(item)
+            return regions.itervalues()
 
+        dirtyChunkCount = 0
+        dirtyChunks = [chunk for chunk in self._loadedChunkData.itervalues() if chunk.dirty]
+        for chunks in byRegion(dirtyChunks, lambda chunk: chunk.chunkPosition):
+            batch = []
+            for chunk in chunks:
+                cx, cz = chunk.chunkPosition
+                batch.append((cx, cz, chunk))
+                yield
+            self.worldFolder.saveChunks(batch, self._workerMap)
+            for chunk in chunks:
+                chunk.dirty = False
+            if self._worldEntityIndex is not None:
+                self._worldEntityIndex.chunksSaved([chunk.chunkPosition + (chunk,) for chunk in chunks])
+            dirtyChunkCount += len(batch)
+
+        workChunks = [pos for pos in self.unsavedWorkFolder.listChunks() if pos not in self._loadedChunkData]
+        for positions in byRegion(workChunks):
+            batch = []
+            for cx, cz in positions:
+                batch.append((cx, cz, self.unsavedWorkFolder.readChunk(cx, cz)))
+                yield
+            self.worldFolder.saveChunks(batch, self._workerMap)
+            if self._worldEntityIndex is not None:
+                self._worldEntityIndex.chunksSaved([(cx, cz, None) for cx, cz in positions])
+            dirtyChunkCount += len(batch)
+
+        self.worldFolder.saveChunkIndex()
+        if self._worldEntityIndex is not None:
+            self._worldEntityIndex.save()
         self.unsavedWorkFolder.closeRegions()
         shutil.rmtree(self.unsavedWorkFolder.filename, True)
         if not os.path.exists(self.unsavedWorkFolder.filename):
@@ -1336,6 +2011,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         """
         if self.saving:
             raise ChunkAccessDenied
+        self.flushWriteBehind()
         self.worldFolder.closeRegions()
         if not self.readonly:
             self.unsavedWorkFolder.closeRegions()
@@ -1344,12 +2020,17 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         self.recentChunks.clear()
         self._loadedChunks.clear()
         self._loadedChunkData.clear()
+        self._prefetchedChunks.clear()
 
     def close(self):
         """
         Unload all chunks and close all open filehandles. Discard any unsaved data.
         """
         self.unload()
+        self._writeBehind.stop()
+        if self._workerPool is not None:
+            self._workerPool.terminate()
+            self._workerPool = None
         try:
             self.checkSessionLock()
             shutil.rmtree(self.unsavedWorkFolder.filename, True)
@@ -1359,7 +2040,58 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
 
     # --- Resource limits ---
 
+    # Maximum number of chunks, and if it is not 0, the memory in bytes used by chunks kept in memory. Chunks that are
+    # in use or pinned may go over both limits.
     loadedChunkLimit = 400
+    loadedChunkMemoryLimit = 0
+
+    # Maximum number of evicted dirty chunks waiting to be saved to the work folder by a background thread. 0 saves
+    # them before returning from the getChunk call that evicted them.
+    writeBehindLimit = 32
+
+    def pinChunk(self, cx, cz):
+        """
+        Keeps the chunk in memory until unpinChunk is called as many times as pinChunk, even if it is not in use.
+        The chunk does not have to be loaded yet.
+        """
+        self._loadedChunkData.pin((cx, cz))
+
+    def unpinChunk(self, cx, cz):
+        self._loadedChunkData.unpin((cx, cz))
+
+    def _chunkDataResized(self, chunkData):
+        # called by AnvilChunkData when it decodes one of its arrays, possibly on a worker thread
+        self._loadedChunkData.updateSize(chunkData.chunkPosition, chunkData)
+
+    def chunkCacheStats(self):
+        """ Returns a dict with the number, memory use, hits, misses and evictions of the chunks kept in memory """
+        stats = self._loadedChunkData.stats()
+        stats["pendingWrites"] = len(self._writeBehind)
+        return stats
+
+    def flushWriteBehind(self):
+        """ Saves every evicted dirty chunk still waiting for the background thread to the work folder """
+        self._writeBehind.writeFinished(self._writeWorkChunk, wait=True)
+
+    def _compressWorkChunk(self, chunkData):
+        return self.unsavedWorkFolder.compressChunkData(chunkData)
+
+    def _writeWorkChunk(self, cx, cz, data, format):
+        self.unsavedWorkFolder.saveCompressedChunk(cx, cz, data, format)
+
+    def _writeEvictedChunk(self, chunkData):
+        if self._worldEntityIndex is not None:
+            self._worldEntityIndex.chunkEvicted(chunkData)
+        if self.writeBehindLimit <= 0:
+            cx, cz = chunkData.chunkPosition
+            self.unsavedWorkFolder.saveChunk(cx, cz, chunkData.savedTagData())
+            return
+
+        writeBehind = self._writeBehind
+        writeBehind.writeFinished(self._writeWorkChunk)
+        while len(writeBehind) >= self.writeBehindLimit:
+            writeBehind.writeOldest(self._writeWorkChunk)
+        writeBehind.put(chunkData)
 
     # --- Constants ---
 
@@ -1589,6 +2321,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         if not self.readonly:
             self._allChunks.update(self.unsavedWorkFolder.listChunks())
         self._allChunks.update(self._loadedChunkData.iterkeys())
+        self._allChunks.update(self._writeBehind.pending.iterkeys())
 
     def getRegionForChunk(self, cx, cz):
         return self.worldFolder.getRegionForChunk(cx, cz)
@@ -1657,6 +2390,13 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         if world.saving | self.saving:
             raise ChunkAccessDenied
         self.checkSessionLock()
+        self._discardPrefetchedChunk(cx, cz)
+        self._writeBehind.reclaim((cx, cz))
+
+        # the source chunk may still be waiting to be written to its work folder
+        chunkData = world._writeBehind.reclaim((cx, cz))
+        if chunkData is not None:
+            world._loadedChunkData[cx, cz] = chunkData
 
         destChunk = self._loadedChunks.get((cx, cz))
         sourceChunk = world._loadedChunks.get((cx, cz))
@@ -1698,23 +2438,144 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
                 self.unsavedWorkFolder.copyChunkFrom(sourceFolder, cx, cz)
 
     def _getChunkBytes(self, cx, cz):
+        prefetched = self._prefetchedChunks.pop((cx, cz), None)
+        if prefetched is not None:
+            return prefetched.get()
+
+        return self._getChunkFolder(cx, cz).readChunk(cx, cz)
+
+    def _getChunkFolder(self, cx, cz):
         if not self.readonly and self.unsavedWorkFolder.containsChunk(cx, cz):
-            return self.unsavedWorkFolder.readChunk(cx, cz)
+            return self.unsavedWorkFolder
         else:
-            return self.worldFolder.readChunk(cx, cz)
+            return self.worldFolder
+
+    # --- Compression ---
+
+    # Codec and zlib level used to save chunks to the world's own region files
+    compressMode = MCRegionFile.VERSION_DEFLATE
+    compressLevel = 2
+
+    # (compressMode, compressLevel) for the work folders. Their chunks are always decompressed and recompressed
+    # with the world's own settings when the world is saved, so they never reach the game.
+    tempCompression = MCRegionFile.fastestCompression()
+
+    def setCompression(self, compressMode=None, compressLevel=None):
+        """
+        Sets the codec and zlib level used when saving this world and its dimensions, e.g. level 9 for a final
+        export. Scratch worlds that are never opened by the game, such as undo worlds, can pass tempCompression.
+        """
+        if compressMode is not None:
+            self.compressMode = compressMode
+        if compressLevel is not None:
+            self.compressLevel = compressLevel
+
+        self.worldFolder.setCompression(self.compressMode, self.compressLevel)
+        for dimension in self.dimensions.itervalues():
+            dimension.setCompression(self.compressMode, self.compressLevel)
+
+    # --- Worker pool ---
+
+    # Number of threads used to inflate and deflate chunks. zlib releases the GIL while it works, so these run in
+    # parallel with the main thread. 0 inflates and deflates everything on the calling thread.
+    compressionWorkers = 0
+
+    # Maximum number of chunks to read ahead of getChunks and getChunkSlices
+    prefetchChunkLimit = 64
+
+    _workerPool = None
+
+    @property
+    def workerPool(self):
+        if self.compressionWorkers <= 0:
+            return None
+        if self._workerPool is None:
+            self._workerPool = ThreadPool(self.compressionWorkers)
+        return self._workerPool
+
+    def _workerMap(self, func, items):
+        pool = self.workerPool
+        if pool is None or len(items) < 2:
+            return map(func, items)
+        return pool.map(func, items)
+
+    def prefetchChunks(self, positions):
+        """
+        Reads the given chunks and starts inflating them on the worker pool, so a later getChunk only has to parse
+        them. Does nothing if compressionWorkers is 0. At most prefetchChunkLimit chunks are kept; prefetching more
+        drops the oldest ones that haven't been loaded yet.
+        """
+        pool = self.workerPool
+        if pool is None:
+            return
+
+        for cx, cz in positions:
+            if (cx, cz) in self._loadedChunkData or (cx, cz) in self._writeBehind:
+                continue
+            if (cx, cz) in self._prefetchedChunks:
+                continue
+            try:
+                data, format = self._getChunkFolder(cx, cz).readCompressedChunk(cx, cz)
+            except ChunkNotPresent:
+                continue
+            while len(self._prefetchedChunks) >= max(1, self.prefetchChunkLimit):
+                self._prefetchedChunks.popitem(last=False)
+            self._prefetchedChunks[cx, cz] = pool.apply_async(MCRegionFile.decompress, (data, format))
+
+    def _discardPrefetchedChunk(self, cx, cz):
+        self._prefetchedChunks.pop((cx, cz), None)
+
+    def _prefetchAhead(self, items, position):
+        """ Passes items through, prefetching the chunk at position(item) for the next prefetchChunkLimit items """
+        if self.workerPool is None:
+            for item in items:
+                yield item
+            return
+
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(item)
+                self.prefetchChunks((position(item),))
+                if len(pending) >= self.prefetchChunkLimit:
+                    yield pending.popleft()
+
+            while pending:
+                yield pending.popleft()
+        finally:
+            # the caller stopped early; don't keep the chunks it will never load
+            for item in pending:
+                self._discardPrefetchedChunk(*position(item))
+
+    def getChunks(self, chunks=None):
+        if chunks is None:
+            chunks = self.allChunks
+        return (self.getChunk(cx, cz) for (cx, cz) in self._prefetchAhead(chunks, lambda pos: pos)
+                if self.containsChunk(cx, cz))
+
+    def getChunkSlices(self, box):
+        return ((self.getChunk(*cPos), slices, point)
+                for cPos, slices, point in self._prefetchAhead(self._getSlices(box), lambda item: item[0])
+                if self.containsChunk(*cPos))
 
     def _getChunkData(self, cx, cz):
-        chunkData = self._loadedChunkData.get((cx, cz))
+        chunkData = self._loadedChunkData.lookup((cx, cz))
         if chunkData is not None:
             return chunkData
 
         if self.saving:
             raise ChunkAccessDenied
 
+        chunkData = self._writeBehind.reclaim((cx, cz))
+        if chunkData is not None:
+            self._discardPrefetchedChunk(cx, cz)
+            self._storeLoadedChunkData(chunkData)
+            return chunkData
+
         try:
             data = self._getChunkBytes(cx, cz)
-            root_tag = nbt.load(buf=data)
-            chunkData = AnvilChunkData(self, (cx, cz), root_tag)
+            root_tag = nbt.load(buf=data, views=True)
+            chunkData = AnvilChunkData(self, (cx, cz), root_tag, bufferSize=len(data))
         except (MemoryError, ChunkNotPresent):
             raise
         except Exception as e:
@@ -1728,21 +2589,29 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         return chunkData
 
     def _storeLoadedChunkData(self, chunkData):
-        if len(self._loadedChunkData) > self.loadedChunkLimit:
-            # Try to find a chunk to unload. The chunk must not be in _loadedChunks, which contains only chunks that
-            # are in use by another object. If the chunk is dirty, save it to the temporary folder.
-            if not self.readonly:
-                self.checkSessionLock()
-            for (ocx, ocz), oldChunkData in self._loadedChunkData.items():
-                if (ocx, ocz) not in self._loadedChunks:
-                    if oldChunkData.dirty and not self.readonly:
-                        data = oldChunkData.savedTagData()
-                        self.unsavedWorkFolder.saveChunk(ocx, ocz, data)
-
-                    del self._loadedChunkData[ocx, ocz]
-                    break
+        cache = self._loadedChunkData
+        cache[chunkData.chunkPosition] = chunkData
+        if not cache.isOverLimit(self.loadedChunkLimit, self.loadedChunkMemoryLimit):
+            return
+
+        # Unload the least recently used chunks until the cache is back under its limits. A chunk in _loadedChunks
+        # is in use by another object, so it and any pinned chunk are moved to the most recently used end instead.
+        # Dirty chunks are saved to the temporary folder by _writeBehind. Each chunk other than the new one is looked at only once.
+        if not self.readonly:
+            self.checkSessionLock()
+        for _ in xrange(len(cache) - 1):
+            if not cache.isOverLimit(self.loadedChunkLimit, self.loadedChunkMemoryLimit):
+                break
+            (ocx, ocz), oldChunkData = cache.oldest()
+            if (ocx, ocz) in self._loadedChunks or cache.isPinned((ocx, ocz)):
+                cache.touch((ocx, ocz))
+                continue
 
-        self._loadedChunkData[chunkData.chunkPosition] = chunkData
+            if oldChunkData.dirty and not self.readonly:
+                self._writeEvictedChunk(oldChunkData)
+                cache.writebacks += 1
+
+            cache.evict((ocx, ocz))
 
     def getChunk(self, cx, cz):
         '''
@@ -1777,6 +2646,8 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         for cPos, chunkData in self._loadedChunkData.iteritems():
             if chunkData.dirty:
                 yield cPos
+        for cPos in self._writeBehind.pending.keys():
+            yield cPos
 
     # --- HeightMaps ---
 
@@ -1825,6 +2696,19 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         zChunk = int(z/16) * 16
         biomes[(z - zChunk) * 16 + (x - xChunk)] = biomeID
 
+    # --- Entity index ---
+
+    # string fields of entities and tile entities recorded by the entity index, see entityindex.chunkKeys
+    entityIndexFields = ("Items.id", "Item.id")
+    _worldEntityIndex = None
+
+    def getEntityIndex(self):
+        """ Returns the EntityIndex of this level's world folder, which finds the chunks holding given entities and
+        tile entities without loading the others. """
+        if self._worldEntityIndex is None:
+            self._worldEntityIndex = EntityIndex(self, self.entityIndexFields)
+        return self._worldEntityIndex
+
     # --- Entities and TileEntities ---
 
     def addEntity(self, entityTag):
@@ -2007,7 +2891,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         '''
         if self._allChunks is not None:
             return (cx, cz) in self._allChunks
-        if (cx, cz) in self._loadedChunkData:
+        if (cx, cz) in self._loadedChunkData or (cx, cz) in self._writeBehind:
             return True
 
         return self.worldFolder.containsChunk(cx, cz)
@@ -2044,6 +2928,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         if self._allChunks is not None:
             self._allChunks.add((cx, cz))
 
+        self._discardPrefetchedChunk(cx, cz)
         self._storeLoadedChunkData(AnvilChunkData(self, (cx, cz), create=True))
         self._bounds = None
 
@@ -2095,6 +2980,8 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel):
         :type cz: int
         '''
         self.worldFolder.deleteChunk(cx, cz)
+        self._discardPrefetchedChunk(cx, cz)
+        self._writeBehind.reclaim((cx, cz))
         if self._allChunks is not None:
             self._allChunks.discard((cx, cz))
 
@@ -2376,6 +3263,7 @@ class MCAlphaDimension(MCInfdevOldLevel):
 
         self.parentWorld = parentWorld
         MCInfdevOldLevel.__init__(self, filename, create)
+        self.setCompression(parentWorld.compressMode, parentWorld.compressLevel)
         self.dimNo = dimNo
         self.filename = parentWorld.filename
         self.players = self.parentWorld.players
@@ -2386,6 +3274,10 @@ class MCAlphaDimension(MCInfdevOldLevel):
     def root_tag(self):
         return self.parentWorld.root_tag
 
+    @property
+    def workerPool(self):
+        return self.parentWorld.workerPool
+
     def __str__(self):
         return u"MCAlphaDimension({0}, {1})".format(self.parentWorld, self.dimNo)
 
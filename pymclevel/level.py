@@ -22,7 +22,7 @@ import materials
 from math import floor
 from mclevelbase import ChunkMalformed, ChunkNotPresent
 import nbt
-from numpy import argmax, swapaxes, zeros, zeros_like
+from numpy import arange, argmax, asarray, clip, maximum, minimum, newaxis, subtract, swapaxes, where, zeros, zeros_like
 import os.path
 from id_definitions import get_defs_ids, PLATFORM_UNKNOWN, VERSION_UNKNOWN
 from items import getItemDefs
@@ -50,6 +50,42 @@ def computeChunkHeightMap(materials, blocks, HeightMap=None):
         return HeightMap
 
 
+def computeChunkSkyLight(materials, blocks, heightMap, skyLight=None):
+    """Computes the light that reaches each block of a chunk straight down from the sky,
+    before it spreads sideways. heightMap is indexed z,x like a chunk's HeightMap.
+
+    If skyLight is passed, fills it with the result and returns it. Otherwise, returns a
+    new array.
+    """
+    # Light left after passing down through each block of a column is 15 minus the absorption of every block from
+    # that one up to the height map. Blocks absorb at least 1 and nothing at or above the height map absorbs, so only
+    # the blocks below the highest column need to be looked at.
+    heights = asarray(heightMap, 'int32').swapaxes(0, 1)
+    top = max(0, min(int(heights.max()), blocks.shape[2]))
+
+    absorption = materials.lightAbsorption[blocks[:, :, :top]].astype('int32')
+    maximum(absorption, 1, absorption)
+    absorption[arange(top) >= heights[:, :, newaxis]] = 0
+
+    light = absorption[:, :, ::-1].cumsum(axis=2)[:, :, ::-1]
+    subtract(15, light, light)
+    clip(light, 0, 15, light)
+
+    if skyLight is None:
+        skyLight = zeros(blocks.shape, 'uint8')
+    skyLight[:, :, :top] = light
+    skyLight[:, :, top:] = 15
+
+    return skyLight
+
+
+def lightChangedMask(materials, oldBlocks, newBlocks):
+    """ Returns a boolean array that is True where the light absorption or emission of newBlocks differs from
+    oldBlocks. """
+    return ((materials.lightAbsorption[oldBlocks] != materials.lightAbsorption[newBlocks]) |
+            (materials.lightEmission[oldBlocks] != materials.lightEmission[newBlocks]))
+
+
 def extractHeights(array):
     """ Given an array of bytes shaped (x, z, y), return the coordinates of the highest
     non-zero value in each y-column into heightMap
@@ -562,27 +598,109 @@ class MCLevel(object):
         return -45., 0.
 
     # --- Dummy Lighting Methods ---
-    def generateLights(self, dirtyChunks=None):
+    def generateLights(self, dirtyChunks=None, method=None, workers=0):
         pass
 
-    def generateLightsIter(self, dirtyChunks=None):
+    def generateLightsIter(self, dirtyChunks=None, method=None, workers=0):
         yield 0
 
 
+def _entityKey(tag):
+    # the 16 block cube holding the entity, or None if it is not anywhere
+    try:
+        return tuple(int(floor(c)) >> 4 for c in Entity.pos(tag))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _tileEntityKey(tag):
+    return tuple(TileEntity.pos(tag))
+
+
+def _tileTickKey(tag):
+    return tuple(TileTick.pos(tag))
+
+
+class _TagIndex(object):
+    """ The tags of one of a level's entity lists, grouped by a key computed from their position. The index notices
+    when the list is replaced or tags are added or removed without it and is built again, but tags moved in place
+    are not noticed; call resetEntityIndex after moving them. """
+
+    def __init__(self, tagList, keyFunc):
+        self.tags = tagList.value
+        self.keyFunc = keyFunc
+        self.buckets = defaultdict(list)
+        for tag in self.tags:
+            self.buckets[keyFunc(tag)].append(tag)
+        self._remember()
+
+    def _remember(self):
+        self.length = len(self.tags)
+        self.last = self.tags[-1] if self.tags else None
+
+    def isCurrent(self, tagList):
+        tags = self.tags
+        return tagList.value is tags and len(tags) == self.length and (tags[-1] if tags else None) is self.last
+
+    def append(self, tagList, tag):
+        tagList.append(tag)
+        self.buckets[self.keyFunc(tag)].append(tag)
+        self._remember()
+
+    def replace(self, tagList, tag):
+        """ Appends tag to tagList after removing the tags with the same key """
+        replaced = self.buckets.pop(self.keyFunc(tag), None)
+        if replaced:
+            replaced = set(id(t) for t in replaced)
+            tagList.value[:] = [t for t in self.tags if id(t) not in replaced]
+        self.append(tagList, tag)
+
+    def tagsAtPositionsInBox(self, box):
+        buckets = self.buckets
+        if box.volume < len(buckets):
+            keys = [p for p in box.positions if p in buckets]
+        else:
+            keys = [p for p in buckets if p in box]
+        return [tag for p in keys for tag in buckets[p]]
+
+
 class EntityLevel(MCLevel):
     """Abstract subclass of MCLevel that adds default entity behavior"""
 
+    # _TagIndexes for Entities, TileEntities and TileTicks, built when first needed
+    _entityIndex = _tileEntityIndex = _tileTickIndex = None
+
+    def _index(self, name, tagList, keyFunc):
+        index = getattr(self, name)
+        if index is None or not index.isCurrent(tagList):
+            index = _TagIndex(tagList, keyFunc)
+            setattr(self, name, index)
+        return index
+
+    def resetEntityIndex(self):
+        """ Call this after changing the position of entities, tile entities or tile ticks that are already in the
+        level. Adding and removing them, even by editing the lists directly, is noticed. """
+        self._entityIndex = self._tileEntityIndex = self._tileTickIndex = None
+        self._fakeEntities = None
+
     def getEntitiesInBox(self, box):
         """Returns a list of references to entities in this chunk, whose positions are within box"""
-        return [ent for ent in self.Entities if Entity.pos(ent) in box]
+        index = self._index("_entityIndex", self.Entities, _entityKey)
+        x0, y0, z0 = (int(floor(c)) >> 4 for c in box.origin)
+        x1, y1, z1 = (int(floor(c)) >> 4 for c in box.maximum)
+        entities = []
+        for key, tags in index.buckets.iteritems():
+            if key is not None and x0 <= key[0] <= x1 and y0 <= key[1] <= y1 and z0 <= key[2] <= z1:
+                entities.extend(ent for ent in tags if Entity.pos(ent) in box)
+        return entities
 
     def getTileEntitiesInBox(self, box):
         """Returns a list of references to tile entities in this chunk, whose positions are within box"""
-        return [ent for ent in self.TileEntities if TileEntity.pos(ent) in box]
+        return self._index("_tileEntityIndex", self.TileEntities, _tileEntityKey).tagsAtPositionsInBox(box)
 
     def getTileTicksInBox(self, box):
         if hasattr(self, "TileTicks"):
-            return [ent for ent in self.TileTicks if TileTick.pos(ent) in box]
+            return self._index("_tileTickIndex", self.TileTicks, _tileTickKey).tagsAtPositionsInBox(box)
         else:
             return []
 
@@ -599,6 +717,7 @@ class EntityLevel(MCLevel):
         log.debug("Removed {0} entities".format(entsRemoved))
 
         self.Entities.value[:] = newEnts
+        self._entityIndex = None
 
         return entsRemoved
 
@@ -618,6 +737,7 @@ class EntityLevel(MCLevel):
         log.debug("Removed {0} tile entities".format(entsRemoved))
 
         self.TileEntities.value[:] = newEnts
+        self._tileEntityIndex = None
 
         return entsRemoved
 
@@ -637,6 +757,7 @@ class EntityLevel(MCLevel):
         log.debug("Removed {0} tile tickss".format(entsRemoved))
 
         self.TileTicks.value[:] = newEnts
+        self._tileTickIndex = None
 
         return entsRemoved
 
@@ -649,18 +770,15 @@ class EntityLevel(MCLevel):
 
     def addEntity(self, entityTag):
         assert isinstance(entityTag, nbt.TAG_Compound)
-        self.Entities.append(entityTag)
+        self._index("_entityIndex", self.Entities, _entityKey).append(self.Entities, entityTag)
         self._fakeEntities = None
 
     def tileEntityAt(self, x, y, z, print_stuff=False):
-        entities = []
         if print_stuff:
             print "len(self.TileEntities)", len(self.TileEntities)
-        for entityTag in self.TileEntities:
-            if print_stuff:
+            for entityTag in self.TileEntities:
                 print entityTag["id"].value, TileEntity.pos(entityTag), x, y, z
-            if TileEntity.pos(entityTag) == [x, y, z]:
-                entities.append(entityTag)
+        entities = self._index("_tileEntityIndex", self.TileEntities, _tileEntityKey).buckets.get((x, y, z), ())
 
         if len(entities) > 1:
             log.info("Multiple tile entities found: {0}".format(entities))
@@ -671,24 +789,13 @@ class EntityLevel(MCLevel):
 
     def addTileEntity(self, tileEntityTag):
         assert isinstance(tileEntityTag, nbt.TAG_Compound)
-
-        def differentPosition(a):
-            return not ((tileEntityTag is a) or TileEntity.pos(a) == TileEntity.pos(tileEntityTag))
-
-        self.TileEntities.value[:] = filter(differentPosition, self.TileEntities)
-
-        self.TileEntities.append(tileEntityTag)
+        self._index("_tileEntityIndex", self.TileEntities, _tileEntityKey).replace(self.TileEntities, tileEntityTag)
         self._fakeEntities = None
 
     def addTileTick(self, tickTag):
         assert isinstance(tickTag, nbt.TAG_Compound)
         if hasattr(self, "TileTicks"):
-            def differentPosition(a):
-                return not ((tickTag is a) or TileTick.pos(a) == TileTick.pos(tickTag))
-
-            self.TileTicks.value[:] = filter(differentPosition, self.TileTicks)
-
-            self.TileTicks.append(tickTag)
+            self._index("_tileTickIndex", self.TileTicks, _tileTickKey).replace(self.TileTicks, tickTag)
             self._fakeEntities = None
 
     def addTileTicks(self, tileTicks):
@@ -734,6 +841,19 @@ class ChunkBase(EntityLevel):
         self.dirty = True
         self.needsLighting = needsLighting or self.needsLighting
 
+    def blocksChanged(self, slices, changed):
+        """ Call this instead of chunkChanged after changing the blocks in slices. changed is a boolean array shaped
+        like self.Blocks[slices] that is True where a block's light absorption or emission changed. """
+        self.chunkChanged(changed.any())
+
+    def readOnlyArray(self, name, slices):
+        """ Returns the named array (Blocks, Data, SkyLight or BlockLight) indexed by slices. The result must not be
+        modified, since chunks that decode their arrays lazily may return a copy. """
+        return getattr(self, name)[slices]
+
+    def arrayValueAt(self, name, x, z, y):
+        return getattr(self, name)[x, z, y]
+
     @property
     def materials(self):
         return self.world.materials
@@ -765,6 +885,23 @@ class FakeChunk(ChunkBase):
 
 
 class LightedChunk(ChunkBase):
+    # While the chunk needs lighting, lightChanges holds the range of y where blocks changed their light absorption or
+    # emission in each column, as an array of (minY, maxY) indexed [x, z]. The sky light of those columns below maxY
+    # was reset by genFastLightsBelow. None means the whole chunk is relit. Setting needsLighting when it was not set
+    # clears lightChanges, so chunks marked by other means are relit fully.
+    lightChanges = None
+    _needsLighting = False
+
+    @property
+    def needsLighting(self):
+        return self._needsLighting
+
+    @needsLighting.setter
+    def needsLighting(self, value):
+        if value and not self.needsLighting:
+            self.lightChanges = None
+        self._needsLighting = value
+
     def generateHeightMap(self):
         computeChunkHeightMap(self.materials, self.Blocks, self.HeightMap)
 
@@ -777,24 +914,60 @@ class LightedChunk(ChunkBase):
         self.needsLighting = calcLighting or self.needsLighting
         self.generateHeightMap()
         if calcLighting:
+            self.lightChanges = None
             self.genFastLights()
 
+    def blocksChanged(self, slices, changed):
+        """ Call this instead of chunkChanged after changing the blocks in slices. changed is a boolean array shaped
+        like self.Blocks[slices] that is True where a block's light absorption or emission changed. Only the parts of
+        the chunk around those blocks are relit. Use lightChangedMask to find them. """
+        self.dirty = True
+        self.generateHeightMap()
+        if not changed.any():
+            return
+
+        height = self.Blocks.shape[2]
+        xs, zs, ys = slices
+        xs = slice(*xs.indices(16)[:2])
+        zs = slice(*zs.indices(16)[:2])
+        y0 = ys.indices(height)[0]
+
+        columns = changed.any(axis=2)
+        minY = where(columns, changed.argmax(axis=2) + y0, height)
+        maxY = where(columns, changed.shape[2] - changed[:, :, ::-1].argmax(axis=2) + y0, 0)
+
+        tops = zeros((16, 16), 'int32')
+        tops[xs, zs] = maxY
+        self.genFastLightsBelow(tops)
+
+        if self.needsLighting and self.lightChanges is None:
+            return  # the whole chunk is relit already
+        if self.needsLighting:
+            lightChanges = self.lightChanges
+        else:
+            self.needsLighting = True
+            lightChanges = zeros((16, 16, 2), 'int16')
+            lightChanges[..., 0] = height
+
+        area = lightChanges[xs, zs]
+        area[..., 0] = minimum(area[..., 0], minY)
+        area[..., 1] = maximum(area[..., 1], maxY)
+        self.lightChanges = lightChanges
+
     def genFastLights(self):
         self.SkyLight[:] = 0
         if self.world.dimNo in (-1, 1):
             return  # no light in nether or the end
 
-        blocks = self.Blocks
-        la = self.world.materials.lightAbsorption
-        skylight = self.SkyLight
-        heightmap = self.HeightMap
+        computeChunkSkyLight(self.world.materials, self.Blocks, self.HeightMap, self.SkyLight)
 
-        for x, z in itertools.product(xrange(16), xrange(16)):
-            skylight[x, z, heightmap[z, x]:] = 15
-            lv = 15
-            for y in reversed(range(heightmap[z, x])):
-                lv -= (la[blocks[x, z, y]] or 1)
+    def genFastLightsBelow(self, tops):
+        """ Like genFastLights, for the blocks of each column below tops, an array of heights indexed x,z. The light
+        falling straight down a column only changes below the highest block whose absorption changed. """
+        if self.world.dimNo in (-1, 1):
+            return  # no light in nether or the end
 
-                if lv <= 0:
-                    break
-                skylight[x, z, y] = lv
+        below = arange(self.Blocks.shape[2]) < tops[..., newaxis]
+        if below.any():
+            skyLight = computeChunkSkyLight(self.world.materials, self.Blocks, self.HeightMap)
+            self.SkyLight[below] = skyLight[below]
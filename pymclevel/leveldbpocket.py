@@ -2096,6 +2096,9 @@ class PocketLeveldbChunk1Plus(LightedChunk):
     def genFastLights(self):
         pass
 
+    def genFastLightsBelow(self, tops):
+        pass
+
     # -- Entities and TileEntities
 
     @property
@@ -0,0 +1,563 @@
+"""
+Queue based light propagation for chunked levels.
+
+Instead of sweeping every dirty chunk and its neighbors until nothing changes, queueLightsIter looks for blocks whose
+light no longer agrees with their neighbors and floods outward from them. Blocks that are too bright are darkened by a
+decrease queue, which also collects the brighter blocks around the darkened area. Those, and the blocks that are too
+dark, are then spread by an increase queue. Only blocks whose light changes are visited by either queue.
+
+Both queues are processed one step at a time for the whole front, so the per-block work is done by numpy.
+
+A chunk whose lightChanges are known only had the light absorption or emission of some of its blocks changed, and
+only the sky light below them was reset. Only those blocks and their neighbors can disagree with their neighbors, so
+only the box around them is searched, along with the faces of the neighboring chunks it touches.
+
+parallelLightsIter splits the chunks into square tiles and runs queueLightsIter on each tile in a worker process.
+Each worker gets copies of its tile's chunks and the two rings of chunks around them in shared memory. Light from a
+change reaches at most 15 blocks, so the first ring holds every block that can change and the second keeps the
+first ring's outer edge from being lit as if nothing were beyond it. Each chunk is copied back from one tile only,
+and a final queueLightsIter over the chunks on the tile seams settles the light between tiles.
+"""
+
+import ctypes
+import itertools
+import logging
+import multiprocessing
+
+from numpy import argsort, array, clip, concatenate, flatnonzero, frombuffer, int16, int64, lexsort, maximum, zeros
+
+from level import computeChunkHeightMap, computeChunkSkyLight
+from mclevelbase import ChunkMalformed, ChunkNotPresent
+
+log = logging.getLogger(__name__)
+
+_directions = ((-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1))
+
+# chunk neighbors sharing a face, with the slice of this chunk along x and z that touches them
+_faces = (((-1, 0), slice(0, 1), slice(0, 16)),
+          ((1, 0), slice(15, 16), slice(0, 16)),
+          ((0, -1), slice(0, 16), slice(0, 1)),
+          ((0, 1), slice(0, 16), slice(15, 16)))
+
+_coordOffset = 1 << 25
+
+
+class _LightVolume(object):
+    """ One kind of light in a level, read and written using arrays of world coordinates. Chunks are loaded as the
+    light reaches them and stay referenced until the volume is discarded. """
+
+    def __init__(self, level, lightName):
+        self.level = level
+        self.lightName = lightName
+        self.height = level.Height
+        self.yBits = int(level.Height - 1).bit_length()
+
+        materials = level.materials
+        self.materials = materials
+        la = array(materials.lightAbsorption)
+        clip(la, 1, 15, la)
+        self.lightAbsorption = la
+
+        self._entries = {}
+        self.changedChunks = set()
+
+    def entry(self, cx, cz):
+        """ Returns (chunk, light, absorption, seed) for the chunk at cx, cz or None if it is not present.
+        absorption and seed are arrays shaped like the chunk. seed is the light each block has on its own: its
+        emission for BlockLight, the light falling straight down from the sky for SkyLight. """
+        try:
+            return self._entries[cx, cz]
+        except KeyError:
+            pass
+
+        try:
+            chunk = self.level.getChunk(cx, cz)
+        except (ChunkNotPresent, ChunkMalformed):
+            entry = None
+        else:
+            blocks = chunk.Blocks
+            if self.lightName == "SkyLight":
+                seed = computeChunkSkyLight(self.materials, blocks, computeChunkHeightMap(self.materials, blocks))
+            else:
+                seed = self.materials.lightEmission[blocks]
+            entry = chunk, getattr(chunk, self.lightName), self.lightAbsorption[blocks], seed
+
+        self._entries[cx, cz] = entry
+        return entry
+
+    def keys(self, X, Y, Z):
+        """ Returns a unique int64 for each position """
+        return ((((X + _coordOffset) << 26) | (Z + _coordOffset)) << self.yBits) | Y
+
+    def _chunkGroups(self, X, Z):
+        # yields (entry, indices) for each present chunk among the given columns
+        if not len(X):
+            return
+        CX = X >> 4
+        CZ = Z >> 4
+        chunkKeys = ((CX + _coordOffset) << 26) | (CZ + _coordOffset)
+        order = argsort(chunkKeys, kind='mergesort')
+        sortedKeys = chunkKeys[order]
+        starts = concatenate(([0], flatnonzero(sortedKeys[1:] != sortedKeys[:-1]) + 1, [len(order)]))
+        for start, end in zip(starts[:-1], starts[1:]):
+            indices = order[start:end]
+            first = indices[0]
+            entry = self.entry(int(CX[first]), int(CZ[first]))
+            if entry is not None:
+                yield entry, indices
+
+    def lookup(self, X, Y, Z):
+        """ Returns (present, light, absorption, seed) arrays for the given positions. Positions outside the world
+        are not present and read as zero. """
+        count = len(X)
+        present = zeros(count, bool)
+        light = zeros(count, int16)
+        absorption = zeros(count, int16)
+        seed = zeros(count, int16)
+
+        inside = flatnonzero((Y >= 0) & (Y < self.height))
+        X, Y, Z = X[inside], Y[inside], Z[inside]
+        for (chunk, chunkLight, chunkAbsorption, chunkSeed), indices in self._chunkGroups(X, Z):
+            x = X[indices] & 0xf
+            z = Z[indices] & 0xf
+            y = Y[indices]
+            out = inside[indices]
+            present[out] = True
+            light[out] = chunkLight[x, z, y]
+            absorption[out] = chunkAbsorption[x, z, y]
+            seed[out] = chunkSeed[x, z, y]
+
+        return present, light, absorption, seed
+
+    def store(self, X, Y, Z, values):
+        """ Sets the light at the given positions, which must be present. """
+        for (chunk, chunkLight, chunkAbsorption, chunkSeed), indices in self._chunkGroups(X, Z):
+            chunkLight[X[indices] & 0xf, Z[indices] & 0xf, Y[indices]] = values[indices]
+            chunk.dirty = True
+            self.changedChunks.add(chunk.chunkPosition)
+
+    def unique(self, X, Y, Z, values=None):
+        """ Removes repeated positions, keeping the largest of their values if values is given. """
+        if not len(X):
+            return (X, Y, Z) if values is None else (X, Y, Z, values)
+        keys = self.keys(X, Y, Z)
+        if values is None:
+            order = argsort(keys, kind='mergesort')
+        else:
+            order = lexsort((values, keys))
+        sortedKeys = keys[order]
+        last = order[concatenate((sortedKeys[1:] != sortedKeys[:-1], [True]))]
+        if values is None:
+            return X[last], Y[last], Z[last]
+        return X[last], Y[last], Z[last], values[last]
+
+    def findUnsettled(self, cx, cz, xs=slice(0, 16), zs=slice(0, 16), ys=None):
+        """ Compares the light of part of a chunk with what its neighbors and its seed give it. Returns the world
+        positions of the blocks that are too bright, their light, and the blocks that are too dark, their new light.
+        """
+        chunk, light, absorption, seed = self.entry(cx, cz)
+        height = self.height
+
+        padded = zeros((18, 18, height + 2), int16)
+        padded[1:17, 1:17, 1:height + 1] = light
+        for (dx, dz), faceXs, faceZs in _faces:
+            neighbor = self.entry(cx + dx, cz + dz)
+            if neighbor is None:
+                continue
+            neighborLight = neighbor[1]
+            # the neighbor's face touching this chunk is on its opposite side
+            neighborXs = slice(15 - faceXs.start, 16 - faceXs.start) if dx else faceXs
+            neighborZs = slice(15 - faceZs.start, 16 - faceZs.start) if dz else faceZs
+            padded[1 + dx + faceXs.start:1 + dx + faceXs.stop, 1 + dz + faceZs.start:1 + dz + faceZs.stop,
+                   1:height + 1] = neighborLight[neighborXs, neighborZs]
+
+        x0, x1 = xs.start, xs.stop
+        z0, z1 = zs.start, zs.stop
+        if ys is None:
+            ys = slice(0, height)
+        y0, y1 = ys.start, ys.stop
+        brightest = padded[x0:x1, 1 + z0:1 + z1, 1 + y0:1 + y1].copy()
+        maximum(brightest, padded[x0 + 2:x1 + 2, 1 + z0:1 + z1, 1 + y0:1 + y1], brightest)
+        maximum(brightest, padded[x0 + 1:x1 + 1, z0:z1, 1 + y0:1 + y1], brightest)
+        maximum(brightest, padded[x0 + 1:x1 + 1, z0 + 2:z1 + 2, 1 + y0:1 + y1], brightest)
+        maximum(brightest, padded[x0 + 1:x1 + 1, 1 + z0:1 + z1, y0:y1], brightest)
+        maximum(brightest, padded[x0 + 1:x1 + 1, 1 + z0:1 + z1, 2 + y0:2 + y1], brightest)
+
+        brightest -= absorption[xs, zs, ys]
+        expected = maximum(brightest, seed[xs, zs, ys])
+        current = padded[x0 + 1:x1 + 1, 1 + z0:1 + z1, 1 + y0:1 + y1]
+
+        def positions(mask):
+            x, z, y = mask.nonzero()
+            return ((x.astype(int64) + x0 + (cx << 4), y.astype(int64) + y0, z.astype(int64) + z0 + (cz << 4)),
+                    mask)
+
+        tooBright, brightMask = positions(current > expected)
+        tooDark, darkMask = positions(current < expected)
+        return tooBright, current[brightMask], tooDark, expected[darkMask]
+
+
+def _neighbors(X, Y, Z, values):
+    # the six neighbors of each position, each carrying the value of the position it came from
+    return (concatenate([X + dx for dx, dy, dz in _directions]),
+            concatenate([Y + dy for dx, dy, dz in _directions]),
+            concatenate([Z + dz for dx, dy, dz in _directions]),
+            concatenate([values] * len(_directions)))
+
+
+def _concatenatePositions(parts):
+    parts = [p for p in parts if len(p[0])]
+    if not parts:
+        empty = zeros(0, int64)
+        return empty, empty, empty
+    return tuple(concatenate([p[i] for p in parts]) for i in range(3))
+
+
+def _changedRegion(lightChanges, lightName, height):
+    # the (xs, zs, ys) box around the blocks whose light may disagree with their neighbors, or None. xs and zs may
+    # reach one block into the neighboring chunks.
+    minY = lightChanges[..., 0]
+    maxY = lightChanges[..., 1]
+    columns = maxY > minY
+    if not columns.any():
+        return None
+    x = flatnonzero(columns.any(axis=1))
+    z = flatnonzero(columns.any(axis=0))
+    # the sky light was reset all the way down the column
+    y0 = 0 if lightName == "SkyLight" else max(0, int(minY[columns].min()) - 1)
+    y1 = min(height, int(maxY[columns].max()) + 1)
+    return slice(x[0] - 1, x[-1] + 2), slice(z[0] - 1, z[-1] + 2), slice(y0, y1)
+
+
+def queueLightsIter(level, chunkPositions):
+    """ Relights the given chunks of level using light queues. Yields (done, total, info) progress tuples. """
+    chunks = []
+    for cPos in chunkPositions:
+        try:
+            chunks.append(level.getChunk(*cPos))
+        except (ChunkNotPresent, ChunkMalformed):
+            continue
+
+    # chunk positions mapped to the lightChanges of the chunks relit only in part, or None
+    lightChanges = {}
+    for chunk in chunks:
+        lightChanges[chunk.chunkPosition] = chunk.lightChanges if chunk.needsLighting else None
+        chunk.generateHeightMap()
+        chunk.dirty = True
+
+    if level.dimNo in (-1, 1):
+        lights = ("BlockLight",)
+    else:
+        lights = ("BlockLight", "SkyLight")
+
+    # the parts of each chunk to search: None for all of it, or (xs, zs, ys) for each light
+    regions = {}
+    for cPos, changes in lightChanges.iteritems():
+        if changes is not None:
+            regions[cPos] = dict((light, _changedRegion(changes, light, level.Height)) for light in lights)
+
+    # faces of neighboring chunks that may have been lit by the dirty chunks, for each light
+    borderFaces = dict((light, []) for light in lights)
+    for cx, cz in sorted(lightChanges):
+        for (dx, dz), faceXs, faceZs in _faces:
+            neighbor = (cx + dx, cz + dz)
+            if neighbor in lightChanges and lightChanges[neighbor] is None:
+                continue
+            # the face of the neighbor is on its side opposite this chunk's face
+            xs = slice(15 - faceXs.start, 16 - faceXs.start) if dx else faceXs
+            zs = slice(15 - faceZs.start, 16 - faceZs.start) if dz else faceZs
+            for light in lights:
+                if (cx, cz) not in regions:
+                    borderFaces[light].append((neighbor, xs, zs, None))
+                    continue
+                region = regions[cx, cz][light]
+                if region is None:
+                    continue
+                regionXs, regionZs, ys = region
+                # only the faces the region reaches into
+                if (dx < 0 and regionXs.start < 0 or dx > 0 and regionXs.stop > 16 or
+                        dz < 0 and regionZs.start < 0 or dz > 0 and regionZs.stop > 16):
+                    borderFaces[light].append((neighbor, xs, zs, ys))
+
+    workTotal = len(chunks) * len(lights) + sum(len(faces) for faces in borderFaces.itervalues()) + 32 * len(lights)
+    workDone = 0
+
+    for light in lights:
+        volume = _LightVolume(level, light)
+        progressInfo = u"{0}: finding changed blocks in {1} chunks".format(light, len(chunks))
+        log.info(progressInfo)
+
+        brightParts = []
+        darkParts = []
+
+        def collect((cx, cz), xs=slice(0, 16), zs=slice(0, 16), ys=None):
+            if volume.entry(cx, cz) is None:
+                return
+            tooBright, brightLight, tooDark, darkLight = volume.findUnsettled(cx, cz, xs, zs, ys)
+            if len(brightLight):
+                brightParts.append(tooBright + (brightLight,))
+            if len(darkLight):
+                darkParts.append(tooDark + (darkLight,))
+
+        for chunk in chunks:
+            cPos = chunk.chunkPosition
+            if cPos not in regions:
+                collect(cPos)
+            elif regions[cPos][light] is not None:
+                xs, zs, ys = regions[cPos][light]
+                collect(cPos, slice(max(0, xs.start), min(16, xs.stop)), slice(max(0, zs.start), min(16, zs.stop)), ys)
+            workDone += 1
+            yield workDone, workTotal, progressInfo
+
+        for cPos, xs, zs, ys in borderFaces[light]:
+            collect(cPos, xs, zs, ys)
+            workDone += 1
+            yield workDone, workTotal, progressInfo
+
+        # Raise the blocks that are too dark first. If their light came from a block that is too bright, the
+        # decrease queue will find them again.
+        increases = []
+        if darkParts:
+            X, Y, Z, values = (concatenate([p[i] for p in darkParts]) for i in range(4))
+            volume.store(X, Y, Z, values)
+            increases.append((X, Y, Z))
+
+        # Decrease queue: darken each block whose light could have come from a darkened block. Brighter blocks
+        # around the darkened area are lit from elsewhere, so they are spread again by the increase queue.
+        if brightParts:
+            X, Y, Z, values = (concatenate([p[i] for p in brightParts]) for i in range(4))
+            X, Y, Z, values = volume.unique(X, Y, Z, values)
+            present, current, absorption, seed = volume.lookup(X, Y, Z)
+            volume.store(X, Y, Z, seed)
+            increases.append((X[seed > 0], Y[seed > 0], Z[seed > 0]))
+
+            step = 0
+            while len(X):
+                progressInfo = u"{0}: darkening {1} blocks".format(light, len(X))
+                NX, NY, NZ, sourceLight = _neighbors(X, Y, Z, values)
+                present, current, absorption, seed = volume.lookup(NX, NY, NZ)
+
+                brighter = flatnonzero(present & (current >= sourceLight) & (current > 0))
+                increases.append((NX[brighter], NY[brighter], NZ[brighter]))
+
+                darker = flatnonzero(present & (current < sourceLight) & (current > 0))
+                X, Y, Z, values = volume.unique(NX[darker], NY[darker], NZ[darker], current[darker])
+                if len(X):
+                    seed = volume.lookup(X, Y, Z)[3]
+                    volume.store(X, Y, Z, seed)
+                    increases.append((X[seed > 0], Y[seed > 0], Z[seed > 0]))
+
+                step += 1
+                workDone += 1
+                yield workDone, workTotal + step, progressInfo
+
+        # Increase queue: spread light from every raised or surviving block until nothing gets brighter.
+        X, Y, Z = _concatenatePositions(increases)
+        if len(X):
+            X, Y, Z = volume.unique(X, Y, Z)
+        values = volume.lookup(X, Y, Z)[1]
+        step = 0
+        while len(X):
+            spreading = flatnonzero(values > 1)
+            progressInfo = u"{0}: spreading {1} blocks".format(light, len(spreading))
+            NX, NY, NZ, sourceLight = _neighbors(X[spreading], Y[spreading], Z[spreading], values[spreading])
+            present, current, absorption, seed = volume.lookup(NX, NY, NZ)
+            newLight = sourceLight - absorption
+
+            brighter = flatnonzero(present & (newLight > current))
+            X, Y, Z, values = volume.unique(NX[brighter], NY[brighter], NZ[brighter], newLight[brighter])
+            volume.store(X, Y, Z, values)
+
+            step += 1
+            workDone += 1
+            yield workDone, workTotal + step, progressInfo
+
+        log.info(u"{0}: changed light in {1} chunks".format(light, len(volume.changedChunks)))
+
+    for chunk in chunks:
+        chunk.needsLighting = False
+
+
+class _TileChunk(object):
+    """ A chunk of a tile in a worker process, with arrays in shared memory """
+
+    def __init__(self, chunkPosition, Blocks, BlockLight, SkyLight):
+        self.chunkPosition = chunkPosition
+        self.Blocks = Blocks
+        self.BlockLight = BlockLight
+        self.SkyLight = SkyLight
+        self.dirty = False
+        self.needsLighting = False
+        self.lightChanges = None
+
+    def generateHeightMap(self):
+        # the level's chunk keeps the height map
+        pass
+
+
+class _TileMaterials(object):
+    def __init__(self, lightAbsorption, lightEmission):
+        self.lightAbsorption = lightAbsorption
+        self.lightEmission = lightEmission
+
+
+class _TileLevel(object):
+    """ The part of a level a worker process lights: a tile of chunks and the rings of chunks around it """
+
+    def __init__(self, chunks, height, dimNo, materials):
+        self.chunks = chunks
+        self.Height = height
+        self.dimNo = dimNo
+        self.materials = materials
+
+    def getChunk(self, cx, cz):
+        try:
+            return self.chunks[cx, cz]
+        except KeyError:
+            raise ChunkNotPresent((cx, cz))
+
+
+_tileWorld = None
+
+
+def _initTileWorker(blocks, blockLight, skyLight, height, dimNo, lightAbsorption, lightEmission):
+    global _tileWorld
+    shape = (-1, 16, 16, height)
+    _tileWorld = (frombuffer(blocks, 'uint16').reshape(shape),
+                  frombuffer(blockLight, 'uint8').reshape(shape),
+                  frombuffer(skyLight, 'uint8').reshape(shape),
+                  height, dimNo, _TileMaterials(lightAbsorption, lightEmission))
+
+
+def _lightTile((slots, dirtyPositions, lightChanges)):
+    """ Lights one tile in a worker process. slots maps chunk positions to their index in the shared arrays,
+    lightChanges maps the positions of the chunks relit only in part to their lightChanges.
+    Returns the positions of the chunks whose light changed. """
+    blocks, blockLight, skyLight, height, dimNo, materials = _tileWorld
+    chunks = dict((cPos, _TileChunk(cPos, blocks[slot], blockLight[slot], skyLight[slot]))
+                  for cPos, slot in slots.iteritems())
+    for cPos, changes in lightChanges.iteritems():
+        chunks[cPos].needsLighting = True
+        chunks[cPos].lightChanges = changes
+    for _ in queueLightsIter(_TileLevel(chunks, height, dimNo, materials), dirtyPositions):
+        pass
+    return [cPos for cPos, chunk in chunks.iteritems() if chunk.dirty]
+
+
+def _ring(positions, distance):
+    return set((cx + dx, cz + dz)
+               for cx, cz in positions
+               for dx, dz in itertools.product(xrange(-distance, distance + 1), repeat=2))
+
+
+def parallelLightsIter(level, chunkPositions, workers, tileSize=8):
+    """ Relights the given chunks of level like queueLightsIter, using that many worker processes.
+    Yields (done, total, info) progress tuples. """
+    chunks = {}
+    for cPos in chunkPositions:
+        try:
+            chunks[cPos] = level.getChunk(*cPos)
+        except (ChunkNotPresent, ChunkMalformed):
+            continue
+
+    for chunk in chunks.itervalues():
+        chunk.generateHeightMap()
+        chunk.dirty = True
+
+    tiles = {}
+    for cx, cz in chunks:
+        tiles.setdefault((cx // tileSize, cz // tileSize), []).append((cx, cz))
+    tiles = sorted(tiles.iteritems())
+    if not tiles:
+        return
+
+    # Each chunk that may change belongs to one tile: its own, or the first tile next to it.
+    owners = {}
+    for tilePos, dirtyPositions in tiles:
+        for cPos in dirtyPositions:
+            owners[cPos] = tilePos
+    for tilePos, dirtyPositions in tiles:
+        for cPos in _ring(dirtyPositions, 1):
+            owners.setdefault(cPos, tilePos)
+
+    def present(cPos):
+        if cPos not in chunks:
+            try:
+                chunks[cPos] = level.getChunk(*cPos)
+            except (ChunkNotPresent, ChunkMalformed):
+                chunks[cPos] = None
+        return chunks[cPos] is not None
+
+    tileSlots = []
+    slotCount = 0
+    for tilePos, dirtyPositions in tiles:
+        slots = {}
+        for cPos in sorted(_ring(dirtyPositions, 2)):
+            if present(cPos):
+                slots[cPos] = slotCount
+                slotCount += 1
+        tileSlots.append(slots)
+
+    height = level.Height
+    chunkSize = 16 * 16 * height
+    sharedBlocks = multiprocessing.RawArray(ctypes.c_uint16, slotCount * chunkSize)
+    sharedBlockLight = multiprocessing.RawArray(ctypes.c_uint8, slotCount * chunkSize)
+    sharedSkyLight = multiprocessing.RawArray(ctypes.c_uint8, slotCount * chunkSize)
+    shape = (slotCount, 16, 16, height)
+    blocks = frombuffer(sharedBlocks, 'uint16').reshape(shape)
+    blockLight = frombuffer(sharedBlockLight, 'uint8').reshape(shape)
+    skyLight = frombuffer(sharedSkyLight, 'uint8').reshape(shape)
+
+    for slots in tileSlots:
+        for cPos, slot in slots.iteritems():
+            chunk = chunks[cPos]
+            blocks[slot] = chunk.Blocks
+            blockLight[slot] = chunk.BlockLight
+            skyLight[slot] = chunk.SkyLight
+
+    workTotal = len(tiles) * 2
+    progressInfo = u"Lighting {0} chunks in {1} tiles".format(len(chunkPositions), len(tiles))
+    log.info(progressInfo)
+
+    pool = multiprocessing.Pool(workers, _initTileWorker,
+                                (sharedBlocks, sharedBlockLight, sharedSkyLight, height, level.dimNo,
+                                 level.materials.lightAbsorption, level.materials.lightEmission))
+    try:
+        tasks = []
+        for slots, (tilePos, dirtyPositions) in zip(tileSlots, tiles):
+            lightChanges = dict((cPos, chunks[cPos].lightChanges) for cPos in dirtyPositions
+                                if chunks[cPos].needsLighting and chunks[cPos].lightChanges is not None)
+            tasks.append((slots, dirtyPositions, lightChanges))
+        for i, (tileIndex, changedPositions) in enumerate(
+                pool.imap_unordered(_indexedTile, enumerate(tasks))):
+            tilePos = tiles[tileIndex][0]
+            slots = tileSlots[tileIndex]
+            for cPos in changedPositions:
+                if owners.get(cPos) != tilePos:
+                    continue
+                chunk = chunks[cPos]
+                slot = slots[cPos]
+                chunk.BlockLight[:] = blockLight[slot]
+                chunk.SkyLight[:] = skyLight[slot]
+                chunk.dirty = True
+            yield i + 1, workTotal, progressInfo
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    for tilePos, dirtyPositions in tiles:
+        for cPos in dirtyPositions:
+            chunks[cPos].needsLighting = False
+
+    # Chunks next to a chunk from another tile, or next to one no tile changed, may disagree with it.
+    seams = [cPos for cPos, tilePos in owners.iteritems()
+             if chunks.get(cPos) is not None and
+             any(owners.get((cPos[0] + dx, cPos[1] + dz)) != tilePos for (dx, dz), xs, zs in _faces)]
+    log.info(u"Settling light along {0} chunks of tile seams".format(len(seams)))
+    for done, total, info in queueLightsIter(level, sorted(seams)):
+        yield len(tiles) + done * len(tiles) / max(total, 1), workTotal, info
+
+
+def _indexedTile((index, task)):
+    return index, _lightTile(task)
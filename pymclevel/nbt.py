@@ -217,14 +217,18 @@ class TAG_Byte_Array(TAG_Value):
     def load_from(cls, ctx):
         data = ctx.data[ctx.offset:]
         (string_len,) = TAG_Int.fmt.unpack_from(data)
-        value = fromstring(data[4:string_len * cls.dtype.itemsize + 4], cls.dtype)
-        self = cls(value)
+        if ctx.views:
+            self = cls()
+            # bypass the value setter, which copies
+            self._value = data[4:string_len * cls.dtype.itemsize + 4].view(cls.dtype)
+        else:
+            self = cls(fromstring(data[4:string_len * cls.dtype.itemsize + 4], cls.dtype))
         ctx.offset += string_len * cls.dtype.itemsize + 4
         return self
 
     def write_value(self, buf):
-        value_str = self.value.tostring()
-        buf.write(struct.pack(">I%ds" % (len(value_str),), self.value.size, value_str))
+        buf.write(struct.pack(">I", self.value.size))
+        buf.write(buffer(numpy.ascontiguousarray(self.value)))
 
 
 class TAG_Int_Array(TAG_Byte_Array):
@@ -298,6 +302,71 @@ def write_string(string, buf):
     buf.write(struct.pack(">h%ds" % (len(encoded),), len(encoded), encoded))
 
 
+class StreamBuffer(object):
+    """ Collects the small writes of a tag being saved and passes them to a write function in pieces. Writes of at
+    least directSize bytes, like the buffers of large arrays, are passed on as they are. """
+
+    bufferSize = 65536
+    directSize = 1024
+
+    def __init__(self, write):
+        self._write = write
+        self._pieces = []
+        self._size = 0
+
+    def write(self, data):
+        if len(data) >= self.directSize:
+            self.flush()
+            self._write(data)
+            return
+
+        self._pieces.append(str(data))
+        self._size += len(data)
+        if self._size >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        if self._pieces:
+            self._write("".join(self._pieces))
+            self._pieces = []
+            self._size = 0
+
+
+def skip_tag(tag_type, ctx):
+    """ Moves ctx past a tag's value without loading it """
+    if tag_type == TAG_COMPOUND:
+        while True:
+            tag_type = ctx.data[ctx.offset]
+            ctx.offset += 1
+            if tag_type == 0:
+                return
+            (name_len,) = string_len_fmt.unpack_from(ctx.data, ctx.offset)
+            ctx.offset += name_len + 2
+            skip_tag(tag_type, ctx)
+
+    tag_class = tag_classes.get(tag_type)
+    if tag_class is None:
+        raise NBTFormatError("Unknown tag type {0} at offset {1}".format(tag_type, ctx.offset))
+
+    if tag_type == TAG_LIST:
+        list_type = ctx.data[ctx.offset]
+        (list_length,) = TAG_Int.fmt.unpack_from(ctx.data, ctx.offset + 1)
+        ctx.offset += 1 + TAG_Int.fmt.size
+        if list_type in (TAG_BYTE, TAG_SHORT, TAG_INT, TAG_LONG, TAG_FLOAT, TAG_DOUBLE):
+            ctx.offset += tag_classes[list_type].fmt.size * list_length
+        else:
+            for i in xrange(list_length):
+                skip_tag(list_type, ctx)
+    elif tag_type == TAG_STRING:
+        (string_len,) = string_len_fmt.unpack_from(ctx.data, ctx.offset)
+        ctx.offset += string_len + 2
+    elif issubclass(tag_class, TAG_Byte_Array):
+        (array_len,) = TAG_Int.fmt.unpack_from(ctx.data, ctx.offset)
+        ctx.offset += array_len * tag_class.dtype.itemsize + 4
+    else:
+        ctx.offset += tag_class.fmt.size
+
+
 # noinspection PyMissingConstructor
 
 
@@ -334,6 +403,7 @@ class TAG_Compound(TAG_Value, collections.MutableMapping):
     @classmethod
     def load_from(cls, ctx):
         self = cls()
+        selection = ctx.selection
         while ctx.offset < len(ctx.data):
             tag_type = ctx.data[ctx.offset]
             ctx.offset += 1
@@ -342,7 +412,13 @@ class TAG_Compound(TAG_Value, collections.MutableMapping):
                 break
 
             tag_name = load_string(ctx)
+            if selection is not None:
+                if tag_name not in selection:
+                    skip_tag(tag_type, ctx)
+                    continue
+                ctx.selection = selection[tag_name]
             tag = tag_classes[tag_type].load_from(ctx)
+            ctx.selection = selection
             tag.name = tag_name
 
             self._value.append(tag)
@@ -355,32 +431,50 @@ class TAG_Compound(TAG_Value, collections.MutableMapping):
 
         Pass a filename to save the data to a file. Pass a file-like object (with a read() method)
         to write the data to that object. Pass nothing to return the data as a string.
+        The data is compressed while it is serialized, so the uncompressed data is never held in memory at once.
         """
-        if self.name is None:
-            self.name = ""
-
-        buf = StringIO()
-        self.write_tag(buf)
-        self.write_name(buf)
-        self.write_value(buf)
-        data = buf.getvalue()
+        if filename_or_buf is None or isinstance(filename_or_buf, basestring):
+            # a file is only opened once all of its data is ready, so an error cannot leave it half written
+            out = StringIO()
+        else:
+            out = filename_or_buf
 
         if compressed:
-            gzio = StringIO()
-            gz = gzip.GzipFile(fileobj=gzio, mode='wb')
-            gz.write(data)
+            gz = gzip.GzipFile(filename="", fileobj=out, mode='wb')
+            self.stream(gz.write)
             gz.close()
-            data = gzio.getvalue()
+        else:
+            self.stream(out.write)
 
         if filename_or_buf is None:
-            return data
+            return out.getvalue()
 
         if isinstance(filename_or_buf, basestring):
             f = open(filename_or_buf, "wb")
-            f.write(data)
+            f.write(out.getvalue())
             f.close()
-        else:
-            filename_or_buf.write(data)
+
+    def stream(self, write):
+        """
+        Serializes this tag as a root tag, passing the data to write() in pieces. Large arrays are passed as buffers
+        of their own memory without being copied.
+        """
+        if self.name is None:
+            self.name = ""
+
+        buf = StreamBuffer(write)
+        self.write_tag(buf)
+        self.write_name(buf)
+        self.write_value(buf)
+        buf.flush()
+
+    def save_deflated(self, level=6):
+        """ Returns the data of this tag as a root tag, compressed with zlib as in region files """
+        compressor = zlib.compressobj(level)
+        pieces = []
+        self.stream(lambda data: pieces.append(compressor.compress(data)))
+        pieces.append(compressor.flush())
+        return "".join(pieces)
 
     def write_value(self, buf):
         for tag in self.value:
@@ -554,11 +648,17 @@ def try_gunzip(data):
     return data
 
 
-def load(filename="", buf=None):
+def load(filename="", buf=None, views=False, paths=None):
     """
     Unserialize data from an NBT file and return the root TAG_Compound object. If filename is passed,
     reads from the file, otherwise uses data from buf. Buf can be a buffer object with a read() method or a string
     containing NBT data.
+    If views is True, the values of array tags are numpy arrays viewing one writable copy of the whole buffer instead
+    of a copy each. The buffer is kept alive by those arrays, and each array only covers its own tag's bytes.
+    If paths is given, only the tags named by those paths are loaded, with everything inside them, and the other
+    tags are skipped without being parsed. Paths are tag names separated by slashes, starting below the root tag,
+    like "Level/xPos". A path going through a list applies to each of its items, so "Level/Entities/id" loads the
+    Entities list with only the id of each entity.
     """
     if filename:
         buf = open(filename, "rb")
@@ -567,7 +667,7 @@ def load(filename="", buf=None):
     if hasattr(buf, "read"):
         data = buf.read()
 
-    result = _load_buffer(try_gunzip(data))
+    result = _load_buffer(try_gunzip(data), views, paths)
 
     if hasattr(buf, "close"):
         buf.close()
@@ -579,9 +679,30 @@ class load_ctx(object):
     pass
 
 
-def _load_buffer(buf):
+def path_selection(paths):
+    """ Turns load's paths into nested dicts mapping tag names to the selection inside that tag, or to None to load
+    the whole tag """
+    if paths is None:
+        return None
+    selection = {}
+    for path in paths:
+        names = path.split("/")
+        node = selection
+        for name in names[:-1]:
+            child = node.setdefault(name, {})
+            if child is None:
+                break
+            node = child
+        else:
+            node[names[-1]] = None
+    return selection
+
+
+def _load_buffer(buf, views=False, paths=None):
     if isinstance(buf, str):
         buf = fromstring(buf, 'uint8')
+    elif views:
+        buf = array(buf, 'uint8')
     data = buf
 
     if not len(data):
@@ -596,6 +717,8 @@ def _load_buffer(buf):
     ctx = load_ctx()
     ctx.offset = 1
     ctx.data = data
+    ctx.views = views
+    ctx.selection = path_selection(paths)
 
     tag_name = load_string(ctx)
     tag = TAG_Compound.load_from(ctx)
@@ -629,12 +752,12 @@ def littleEndianNBT():
         buf.write(struct.pack(">h%ds" % (len(encoded),), len(encoded), encoded))
 
     def override_byte_array_write_value(self, buf):
-        value_str = self.value.tostring()
-        buf.write(struct.pack("<I%ds" % (len(value_str),), self.value.size, value_str))
+        buf.write(struct.pack("<I", self.value.size))
+        buf.write(buffer(numpy.ascontiguousarray(self.value)))
 
     def reset_byte_array_write_value(self, buf):
-        value_str = self.value.tostring()
-        buf.write(struct.pack(">I%ds" % (len(value_str),), self.value.size, value_str))
+        buf.write(struct.pack(">I", self.value.size))
+        buf.write(buffer(numpy.ascontiguousarray(self.value)))
 
     global string_len_fmt
     string_len_fmt = struct.Struct("<H")
@@ -690,6 +813,9 @@ def nested_string(tag, indent_string="  ", indent=0):
     return result
 
 
+# True when the Cython implementation in _nbt.pyx is used instead of the pure Python one above
+CYTHON = False
+
 try:
     # noinspection PyUnresolvedReferences
     # Inhibit the _nbt import if we're debugging the PE support errors, because we need to get information concerning NBT malformed data...
@@ -699,6 +825,7 @@ try:
         from _nbt import (load, TAG_Byte, TAG_Short, TAG_Int, TAG_Long, TAG_Float, TAG_Double, TAG_String,
                           TAG_Byte_Array, TAG_List, TAG_Compound, TAG_Int_Array, TAG_Long_Array, TAG_Short_Array, NBTFormatError,
                           littleEndianNBT, nested_string, gunzip, hexdump)
+        CYTHON = True
 except ImportError as err:
     log.error("Failed to import Cythonized nbt file. Running on (very slow) pure-python nbt fallback.")
     log.error("(Did you forget to run 'setup.py build_ext --inplace'?)")
@@ -1,31 +1,233 @@
+from bisect import bisect_left, insort
+import collections
 import logging
+import mmap
 import os
 import struct
 import zlib
 
-from numpy import fromstring
+from numpy import concatenate, diff, flatnonzero, fromstring, int8, zeros
 import time
+import weakref
 from mclevelbase import notclosing, RegionMalformed, ChunkNotPresent
 import nbt
 
+try:
+    import lz4.block as lz4
+except ImportError:
+    lz4 = None
+
 log = logging.getLogger(__name__)
 
 __author__ = 'Rio'
 
 
-def deflate(data):
-    return zlib.compress(data, 2)
+def deflate(data, level=2):
+    return zlib.compress(data, level)
 
 
 def inflate(data):
     return zlib.decompress(data)
 
 
+class SectorAllocator(object):
+    """ Tracks which sectors of a region file are in use. Sectors are kept in a numpy bool array, and the runs of free
+    sectors are indexed both by start sector and by (length, start) so that allocate() can find the best fitting run
+    with a bisect instead of scanning every sector.
+
+    reserve() only marks the bitmap, for use while reading an offset table; the run index is rebuilt the next time
+    it is needed.
+    """
+
+    def __init__(self, sectorCount, reservedSectors=2):
+        self.used = zeros(sectorCount, bool)
+        self.used[:reservedSectors] = True
+        self._runStarts = []  # sorted start sectors of the free runs
+        self._runLengths = {}  # maps start sector to run length
+        self._runsBySize = []  # sorted (length, start) pairs
+        self._indexed = False
+
+    @property
+    def sectorCount(self):
+        return len(self.used)
+
+    @property
+    def usedCount(self):
+        return int(self.used.sum())
+
+    def isFree(self, sector):
+        return sector < len(self.used) and not self.used[sector]
+
+    def freeRuns(self):
+        """ Returns a list of (start, length) pairs, one for each run of free sectors, ordered by start sector """
+        self._index()
+        return [(start, self._runLengths[start]) for start in self._runStarts]
+
+    def reserve(self, start, count):
+        """ Marks the sectors as used and returns True if any of them were already in use or are past the end of the
+        file. """
+        end = min(start + count, len(self.used))
+        overlaps = start + count > end or self.used[start:end].any()
+        self.used[start:end] = True
+        self._indexed = False
+        return overlaps
+
+    def free(self, start, count):
+        if count == 0:
+            return
+        self._index()
+        self.used[start:start + count] = False
+        end = start + count
+
+        # merge with the free runs on either side
+        i = bisect_left(self._runStarts, start)
+        if i > 0:
+            prevStart = self._runStarts[i - 1]
+            if prevStart + self._runLengths[prevStart] == start:
+                start = prevStart
+                self._removeRun(prevStart)
+        if end in self._runLengths:
+            nextEnd = end + self._runLengths[end]
+            self._removeRun(end)
+            end = nextEnd
+
+        self._addRun(start, end - start)
+
+    def allocate(self, count):
+        """ Marks count sectors as used and returns the first one. Uses the smallest free run that is large enough,
+        or extends the end of the file if there isn't one. Check sectorCount afterward to see if the file must grow.
+        """
+        self._index()
+        i = bisect_left(self._runsBySize, (count, -1))
+        if i < len(self._runsBySize):
+            length, start = self._runsBySize[i]
+            self._removeRun(start)
+            if length > count:
+                self._addRun(start + count, length - count)
+        else:
+            start = len(self.used)
+            if self._runStarts:
+                # a free run at the end of the file only needs to grow by the difference
+                lastStart = self._runStarts[-1]
+                if lastStart + self._runLengths[lastStart] == start:
+                    start = lastStart
+                    self._removeRun(lastStart)
+            if start + count > len(self.used):
+                self.used = concatenate((self.used, zeros(start + count - len(self.used), bool)))
+
+        self.used[start:start + count] = True
+        return start
+
+    def allocateMany(self, counts):
+        """ Allocates a run for each of the given sector counts, largest first so that the big runs get the best fit.
+        Whatever doesn't fit in the free runs is placed in one contiguous block at the end of the file. Returns the
+        start sectors in the same order as counts. """
+        starts = [None] * len(counts)
+        overflow = []
+        self._index()
+        for i in sorted(range(len(counts)), key=lambda i: -counts[i]):
+            count = counts[i]
+            j = bisect_left(self._runsBySize, (count, -1))
+            if j < len(self._runsBySize):
+                length, start = self._runsBySize[j]
+                self._removeRun(start)
+                if length > count:
+                    self._addRun(start + count, length - count)
+                self.used[start:start + count] = True
+                starts[i] = start
+            else:
+                overflow.append(i)
+
+        for i in sorted(overflow):
+            starts[i] = self.allocate(counts[i])
+
+        return starts
+
+    def _addRun(self, start, length):
+        insort(self._runStarts, start)
+        self._runLengths[start] = length
+        insort(self._runsBySize, (length, start))
+
+    def _removeRun(self, start):
+        length = self._runLengths.pop(start)
+        del self._runStarts[bisect_left(self._runStarts, start)]
+        del self._runsBySize[bisect_left(self._runsBySize, (length, start))]
+
+    def _index(self):
+        if self._indexed:
+            return
+        edges = diff(concatenate(([0], (~self.used).view(int8), [0])))
+        starts = flatnonzero(edges == 1)
+        lengths = flatnonzero(edges == -1) - starts
+
+        self._runStarts = [int(start) for start in starts]
+        self._runLengths = dict(zip(self._runStarts, (int(length) for length in lengths)))
+        self._runsBySize = sorted((length, start) for start, length in self._runLengths.iteritems())
+        self._indexed = True
+
+
+class RegionFileCache(object):
+    """ Bounded LRU of the region files whose file handle and memory map are currently held open. Opening a region
+    file that is not in the cache may close the least recently used one; it is transparently reopened on its next
+    access.
+
+    Region files are held by weak reference, so a region file whose level was never closed is still collected, and
+    its handles closed, once nothing else refers to it.
+    """
+
+    def __init__(self, limit=32):
+        self.limit = limit
+        self._regionFiles = collections.OrderedDict()  # maps id(regionFile) to a weak reference to it
+
+    def __len__(self):
+        return len(self._regionFiles)
+
+    def __contains__(self, regionFile):
+        return id(regionFile) in self._regionFiles
+
+    def touch(self, regionFile):
+        key = id(regionFile)
+        ref = self._regionFiles.pop(key, None)
+        if ref is None:
+            ref = weakref.ref(regionFile, lambda ref: self._collected(key, ref))
+        self._regionFiles[key] = ref
+
+        while len(self._regionFiles) > max(1, self.limit):
+            _, oldest = self._regionFiles.popitem(last=False)
+            oldest = oldest()
+            if oldest is not None:
+                oldest._closeHandles()
+
+    def _collected(self, key, ref):
+        if self._regionFiles.get(key) is ref:
+            del self._regionFiles[key]
+
+    def discard(self, regionFile):
+        self._regionFiles.pop(id(regionFile), None)
+
+    def clear(self):
+        while self._regionFiles:
+            _, regionFile = self._regionFiles.popitem()
+            regionFile = regionFile()
+            if regionFile is not None:
+                regionFile._closeHandles()
+
+
+openRegionFiles = RegionFileCache()
+
+
 class MCRegionFile(object):
     holdFileOpen = False  # if False, reopens and recloses the file on each access
+    useMmap = True  # if True, keeps the file open and memory-mapped while it is in openRegionFiles
+
+    _file = None
+    _map = None
 
     @property
     def file(self):
+        if MCRegionFile.useMmap:
+            return notclosing(self._openFile())
+
         openfile = lambda: open(self.path, "rb+")
         if MCRegionFile.holdFileOpen:
             if self._file is None:
@@ -34,11 +236,37 @@ class MCRegionFile(object):
         else:
             return openfile()
 
-    def close(self):
-        if MCRegionFile.holdFileOpen:
+    def _openFile(self):
+        if self._file is None:
+            # unbuffered, so that writes are immediately visible through the memory map
+            self._file = open(self.path, "rb+", 0)
+        openRegionFiles.touch(self)
+        return self._file
+
+    def _getMap(self):
+        """ Returns a read-only memory map covering every sector of the file, remapping it if the file has grown. """
+        f = self._openFile()
+        size = self.sectors.sectorCount * self.SECTOR_BYTES
+        if self._map is None or len(self._map) < size:
+            self._unmap()
+            self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _closeHandles(self):
+        self._unmap()
+        if self._file is not None:
             self._file.close()
             self._file = None
 
+    def close(self):
+        openRegionFiles.discard(self)
+        self._closeHandles()
+
     def __del__(self):
         self.close()
 
@@ -46,6 +274,7 @@ class MCRegionFile(object):
         self.path = path
         self.regionCoords = regionCoords
         self._file = None
+        self._map = None
         if not os.path.exists(path):
             open(path, "w").close()
 
@@ -63,27 +292,23 @@ class MCRegionFile(object):
             offsetsData = f.read(self.SECTOR_BYTES)
             modTimesData = f.read(self.SECTOR_BYTES)
 
-            self.freeSectors = [True] * (filesize / self.SECTOR_BYTES)
-            self.freeSectors[0:2] = False, False
+            self.sectors = SectorAllocator(filesize / self.SECTOR_BYTES)
 
             self.offsets = fromstring(offsetsData, dtype='>u4')
             self.modTimes = fromstring(modTimesData, dtype='>u4')
 
         needsRepair = False
 
-        for offset in self.offsets:
-            sector = offset >> 8
-            count = offset & 0xff
+        for offset in self.offsets[self.offsets > 0]:
+            sector = int(offset >> 8)
+            count = int(offset & 0xff)
 
-            for i in xrange(sector, sector + count):
-                if i >= len(self.freeSectors):
-                    # raise RegionMalformed("Region file offset table points to sector {0} (past the end of the file)".format(i))
-                    print "Region file offset table points to sector {0} (past the end of the file)".format(i)
-                    needsRepair = True
-                    break
-                if self.freeSectors[i] is False:
-                    needsRepair = True
-                self.freeSectors[i] = False
+            if sector + count > self.sectors.sectorCount:
+                # raise RegionMalformed("Region file offset table points to sector {0} (past the end of the file)".format(i))
+                print "Region file offset table points to sector {0} (past the end of the file)".format(
+                    max(sector, self.sectors.sectorCount))
+            if self.sectors.reserve(sector, count):
+                needsRepair = True
 
         if needsRepair:
             self.repair()
@@ -96,11 +321,11 @@ class MCRegionFile(object):
 
     @property
     def usedSectors(self):
-        return len(self.freeSectors) - sum(self.freeSectors)
+        return self.sectors.usedCount
 
     @property
     def sectorCount(self):
-        return len(self.freeSectors)
+        return self.sectors.sectorCount
 
     @property
     def chunkCount(self):
@@ -108,8 +333,8 @@ class MCRegionFile(object):
 
     def repair(self):
         lostAndFound = {}
-        _freeSectors = [True] * len(self.freeSectors)
-        _freeSectors[0] = _freeSectors[1] = False
+        _usedSectors = zeros(self.sectorCount, bool)
+        _usedSectors[0:2] = True
         deleted = 0
         recovered = 0
         log.info("Beginning repairs on {file} ({chunks} chunks)".format(file=os.path.basename(self.path),
@@ -125,7 +350,7 @@ class MCRegionFile(object):
                 sectorCount = offset & 0xff
                 try:
 
-                    if sectorStart + sectorCount > len(self.freeSectors):
+                    if sectorStart + sectorCount > self.sectorCount:
                         raise RegionMalformed(
                             "Offset {start}:{end} ({offset}) at index {index} pointed outside of the file".format(
                                 start=sectorStart, end=sectorStart + sectorCount, index=index, offset=offset))
@@ -134,16 +359,12 @@ class MCRegionFile(object):
                     if data is None:
                         raise RegionMalformed("Failed to read chunk data for {0}".format((cx, cz)))
 
-                    chunkTag = nbt.load(buf=data)
+                    chunkTag = nbt.load(buf=data, views=True)
                     lev = chunkTag["Level"]
                     xPos = lev["xPos"].value
                     zPos = lev["zPos"].value
-                    overlaps = False
-
-                    for i in xrange(sectorStart, sectorStart + sectorCount):
-                        if _freeSectors[i] is False:
-                            overlaps = True
-                        _freeSectors[i] = False
+                    overlaps = _usedSectors[sectorStart:sectorStart + sectorCount].any()
+                    _usedSectors[sectorStart:sectorStart + sectorCount] = True
 
                     if xPos != cx or zPos != cz or overlaps:
                         lostAndFound[xPos, zPos] = data
@@ -184,9 +405,17 @@ class MCRegionFile(object):
         if numSectors == 0:
             raise ChunkNotPresent((cx, cz))
 
-        if sectorStart + numSectors > len(self.freeSectors):
+        if sectorStart + numSectors > self.sectorCount:
             raise ChunkNotPresent((cx, cz))
 
+        if MCRegionFile.useMmap:
+            # return a zero-copy view of the chunk's sectors. It is only valid until the map is closed or remapped.
+            start = sectorStart * self.SECTOR_BYTES
+            m = self._getMap()
+            length, format = struct.unpack_from(">IB", m, start)
+            # the stored length counts the format byte
+            return buffer(m, start + 5, min(length - 1, numSectors * self.SECTOR_BYTES - 5)), format
+
         with self.file as f:
             f.seek(sectorStart * self.SECTOR_BYTES)
             data = f.read(numSectors * self.SECTOR_BYTES)
@@ -197,17 +426,31 @@ class MCRegionFile(object):
 
         length = struct.unpack_from(">I", data)[0]
         format = struct.unpack_from("B", data, 4)[0]
-        data = data[5:length + 5]
+        data = data[5:length + 4]
         return data, format
 
     def readChunk(self, cx, cz):
         data, format = self._readChunk(cx, cz)
-        if format == self.VERSION_GZIP:
-            return nbt.gunzip(data)
-        if format == self.VERSION_DEFLATE:
+        return self.decompress(data, format)
+
+    def readCompressedChunk(self, cx, cz):
+        """
+        Returns a copy of the chunk's compressed data along with its format, to be passed to decompress() later,
+        possibly from another thread.
+        """
+        data, format = self._readChunk(cx, cz)
+        return str(data), format
+
+    @classmethod
+    def decompress(cls, data, format):
+        if format == cls.VERSION_GZIP:
+            return nbt.gunzip(str(data))
+        if format == cls.VERSION_DEFLATE:
             return inflate(data)
-        if format == self.VERSION_UNCOMPRESSED:
-            return data
+        if format == cls.VERSION_UNCOMPRESSED:
+            return str(data)
+        if format == cls.VERSION_LZ4 and lz4 is not None:
+            return lz4.decompress(str(data))
 
         raise IOError("Unknown compress format: {0}".format(format))
 
@@ -217,22 +460,132 @@ class MCRegionFile(object):
         """
         try:
             data, format = regionFile._readChunk(cx, cz)
-            self._saveChunk(cx, cz, data, format)
+            # copy the data out of the source's memory map, which may be closed while this file is opened
+            self._saveChunk(cx, cz, str(data), format)
         except ChunkNotPresent:
             pass
 
-    def saveChunk(self, cx, cz, uncompressedData):
-        if self.compressMode == self.VERSION_DEFLATE:
-            data = deflate(uncompressedData)
-        elif self.compressMode == self.VERSION_UNCOMPRESSED:
-            data = uncompressedData
+    def compress(self, uncompressedData):
+        return self.compressWith(uncompressedData, self.compressMode, self.compressLevel)
+
+    @classmethod
+    def compressWith(cls, uncompressedData, compressMode, compressLevel):
+        if compressMode == cls.VERSION_DEFLATE:
+            return deflate(uncompressedData, compressLevel)
+        elif compressMode == cls.VERSION_UNCOMPRESSED:
+            return uncompressedData
+        elif compressMode == cls.VERSION_LZ4 and lz4 is not None:
+            return lz4.compress(uncompressedData)
         else:
-            raise IOError("Unsupported compress format: {0}".format(self.compressMode))
+            raise IOError("Unsupported compress format: {0}".format(compressMode))
+
+    def _compressChunkData(self, data):
+        if hasattr(data, "compressedTagData"):
+            return data.compressedTagData(self.compressMode, self.compressLevel)
+        return self.compress(data)
+
+    def saveChunk(self, cx, cz, uncompressedData):
+        data = self.compress(uncompressedData)
         try:
             self._saveChunk(cx, cz, data, self.compressMode)
         except ChunkTooBig as e:
             raise ChunkTooBig(e.message + " (%d uncompressed)" % len(uncompressedData))
 
+    def saveChunks(self, chunks, mapFunc=map):
+        """
+        Saves many chunks at once. chunks is an iterable of (cx, cz, data) tuples, where data is either uncompressed
+        chunk data or an object with a compressedTagData(compressMode, compressLevel) method, like AnvilChunkData,
+        which is then serialized and compressed in one pass. mapFunc is used to compress the chunks and may be
+        replaced with a thread pool's map to compress them in parallel.
+
+        All of the chunks are compressed first, then sectors are allocated for the ones that no longer fit in
+        their old sectors. Chunks that end up in adjacent sectors are written together in one sequential write,
+        and the offset and timestamp tables are written once at the end instead of once per chunk.
+
+        Nothing is changed if any chunk is too big. The old sectors of moved chunks are only freed after the new
+        offset table is written, so they are never overwritten while the table on disk still points at them.
+        """
+        batch = collections.OrderedDict()
+        for cx, cz, data in chunks:
+            batch[cx & 0x1f, cz & 0x1f] = data
+        if not len(batch):
+            return
+
+        positions = batch.keys()
+        compressed = mapFunc(self._compressChunkData, batch.values())
+        format = self.compressMode
+
+        sizes = []
+        for data in compressed:
+            sectorsNeeded = (len(data) + self.CHUNK_HEADER_SIZE) / self.SECTOR_BYTES + 1
+            if sectorsNeeded >= 256:
+                raise ChunkTooBig("Chunk too big! %d bytes exceeds 1MB" % len(data))
+            sizes.append(sectorsNeeded)
+
+        placed = []  # (sectorNumber, sectorCount, data)
+        needsSectors = []
+        oldSectors = []  # (sectorNumber, sectorCount) to free once the new offsets are written
+        for (cx, cz), data, sectorsNeeded in zip(positions, compressed, sizes):
+            offset = self.getOffset(cx, cz)
+            sectorNumber = offset >> 8
+            sectorsAllocated = offset & 0xff
+            if sectorNumber != 0 and sectorsAllocated >= sectorsNeeded:
+                placed.append((sectorNumber, sectorsNeeded, data))
+            else:
+                if sectorNumber != 0:
+                    oldSectors.append((sectorNumber, sectorsAllocated))
+                needsSectors.append((cx, cz, sectorsNeeded, data))
+
+        oldSectorCount = self.sectorCount
+        starts = self.sectors.allocateMany([sectorsNeeded for _, _, sectorsNeeded, _ in needsSectors])
+        offsets = self.offsets.copy()
+        for (cx, cz, sectorsNeeded, data), sectorNumber in zip(needsSectors, starts):
+            offsets[cx + cz * 32] = sectorNumber << 8 | sectorsNeeded
+            placed.append((sectorNumber, sectorsNeeded, data))
+
+        if self.sectorCount > oldSectorCount:
+            log.debug("REGION SAVE {0} chunks, growing by {1} sectors".format(len(batch), self.sectorCount - oldSectorCount))
+            self._growFile()
+
+        modTimes = self.modTimes.copy()
+        timestamp = time.time()
+        for cx, cz in positions:
+            modTimes[cx + cz * 32] = timestamp
+
+        placed.sort(key=lambda p: p[0])
+        with self.file as f:
+            runStart = None
+            runEnd = None
+            run = []
+            for sectorNumber, sectorCount, data in placed:
+                if sectorNumber != runEnd:
+                    self._writeRun(f, runStart, run)
+                    runStart = sectorNumber
+                    run = []
+
+                record = struct.pack(">IB", len(data) + 1, format) + data
+                # pad the record out to its sectors so the next chunk in the run starts on a sector boundary
+                run.append(record)
+                run.append("\0" * (sectorCount * self.SECTOR_BYTES - len(record)))
+                runEnd = sectorNumber + sectorCount
+
+            self._writeRun(f, runStart, run)
+
+            f.seek(0)
+            f.write(offsets.tostring() + modTimes.tostring())
+
+        self.offsets = offsets
+        self.modTimes = modTimes
+        for sectorNumber, sectorCount in oldSectors:
+            self.sectors.free(sectorNumber, sectorCount)
+
+    def _writeRun(self, f, sectorNumber, records):
+        if not records:
+            return
+        log.debug("REGION: Writing {0} chunks at sector {1}".format(len(records) / 2, sectorNumber))
+        f.seek(sectorNumber * self.SECTOR_BYTES)
+        f.write("".join(records))
+
     def _saveChunk(self, cx, cz, data, format):
         cx &= 0x1f
         cz &= 0x1f
@@ -252,61 +605,31 @@ class MCRegionFile(object):
             # we need to allocate new sectors
 
             # mark the sectors previously used for this chunk as free
-            for i in xrange(sectorNumber, sectorNumber + sectorsAllocated):
-                self.freeSectors[i] = True
-
-            runLength = 0
-            runStart = 0
-            try:
-                runStart = self.freeSectors.index(True)
-
-                for i in xrange(runStart, len(self.freeSectors)):
-                    if runLength:
-                        if self.freeSectors[i]:
-                            runLength += 1
-                        else:
-                            runLength = 0
-                    elif self.freeSectors[i]:
-                        runStart = i
-                        runLength = 1
-
-                    if runLength >= sectorsNeeded:
-                        break
-            except ValueError:
-                pass
-
-            # we found a free space large enough
-            if runLength >= sectorsNeeded:
-                log.debug("REGION SAVE {0},{1}, reusing {2}b".format(cx, cz, len(data)))
-                sectorNumber = runStart
-                self.setOffset(cx, cz, sectorNumber << 8 | sectorsNeeded)
-                self.writeSector(sectorNumber, data, format)
-                self.freeSectors[sectorNumber:sectorNumber + sectorsNeeded] = [False] * sectorsNeeded
+            if sectorNumber != 0:
+                self.sectors.free(sectorNumber, sectorsAllocated)
 
-            else:
+            oldSectorCount = self.sectorCount
+            sectorNumber = self.sectors.allocate(sectorsNeeded)
+
+            if self.sectorCount > oldSectorCount:
                 # no free space large enough found -- we need to grow the
                 # file
-
                 log.debug("REGION SAVE {0},{1}, growing by {2}b".format(cx, cz, len(data)))
+                self._growFile()
+            else:
+                log.debug("REGION SAVE {0},{1}, reusing {2}b".format(cx, cz, len(data)))
 
-                with self.file as f:
-                    f.seek(0, 2)
-                    filesize = f.tell()
-
-                    sectorNumber = len(self.freeSectors)
-
-                    assert sectorNumber * self.SECTOR_BYTES == filesize
-
-                    filesize += sectorsNeeded * self.SECTOR_BYTES
-                    f.truncate(filesize)
-
-                self.freeSectors += [False] * sectorsNeeded
-
-                self.setOffset(cx, cz, sectorNumber << 8 | sectorsNeeded)
-                self.writeSector(sectorNumber, data, format)
+            self.setOffset(cx, cz, sectorNumber << 8 | sectorsNeeded)
+            self.writeSector(sectorNumber, data, format)
 
         self.setTimestamp(cx, cz)
 
+    def _growFile(self):
+        """ Extends the file to cover every sector known to self.sectors """
+        self._unmap()
+        with self.file as f:
+            f.truncate(self.sectorCount * self.SECTOR_BYTES)
+
     def writeSector(self, sectorNumber, data, format):
         with self.file as f:
             log.debug("REGION: Writing sector {0}".format(sectorNumber))
@@ -355,8 +678,19 @@ class MCRegionFile(object):
     VERSION_GZIP = 1
     VERSION_DEFLATE = 2
     VERSION_UNCOMPRESSED = 3
+    # Not a Minecraft format. Only used for region files that MCEdit writes and reads back itself, such as the
+    # work folders and undo worlds, and only when the lz4 module is installed.
+    VERSION_LZ4 = 100
 
     compressMode = VERSION_DEFLATE
+    compressLevel = 2
+
+    @classmethod
+    def fastestCompression(cls):
+        """ Returns the fastest (compressMode, compressLevel) available, for region files that only MCEdit reads """
+        if lz4 is not None:
+            return cls.VERSION_LZ4, 0
+        return cls.VERSION_DEFLATE, 1
 
 
 class ChunkTooBig(ValueError):
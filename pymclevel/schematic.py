@@ -266,7 +266,7 @@ class MCSchematic(EntityLevel):
         blockrotation.RotateLeft(self.Blocks, self.Data)
 
     def rotateLeft(self):
-        self._fakeEntities = None
+        self.resetEntityIndex()
 
         self._Blocks = swapaxes(self._Blocks, 1, 2)[:, ::-1, :]  # x=z; z=-x
         self.root_tag["Data"].value = swapaxes(self.root_tag["Data"].value, 1, 2)[:, ::-1, :]
@@ -312,7 +312,7 @@ class MCSchematic(EntityLevel):
     def roll(self):
         " xxx rotate stuff - destroys biomes"
         self.root_tag.pop('Biomes', None)
-        self._fakeEntities = None
+        self.resetEntityIndex()
 
         self._Blocks = swapaxes(self._Blocks, 0, 2)[:, :, ::-1]  # x=-y; y=x
         self.root_tag["Data"].value = swapaxes(self.root_tag["Data"].value, 0, 2)[:, :, ::-1]
@@ -355,7 +355,7 @@ class MCSchematic(EntityLevel):
 
     def flipVertical(self):
         " xxx delete stuff "
-        self._fakeEntities = None
+        self.resetEntityIndex()
 
         blockrotation.FlipVertical(self.Blocks, self.Data)
         self._Blocks = self._Blocks[::-1, :, :]  # y=-y
@@ -410,7 +410,7 @@ class MCSchematic(EntityLevel):
         blockrotation.FlipNorthSouth(self.Blocks, self.Data)
 
     def flipNorthSouth(self):
-        self._fakeEntities = None
+        self.resetEntityIndex()
 
         blockrotation.FlipNorthSouth(self.Blocks, self.Data)
         self._Blocks = self._Blocks[:, :, ::-1]  # x=-x
@@ -455,7 +455,7 @@ class MCSchematic(EntityLevel):
         blockrotation.FlipEastWest(self.Blocks, self.Data)
 
     def flipEastWest(self):
-        self._fakeEntities = None
+        self.resetEntityIndex()
 
         blockrotation.FlipEastWest(self.Blocks, self.Data)
         self._Blocks = self._Blocks[:, ::-1, :]  # z=-z
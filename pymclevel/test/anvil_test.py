@@ -1,11 +1,13 @@
 import itertools
 import os
 import shutil
+import sys
+import threading
 import unittest
 import numpy
 
 from pymclevel import mclevel
-from pymclevel.infiniteworld import MCInfdevOldLevel
+from pymclevel.infiniteworld import AnvilWorldFolder, ChunkDataCache, MCInfdevOldLevel
 from pymclevel import nbt
 from pymclevel.schematic import MCSchematic
 from pymclevel.box import BoundingBox
@@ -22,6 +24,469 @@ class TestAnvilLevelCreate(unittest.TestCase):
         self.anvilLevel.close()
         shutil.rmtree(temppath)
 
+    def testCompressionWorkers(self):
+        temppath = mktemp("AnvilWorkers")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.compressionWorkers = 4
+        level.loadedChunkLimit = 10
+        box = BoundingBox((0, 0, 0), (16 * 6, 64, 16 * 6))
+        level.createChunksInBox(box)
+        level.fillBlocks(box, level.materials.Stone)
+        level.saveInPlace()
+        level.close()
+
+        level = MCInfdevOldLevel(filename=temppath)
+        level.compressionWorkers = 4
+        level.loadedChunkLimit = 10
+        for chunk, slices, point in level.getChunkSlices(box):
+            assert (chunk.Blocks[slices] == level.materials.Stone.ID).all()
+        assert level.chunkCount == 36
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testPrefetchLimit(self):
+        temppath = mktemp("AnvilPrefetch")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.createChunksInBox(BoundingBox((0, 0, 0), (16 * 6, 64, 16 * 6)))
+        level.saveInPlace()
+        level.close()
+
+        level = MCInfdevOldLevel(filename=temppath)
+        level.compressionWorkers = 2
+        level.prefetchChunkLimit = 8
+
+        # a consumer that stops early leaves nothing prefetched behind
+        chunks = level.getChunks()
+        next(chunks)
+        assert level._prefetchedChunks
+        del chunks
+        assert not level._prefetchedChunks
+
+        # prefetching past the limit drops the oldest chunks instead of the new ones
+        positions = sorted(level.allChunks)
+        level.prefetchChunks(positions[:20])
+        assert level._prefetchedChunks.keys() == positions[12:20]
+        level.prefetchChunks(positions[20:21])
+        assert level._prefetchedChunks.keys() == positions[13:21]
+        assert level.getChunk(*positions[20]).chunkPosition == positions[20]
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testChunkCache(self):
+        temppath = mktemp("AnvilCache")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.loadedChunkLimit = 8
+        box = BoundingBox((0, 0, 0), (16 * 8, 64, 16 * 8))
+        level.createChunksInBox(box)
+        level.pinChunk(0, 0)
+        level.fillBlocks(box, level.materials.Stone)
+
+        # recentChunks keeps the last few chunks in use
+        stats = level.chunkCacheStats()
+        assert stats["chunks"] <= level.loadedChunkLimit + len(level.recentChunks) + 1
+        assert stats["writebacks"] > 0
+        assert (0, 0) in level._loadedChunkData
+        assert stats["bytes"] == sum(c.memoryUsage() for c in level._loadedChunkData.itervalues())
+
+        level.unpinChunk(0, 0)
+        level.recentChunks.clear()
+        level.loadedChunkMemoryLimit = level._loadedChunkData[0, 0].memoryUsage() * 3
+        for chunk, slices, point in level.getChunkSlices(box):
+            assert (chunk.Blocks[slices] == level.materials.Stone.ID).all()
+        assert level.chunkCacheStats()["chunks"] <= 3 + len(level.recentChunks) + 1
+        assert (0, 0) not in level._loadedChunkData
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testWriteBehind(self):
+        temppath = mktemp("AnvilWriteBehind")
+        copypath = mktemp("AnvilWriteBehindCopy")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.loadedChunkLimit = 4
+        box = BoundingBox((0, 0, 0), (16 * 6, 64, 16 * 6))
+        level.createChunksInBox(box)
+        level.fillBlocks(box, level.materials.Stone)
+        level.recentChunks.clear()
+        pending = list(level._writeBehind.pending)
+        assert pending
+
+        # chunks waiting to be written can be copied from, and are reclaimed when loaded again
+        copy = MCInfdevOldLevel(filename=copypath, create=True)
+        copy.copyChunkFrom(level, *pending[0])
+        assert pending[0] not in level._writeBehind
+        assert (level.getChunk(*pending[-1]).Blocks[:, :, :64] == level.materials.Stone.ID).all()
+
+        copy.saveInPlace()
+        copy.close()
+        level.saveInPlace()
+        level.close()
+
+        for path in (temppath, copypath):
+            level = MCInfdevOldLevel(filename=path)
+            for chunk, slices, point in level.getChunkSlices(box):
+                assert (chunk.Blocks[slices] == level.materials.Stone.ID).all()
+            level.close()
+            shutil.rmtree(path)
+
+    def testLazySections(self):
+        temppath = mktemp("AnvilSections")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.createChunks([(0, 0), (1, 0)])
+        level.fillBlocks(BoundingBox((0, 0, 0), (16, 20, 16)), level.materials.Stone)
+        level.fillBlocks(BoundingBox((4, 30, 4), (1, 1, 1)), level.materials.Glowstone)
+        level.generateLights()
+        level.saveInPlace()
+        level.close()
+
+        level = MCInfdevOldLevel(filename=temppath)
+        chunkData = level._getChunkData(0, 0)
+        assert not any(chunkData.isDecoded(name) for name in chunkData.sectionArrayNames)
+        assert chunkData.memoryUsage() < 16 * 16 * level.Height
+        # the sections view the whole loaded buffer, which is counted until they are decoded
+        assert chunkData.memoryUsage() >= len(level.worldFolder.readChunk(0, 0))
+        assert chunkData.root_tag["Level"]["HeightMap"].value.flags.owndata
+
+        def sectionArrays(data):
+            return [[section["Y"].value] + [section[name].value.tolist() for name in chunkData.sectionArrayNames]
+                    for section in nbt.load(buf=data)["Level"]["Sections"]]
+
+        assert sectionArrays(chunkData.savedTagData()) == sectionArrays(level.worldFolder.readChunk(0, 0))
+
+        chunk = level.getChunk(0, 0)
+        assert level.blockAt(4, 30, 4) == level.materials.Glowstone.ID
+        assert level.skylightAt(4, 200, 4) == 15
+        blocks = chunk.readOnlyArray("Blocks", (slice(0, 8), slice(None), slice(10, 36)))
+        assert blocks.shape == (8, 16, 26)
+        assert (blocks[:, :, :10] == level.materials.Stone.ID).all()
+        assert blocks[4, 4, 20] == level.materials.Glowstone.ID
+        assert not blocks.flags.writeable
+        assert not chunkData.isDecoded("Blocks")
+
+        assert (chunk.Blocks[:, :, :20] == level.materials.Stone.ID).all()
+        assert chunk.Blocks[4, 4, 30] == level.materials.Glowstone.ID
+        assert not chunk.Blocks[:, :, 32:].any()
+        assert chunkData.isDecoded("Blocks") and not chunkData.isDecoded("SkyLight")
+        assert (chunk.SkyLight[:, :, 32:] == 15).all()
+        assert chunk.BlockLight[4, 4, 31] == 14
+        assert level.chunkCacheStats()["bytes"] == chunkData.memoryUsage()
+        chunk.Data
+        assert chunkData.memoryUsage() == sum(getattr(chunkData, name).nbytes for name in chunkData.sectionArrayNames)
+
+        emptyChunk = level.getChunk(1, 0)
+        assert not emptyChunk.Blocks[:, :, 20:].any()
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testChunkCacheOrder(self):
+        class FakeChunkData(object):
+            def memoryUsage(self):
+                return 10
+
+        cache = ChunkDataCache()
+        for cPos in [(0, 0), (1, 0), (2, 0)]:
+            cache[cPos] = FakeChunkData()
+        assert cache.byteSize == 30
+        assert cache.isOverLimit(2, 0)
+        assert cache.isOverLimit(3, 20)
+        assert not cache.isOverLimit(3, 0)
+
+        cache.lookup((0, 0))
+        cache.lookup((5, 5))
+        assert cache.oldest()[0] == (1, 0)
+        assert cache.hits == 1 and cache.misses == 1
+
+        cache.evict((1, 0))
+        assert cache.oldest()[0] == (2, 0)
+        assert cache.byteSize == 20
+        assert cache.pop((2, 0)) is not None
+        assert cache.keys() == [(0, 0)]
+
+        cache.pin((0, 0))
+        cache.pin((0, 0))
+        cache.unpin((0, 0))
+        assert cache.isPinned((0, 0))
+        cache.unpin((0, 0))
+        assert not cache.isPinned((0, 0))
+
+    def testChunkCacheResizeThreads(self):
+        class FakeChunkData(object):
+            size = 1
+
+            def memoryUsage(self):
+                return self.size
+
+        cache = ChunkDataCache()
+        chunks = [FakeChunkData() for _ in range(8)]
+        stop = threading.Event()
+
+        def resize():
+            # chunk data decoding its sections on a worker thread
+            while not stop.is_set():
+                for cPos, chunkData in enumerate(chunks):
+                    chunkData.size += 1
+                    cache.updateSize(cPos, chunkData)
+
+        oldInterval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        threads = [threading.Thread(target=resize) for _ in range(2)]
+        try:
+            for thread in threads:
+                thread.start()
+            for i in xrange(20000):
+                cPos = i % 8
+                if cPos in cache:
+                    cache.evict(cPos)
+                cache[cPos] = chunks[cPos]
+                if i * 3 % 8 in cache:
+                    cache.touch(i * 3 % 8)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            sys.setcheckinterval(oldInterval)
+
+        assert cache.byteSize == sum(chunkData.memoryUsage() for chunkData in cache.itervalues())
+
+    def testFastLights(self):
+        temppath = mktemp("AnvilFastLights")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.createChunks([(0, 0)])
+        materials = level.materials
+        level.fillBlocks(BoundingBox((0, 0, 0), (16, 30, 16)), materials.Stone)
+        level.fillBlocks(BoundingBox((0, 50, 0), (8, 1, 16)), materials.Leaves)
+        level.fillBlocks(BoundingBox((0, 45, 0), (4, 3, 16)), materials.Water)
+        level.fillBlocks(BoundingBox((15, 0, 15), (1, 30, 1)), materials.Air)
+        chunk = level.getChunk(0, 0)
+
+        la = materials.lightAbsorption
+        for x, z in itertools.product(range(16), range(16)):
+            column = chunk.SkyLight[x, z]
+            height = chunk.HeightMap[z, x]
+            assert (column[height:] == 15).all()
+            light = 15
+            for y in reversed(range(height)):
+                light = max(0, light - max(1, la[chunk.Blocks[x, z, y]]))
+                assert column[y] == light
+
+        assert chunk.SkyLight[15, 15, 0] == 15
+        chunk.Blocks[:] = 0
+        chunk.chunkChanged()
+        assert (chunk.SkyLight == 15).all()
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testQueueLighting(self):
+        temppath = mktemp("AnvilQueueLighting")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        box = BoundingBox((0, 0, 0), (16 * 3, 64, 16 * 3))
+        level.createChunksInBox(box)
+        materials = level.materials
+        level.fillBlocks(BoundingBox((0, 40, 0), (16 * 3, 1, 16 * 3)), materials.Stone)
+        level.fillBlocks(BoundingBox((10, 40, 10), (20, 1, 4)), materials.Air)
+        level.fillBlocks(BoundingBox((12, 30, 20), (1, 1, 1)), materials.Glowstone)
+        level.fillBlocks(BoundingBox((30, 20, 30), (1, 1, 1)), materials.Torch)
+
+        def lights():
+            return [(level.getChunk(*cPos).BlockLight.copy(), level.getChunk(*cPos).SkyLight.copy())
+                    for cPos in sorted(level.allChunks)]
+
+        def relightAll():
+            for cPos in level.allChunks:
+                chunk = level.getChunk(*cPos)
+                chunk.BlockLight[:] = 0
+                chunk.chunkChanged()
+            level.generateLights(method="queue")
+
+        level.generateLights(method="queue")
+        assert level.blockLightAt(12, 31, 20) == 14
+        assert level.blockLightAt(12, 30, 34) == 1
+        assert level.skylightAt(15, 35, 11) > 0
+
+        # only the changed chunks are relit, and the result matches relighting everything
+        level.fillBlocks(BoundingBox((12, 30, 20), (1, 1, 1)), materials.Air)
+        level.fillBlocks(BoundingBox((10, 40, 10), (20, 1, 4)), materials.Stone)
+        level.generateLights(method="queue")
+        assert not any(level.getChunk(*cPos).needsLighting for cPos in level.allChunks)
+        assert level.blockLightAt(12, 31, 20) == 0
+        assert level.skylightAt(15, 35, 11) == 0
+        relit = lights()
+        relightAll()
+        for (blockLight1, skyLight1), (blockLight2, skyLight2) in zip(relit, lights()):
+            assert (blockLight1 == blockLight2).all()
+            assert (skyLight1 == skyLight2).all()
+
+        level.generateLights(level.allChunks, method="sweep")
+        assert level.blockLightAt(30, 21, 30) == 13
+        self.assertRaises(ValueError, level.generateLights, method="flood")
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testLightChanges(self):
+        temppath = mktemp("AnvilLightChanges")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.createChunksInBox(BoundingBox((0, 0, 0), (16 * 3, 64, 16 * 3)))
+        materials = level.materials
+        level.fillBlocks(BoundingBox((0, 40, 0), (16 * 3, 1, 16 * 3)), materials.Stone)
+        level.fillBlocks(BoundingBox((0, 10, 0), (16 * 3, 1, 16 * 3)), materials.Glass)
+        level.generateLights()
+
+        # blocks that don't change any light don't need lighting
+        level.fillBlocks(BoundingBox((0, 41, 0), (16 * 3, 1, 16 * 3)), materials.Flower)
+        block_copy.copyBlocksFrom(level, level, BoundingBox((0, 41, 0), (16, 1, 16)), (16, 20, 16))
+        level.fillBlocks(BoundingBox((0, 10, 0), (16 * 3, 1, 16 * 3)), materials.Air, [materials.Glass])
+        assert not level.chunksNeedingLighting
+
+        # only the columns around changed blocks are relit, and the result matches relighting everything
+        level.fillBlocks(BoundingBox((20, 40, 20), (2, 1, 2)), materials.Air)
+        level.fillBlocks(BoundingBox((30, 20, 30), (1, 1, 1)), materials.Torch)
+        chunk = level.getChunk(1, 1)
+        assert chunk.needsLighting
+        assert (chunk.lightChanges[4:6, 4:6] == (40, 41)).all()
+        assert level.skylightAt(20, 30, 20) == 15
+        level.generateLights()
+        assert not level.chunkLightChanges
+        assert level.blockLightAt(31, 20, 30) == 13
+
+        def lights():
+            return [(level.getChunk(*cPos).BlockLight.copy(), level.getChunk(*cPos).SkyLight.copy())
+                    for cPos in sorted(level.allChunks)]
+
+        relit = lights()
+        for cPos in level.allChunks:
+            chunk = level.getChunk(*cPos)
+            chunk.BlockLight[:] = 0
+            chunk.chunkChanged()
+        level.generateLights()
+        assert all((a == b).all() for a, b in zip(itertools.chain(*relit), itertools.chain(*lights())))
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testParallelLighting(self):
+        temppath = mktemp("AnvilParallelLighting")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.createChunksInBox(BoundingBox((0, 0, 0), (16 * 4, 64, 16 * 4)))
+        materials = level.materials
+        level.fillBlocks(BoundingBox((0, 40, 0), (16 * 4, 1, 16 * 4)), materials.Stone)
+        level.fillBlocks(BoundingBox((14, 40, 14), (6, 1, 30)), materials.Air)
+        level.fillBlocks(BoundingBox((31, 30, 31), (2, 1, 2)), materials.Glowstone)
+        level.generateLights()
+
+        def lights():
+            return [(level.getChunk(*cPos).BlockLight.copy(), level.getChunk(*cPos).SkyLight.copy())
+                    for cPos in sorted(level.allChunks)]
+
+        serial = lights()
+        for cPos in level.allChunks:
+            chunk = level.getChunk(*cPos)
+            chunk.BlockLight[:] = 0
+            chunk.chunkChanged()
+
+        # tiles of one chunk put a seam between every pair of chunks
+        level.lightingTileSize = 1
+        level.generateLights(workers=2)
+        assert not level.chunksNeedingLighting
+        for (blockLight1, skyLight1), (blockLight2, skyLight2) in zip(serial, lights()):
+            assert (blockLight1 == blockLight2).all()
+            assert (skyLight1 == skyLight2).all()
+
+        self.assertRaises(ValueError, level.generateLights, method="sweep", workers=2)
+        level.close()
+        shutil.rmtree(temppath)
+
+    def testChunkIndex(self):
+        temppath = mktemp("AnvilChunkIndex")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.createChunksInBox(BoundingBox((0, 0, 0), (16 * 3, 64, 16 * 40)))
+        level.saveInPlace()
+        level.close()
+        indexPath = os.path.join(temppath, AnvilWorldFolder.chunkIndexName)
+        assert os.path.exists(indexPath)
+
+        folder = AnvilWorldFolder(temppath)
+        assert sorted(folder._getChunkIndex()) == [(0, 0), (0, 1)]
+        assert len(folder.listChunks()) == 120
+        assert folder.containsChunk(2, 39)
+        assert not folder.containsChunk(3, 39)
+        # nothing was opened to answer those
+        assert not folder.regionFiles
+
+        # a stale entry is rebuilt from the region file, and the index is written when the folder is closed
+        folder._chunkIndex[0, 1][1] += 1
+        folder._chunkIndex[0, 1][2][:] = False
+        os.unlink(indexPath)
+        assert len(folder.listChunks()) == 120
+        assert not os.path.exists(indexPath)
+        folder.closeRegions()
+        assert os.path.exists(indexPath)
+
+        level = MCInfdevOldLevel(filename=temppath)
+        level.deleteChunk(2, 39)
+        assert not level.containsChunk(2, 39)
+        assert level.chunkCount == 119
+        level.saveInPlace()
+        level.close()
+        assert not AnvilWorldFolder(temppath).containsChunk(2, 39)
+        shutil.rmtree(temppath)
+
+    def testEntityIndex(self):
+        temppath = mktemp("AnvilEntityIndex")
+        level = MCInfdevOldLevel(filename=temppath, create=True)
+        level.createChunksInBox(BoundingBox((0, 0, 0), (16 * 4, 64, 16 * 4)))
+
+        def chestTag(x, y, z, itemID):
+            tag = nbt.TAG_Compound()
+            tag["id"] = nbt.TAG_String("Chest")
+            for name, value in zip("xyz", (x, y, z)):
+                tag[name] = nbt.TAG_Int(value)
+            itemTag = nbt.TAG_Compound()
+            itemTag["id"] = nbt.TAG_String(itemID)
+            tag["Items"] = nbt.TAG_List([itemTag])
+            return tag
+
+        level.addTileEntity(chestTag(1, 10, 1, "minecraft:diamond"))
+        level.addTileEntity(chestTag(40, 10, 20, "minecraft:stone"))
+        itemTag = nbt.TAG_Compound()
+        itemTag["id"] = nbt.TAG_String("Item")
+        itemTag["Pos"] = nbt.TAG_List([nbt.TAG_Double(p) for p in (50.5, 10, 50.5)])
+        itemTag["Item"] = nbt.TAG_Compound()
+        itemTag["Item"]["id"] = nbt.TAG_String("minecraft:diamond")
+        level.addEntity(itemTag)
+        level.saveInPlace()
+
+        index = level.getEntityIndex()
+        assert index.findChunks("TileEntities", ["Chest"]) == [(0, 0), (2, 1)]
+        assert index.findChunks("TileEntities", ["Chest"], "Items.id", ["minecraft:diamond"]) == [(0, 0)]
+        assert index.findChunks("Entities", field="Item.id", values=["minecraft:diamond"]) == [(3, 3)]
+        assert index.ids("Entities") == set(["Item"])
+
+        # the world index is not the in-memory entity index that resetEntityIndex clears
+        level.resetEntityIndex()
+        assert level.getEntityIndex() is index
+
+        # edited chunks are found before they are saved
+        level.getChunk(1, 1).dirty = True
+        assert index.findChunks("TileEntities", ["Sign"]) == [(1, 1)]
+        level.close()
+        assert os.path.exists(os.path.join(temppath, index.fileName))
+
+        # a reopened world reads only the chunks that changed since the index was saved
+        level = MCInfdevOldLevel(filename=temppath)
+        index = level.getEntityIndex()
+        assert index.findChunks("TileEntities", ["Chest"]) == [(0, 0), (2, 1)]
+        assert index.chunksRead == 0
+        chunk = level.getChunk(2, 1)
+        del chunk.TileEntities[:]
+        chunk.dirty = True
+        level.saveInPlace()
+        level.close()
+
+        level = MCInfdevOldLevel(filename=temppath)
+        index = level.getEntityIndex()
+        assert index.findChunks("TileEntities", ["Chest"]) == [(0, 0)]
+        assert index.chunksRead == 0
+        level.close()
+        shutil.rmtree(temppath)
+
 
 class TestAnvilLevel(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,393 @@
+"""
+Benchmarks for loading and saving NBT data: chunks, level.dat files, schematics, Pocket Edition (little-endian) NBT
+and whole worlds, timed with both the Cython and the pure Python NBT implementations.
+
+Run it from the folder holding the pymclevel package:
+
+    python -m pymclevel.test.benchmark [options] [benchmark patterns]
+
+All data is made up by the generators below, so no test files are needed. The pure Python timings are taken in a
+child process that cannot import _nbt. Use --output to write the results to a JSON file and --baseline to compare
+them with an earlier one. The exit status is 1 if a benchmark got slower than its baseline by more than --tolerance,
+and 2 if the Cython implementation was asked for but could not be imported, which usually means _nbt.pyx failed to
+build and everything silently fell back to nbt.py.
+"""
+
+import fnmatch
+import json
+import optparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+
+import numpy
+
+import pymclevel
+from pymclevel import nbt
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from pymclevel.schematic import MCSchematic
+
+RESULTS_VERSION = 1
+
+# Run with -c by the parent process to time the pure Python implementation
+PURE_PYTHON_CHILD = ("import sys; sys.modules['_nbt'] = sys.modules['pymclevel._nbt'] = None; "
+                     "from pymclevel.test import benchmark; sys.exit(benchmark.main(sys.argv))")
+
+
+# --- Synthetic data ---
+
+def itemTag(random, slot):
+    tag = nbt.TAG_Compound()
+    tag["id"] = nbt.TAG_String("minecraft:" + random.choice(["stone", "dirt", "diamond", "torch", "planks"]))
+    tag["Count"] = nbt.TAG_Byte(random.randint(1, 65))
+    tag["Slot"] = nbt.TAG_Byte(slot)
+    tag["Damage"] = nbt.TAG_Short(random.randint(0, 16))
+    return tag
+
+
+def doubleList(values):
+    return nbt.TAG_List([nbt.TAG_Double(v) for v in values])
+
+
+def chunkTag(cx, cz, random, sectionCount=16, entityCount=20, tileEntityCount=10, tileTickCount=50):
+    """ Returns the root tag of an Anvil chunk with random blocks, entities, chests and tile ticks """
+    levelTag = nbt.TAG_Compound()
+    levelTag["xPos"] = nbt.TAG_Int(cx)
+    levelTag["zPos"] = nbt.TAG_Int(cz)
+    levelTag["LastUpdate"] = nbt.TAG_Long(random.randint(1 << 30))
+    levelTag["InhabitedTime"] = nbt.TAG_Long(random.randint(1 << 20))
+    levelTag["TerrainPopulated"] = nbt.TAG_Byte(1)
+    levelTag["LightPopulated"] = nbt.TAG_Byte(1)
+    levelTag["HeightMap"] = nbt.TAG_Int_Array(random.randint(0, 256, 256).astype('>u4'))
+    levelTag["Biomes"] = nbt.TAG_Byte_Array(random.randint(0, 40, 256).astype('uint8'))
+
+    sections = nbt.TAG_List()
+    for y in range(sectionCount):
+        section = nbt.TAG_Compound()
+        section["Y"] = nbt.TAG_Byte(y)
+        section["Blocks"] = nbt.TAG_Byte_Array(random.randint(0, 8, 4096).astype('uint8'))
+        section["Data"] = nbt.TAG_Byte_Array(random.randint(0, 256, 2048).astype('uint8'))
+        section["BlockLight"] = nbt.TAG_Byte_Array(numpy.zeros(2048, 'uint8'))
+        section["SkyLight"] = nbt.TAG_Byte_Array(numpy.zeros(2048, 'uint8') + 0xff)
+        sections.append(section)
+    levelTag["Sections"] = sections
+
+    entities = nbt.TAG_List()
+    for i in range(entityCount):
+        entity = nbt.TAG_Compound()
+        entity["id"] = nbt.TAG_String(random.choice(["Zombie", "Skeleton", "Item", "Pig"]))
+        entity["Pos"] = doubleList(random.rand(3) * 16 + (cx * 16, 64, cz * 16))
+        entity["Motion"] = doubleList(random.rand(3))
+        entity["Rotation"] = nbt.TAG_List([nbt.TAG_Float(v) for v in random.rand(2) * 360])
+        entity["Health"] = nbt.TAG_Short(20)
+        entity["OnGround"] = nbt.TAG_Byte(1)
+        entity["UUIDMost"] = nbt.TAG_Long(random.randint(1 << 62))
+        entity["UUIDLeast"] = nbt.TAG_Long(random.randint(1 << 62))
+        entities.append(entity)
+    levelTag["Entities"] = entities
+
+    tileEntities = nbt.TAG_List()
+    for i in range(tileEntityCount):
+        chest = nbt.TAG_Compound()
+        chest["id"] = nbt.TAG_String("Chest")
+        for name, value in zip("xyz", (cx * 16 + i, 64, cz * 16)):
+            chest[name] = nbt.TAG_Int(value)
+        chest["Items"] = nbt.TAG_List([itemTag(random, slot) for slot in range(27)])
+        tileEntities.append(chest)
+    levelTag["TileEntities"] = tileEntities
+
+    tileTicks = nbt.TAG_List()
+    for i in range(tileTickCount):
+        tick = nbt.TAG_Compound()
+        tick["i"] = nbt.TAG_String("minecraft:water")
+        for name, value in zip("xyz", (cx * 16 + i % 16, 60, cz * 16 + i / 16)):
+            tick[name] = nbt.TAG_Int(value)
+        tick["t"] = nbt.TAG_Int(random.randint(20))
+        tick["p"] = nbt.TAG_Int(0)
+        tileTicks.append(tick)
+    levelTag["TileTicks"] = tileTicks
+
+    rootTag = nbt.TAG_Compound()
+    rootTag["Level"] = levelTag
+    rootTag["DataVersion"] = nbt.TAG_Int(1343)
+    return rootTag
+
+
+def levelDatTag(random):
+    """ Returns the root tag of a level.dat with game rules and a player with a full inventory """
+    dataTag = nbt.TAG_Compound()
+    dataTag["LevelName"] = nbt.TAG_String("Benchmark")
+    dataTag["RandomSeed"] = nbt.TAG_Long(random.randint(1 << 62))
+    dataTag["LastPlayed"] = nbt.TAG_Long(random.randint(1 << 40))
+    for name in ("SpawnX", "SpawnY", "SpawnZ", "GameType", "version", "rainTime", "thunderTime"):
+        dataTag[name] = nbt.TAG_Int(random.randint(1 << 16))
+    dataTag["GameRules"] = nbt.TAG_Compound([nbt.TAG_String(random.choice(["true", "false"]), "rule%d" % i)
+                                             for i in range(30)])
+
+    player = nbt.TAG_Compound()
+    player["Pos"] = doubleList(random.rand(3) * 100)
+    player["Motion"] = doubleList(random.rand(3))
+    player["Inventory"] = nbt.TAG_List([itemTag(random, slot) for slot in range(36)])
+    player["EnderItems"] = nbt.TAG_List([itemTag(random, slot) for slot in range(27)])
+    dataTag["Player"] = player
+
+    rootTag = nbt.TAG_Compound()
+    rootTag["Data"] = dataTag
+    return rootTag
+
+
+def makeSchematic(filename, random, size=64):
+    """ Saves a schematic filled with random blocks and a few chests """
+    schematic = MCSchematic(shape=(size, size, size))
+    schematic.Blocks[:] = random.randint(0, 8, schematic.Blocks.shape)
+    schematic.Data[:] = random.randint(0, 16, schematic.Data.shape)
+    schematic.TileEntities.extend(chunkTag(0, 0, random, sectionCount=0, entityCount=0)["Level"]["TileEntities"])
+    schematic.saveToFile(filename)
+
+
+def makeWorld(filename, random, size):
+    """ Creates a world of size by size chunks filled with random blocks up to y=64 """
+    level = MCInfdevOldLevel(filename=filename, create=True)
+    level.createChunksInBox(BoundingBox((0, 0, 0), (16 * size, 64, 16 * size)))
+    for chunk in level.getChunks():
+        chunk.Blocks[:, :, :64] = random.randint(1, 8, (16, 16, 64))
+        chunk.chunkChanged(False)
+    level.saveInPlace()
+    level.close()
+
+
+class SyntheticData(object):
+    """ The data all benchmarks work on, made once per process in a temporary folder """
+
+    def __init__(self, chunkCount, seed=0):
+        random = numpy.random.RandomState(seed)
+        self.folder = tempfile.mkdtemp("mcedit_benchmark")
+
+        self.chunkTags = [chunkTag(i, 0, random) for i in range(chunkCount)]
+        self.chunkData = [tag.save(compressed=False) for tag in self.chunkTags]
+        with nbt.littleEndianNBT():
+            self.pocketData = [tag.save(compressed=False) for tag in self.chunkTags]
+
+        self.levelDat = levelDatTag(random)
+        self.levelDatData = self.levelDat.save()
+
+        self.schematicPath = os.path.join(self.folder, "benchmark.schematic")
+        makeSchematic(self.schematicPath, random)
+
+        self.worldPath = os.path.join(self.folder, "World")
+        makeWorld(self.worldPath, random, max(1, int(chunkCount ** 0.5)))
+
+    def close(self):
+        shutil.rmtree(self.folder, True)
+
+
+# --- Benchmarks ---
+
+class Benchmark(object):
+    """ setup(data) returns the state passed to run(state) for each timed run, and teardown(state) cleans it up """
+
+    def __init__(self, name, run, setup=None, teardown=None):
+        self.name = name
+        self._run = run
+        self._setup = setup
+        self._teardown = teardown
+
+    def time(self, data, repeat):
+        """ Returns the shortest of repeat runs in seconds """
+        best = None
+        for i in range(repeat):
+            state = self._setup(data) if self._setup else data
+            try:
+                start = default_timer()
+                self._run(state)
+                elapsed = default_timer() - start
+            finally:
+                if self._teardown:
+                    self._teardown(state)
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+
+def loadChunks(data, **kw):
+    for chunkData in data.chunkData:
+        nbt.load(buf=chunkData, **kw)
+
+
+def loadPocketChunks(data):
+    with nbt.littleEndianNBT():
+        for chunkData in data.pocketData:
+            nbt.load(buf=chunkData)
+
+
+def savePocketChunks(data):
+    with nbt.littleEndianNBT():
+        for tag in data.chunkTags:
+            tag.save(compressed=False)
+
+
+def openWorld(data):
+    return MCInfdevOldLevel(filename=data.worldPath)
+
+
+def loadWorld(level):
+    for cPos in level.allChunks:
+        level.getChunk(*cPos).Blocks
+
+
+def dirtyWorld(data):
+    level = openWorld(data)
+    for chunk in level.getChunks():
+        chunk.Blocks
+        chunk.chunkChanged(False)
+    return level
+
+
+benchmarks = [
+    Benchmark("chunk.load", loadChunks),
+    Benchmark("chunk.load.views", lambda data: loadChunks(data, views=True)),
+    Benchmark("chunk.load.paths", lambda data: loadChunks(data, paths=["Level/xPos", "Level/zPos", "Level/Sections"])),
+    Benchmark("chunk.save", lambda data: [tag.save(compressed=False) for tag in data.chunkTags]),
+    Benchmark("chunk.save.deflated", lambda data: [tag.save_deflated(2) for tag in data.chunkTags]),
+    Benchmark("leveldat.load", lambda data: [nbt.load(buf=data.levelDatData) for i in range(20)]),
+    Benchmark("leveldat.save", lambda data: [data.levelDat.save() for i in range(20)]),
+    Benchmark("schematic.load", lambda data: MCSchematic(filename=data.schematicPath)),
+    Benchmark("schematic.save", lambda schematic: schematic.saveToFile(),
+              setup=lambda data: MCSchematic(filename=data.schematicPath)),
+    Benchmark("pocket.load", loadPocketChunks),
+    Benchmark("pocket.save", savePocketChunks),
+    Benchmark("world.load", loadWorld, setup=openWorld, teardown=lambda level: level.close()),
+    Benchmark("world.save", lambda level: level.saveInPlace(), setup=dirtyWorld,
+              teardown=lambda level: level.close()),
+]
+
+
+def runBenchmarks(patterns=("*",), chunkCount=16, repeat=3):
+    """ Times the benchmarks whose names match one of the patterns with the NBT implementation of this process and
+    returns a dict mapping their names to seconds """
+    data = SyntheticData(chunkCount)
+    try:
+        results = {}
+        for benchmark in benchmarks:
+            if any(fnmatch.fnmatch(benchmark.name, pattern) for pattern in patterns):
+                results[benchmark.name] = benchmark.time(data, repeat)
+        return results
+    finally:
+        data.close()
+
+
+def currentImplementation():
+    return "cython" if nbt.CYTHON else "python"
+
+
+def compareResults(results, baseline, tolerance):
+    """ Returns (implementation, name, baseline seconds, seconds, ratio) for each benchmark found in both, and the
+    ones slower than their baseline by more than tolerance """
+    rows = []
+    regressions = []
+    for implementation, times in sorted(results.iteritems()):
+        baseTimes = baseline.get(implementation, {})
+        for name, seconds in sorted(times.iteritems()):
+            if name not in baseTimes:
+                continue
+            ratio = seconds / baseTimes[name] if baseTimes[name] else float("inf")
+            row = (implementation, name, baseTimes[name], seconds, ratio)
+            rows.append(row)
+            if ratio > 1 + tolerance:
+                regressions.append(row)
+    return rows, regressions
+
+
+# --- Command line ---
+
+parser = optparse.OptionParser(usage="python -m pymclevel.test.benchmark [options] [benchmark patterns]")
+parser.add_option("--implementation", choices=["both", "cython", "python"], default="both",
+                  help="NBT implementation to time: both, cython or python [default: %default]")
+parser.add_option("--output", help="Write the results to this JSON file")
+parser.add_option("--baseline", help="Compare the results with this JSON file written by an earlier run")
+parser.add_option("--tolerance", type="float", default=0.25,
+                  help="Slowdown allowed before a benchmark counts as a regression [default: %default]")
+parser.add_option("--repeat", type="int", default=3, help="Runs per benchmark, the fastest is kept [default: %default]")
+parser.add_option("--chunks", type="int", default=16, help="Number of synthetic chunks [default: %default]")
+parser.add_option("--child", action="store_true", help=optparse.SUPPRESS_HELP)
+
+
+def runPurePython(options, patterns):
+    fd, path = tempfile.mkstemp(".json", "mcedit_benchmark")
+    os.close(fd)
+    try:
+        args = [sys.executable, "-c", PURE_PYTHON_CHILD, "--child", "--implementation", "python", "--output", path,
+                "--repeat", str(options.repeat), "--chunks", str(options.chunks)] + patterns
+        subprocess.check_call(args, cwd=os.path.dirname(os.path.dirname(os.path.abspath(pymclevel.__file__))))
+        with open(path) as f:
+            return json.load(f)["results"]["python"]
+    finally:
+        os.unlink(path)
+
+
+def main(argv):
+    options, args = parser.parse_args(argv[1:])
+    patterns = args or ["*"]
+
+    results = {}
+    implementations = ["cython", "python"] if options.implementation == "both" else [options.implementation]
+    for implementation in implementations:
+        if implementation == currentImplementation():
+            print >> sys.stderr, "Timing the {0} NBT implementation...".format(implementation)
+            results[implementation] = runBenchmarks(patterns, options.chunks, options.repeat)
+        elif implementation == "python":
+            results[implementation] = runPurePython(options, patterns)
+        else:
+            print >> sys.stderr, "The Cython NBT implementation is not available: _nbt could not be imported."
+            print >> sys.stderr, "(Did _nbt.pyx fail to build? Run 'setup.py build_ext --inplace' in pymclevel.)"
+            return 2
+
+    report = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "chunks": options.chunks,
+        "repeat": options.repeat,
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if options.child:
+        return 0
+
+    names = sorted(set(name for times in results.itervalues() for name in times))
+    print "{0:22} {1:>12} {2:>12} {3:>8}".format("benchmark", "cython ms", "python ms", "speedup")
+    for name in names:
+        cython = results.get("cython", {}).get(name)
+        python = results.get("python", {}).get(name)
+        print "{0:22} {1:>12} {2:>12} {3:>8}".format(
+            name,
+            "%.1f" % (cython * 1000) if cython is not None else "-",
+            "%.1f" % (python * 1000) if python is not None else "-",
+            "%.1fx" % (python / cython) if cython and python is not None else "-")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)["results"]
+        rows, regressions = compareResults(results, baseline, options.tolerance)
+        print
+        print "{0:8} {1:22} {2:>12} {3:>12} {4:>8}".format("nbt", "benchmark", "baseline ms", "ms", "ratio")
+        for implementation, name, baseSeconds, seconds, ratio in rows:
+            print "{0:8} {1:22} {2:>12.1f} {3:>12.1f} {4:>8.2f}{5}".format(
+                implementation, name, baseSeconds * 1000, seconds * 1000, ratio,
+                " REGRESSION" if ratio > 1 + options.tolerance else "")
+        if regressions:
+            print "{0} benchmarks are slower than the baseline.".format(len(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,4 +1,9 @@
-from pymclevel import fromFile
+import itertools
+
+from pymclevel import fromFile, nbt
+from pymclevel.box import BoundingBox
+from pymclevel.entity import Entity, TileEntity
+from pymclevel.schematic import MCSchematic
 from templevel import TempLevel
 
 __author__ = 'Rio'
@@ -19,3 +24,56 @@ def test_command_block():
     assert x == str(point[0])
     assert y == str(point[1] + 10)
     assert z == str(point[2])
+
+
+def positionTag(id, pos):
+    tag = nbt.TAG_Compound()
+    tag["id"] = nbt.TAG_String(id)
+    for name, value in zip("xyz", pos):
+        tag[name] = nbt.TAG_Int(value)
+    return tag
+
+
+def entityTag(id, pos):
+    tag = nbt.TAG_Compound()
+    tag["id"] = nbt.TAG_String(id)
+    tag["Pos"] = nbt.TAG_List([nbt.TAG_Double(p) for p in pos])
+    tag["Rotation"] = nbt.TAG_List([nbt.TAG_Float(0), nbt.TAG_Float(0)])
+    return tag
+
+
+def test_entity_index():
+    schematic = MCSchematic(shape=(32, 16, 32))
+    for x, z in itertools.product(range(32), range(32)):
+        schematic.addTileEntity(positionTag("Hopper", (x, 1, z)))
+    assert len(schematic.TileEntities) == 32 * 32
+    assert TileEntity.pos(schematic.tileEntityAt(3, 1, 4)) == [3, 1, 4]
+
+    # adding a tile entity replaces the one at its position
+    schematic.addTileEntity(positionTag("Chest", (3, 1, 4)))
+    assert len(schematic.TileEntities) == 32 * 32
+    assert schematic.tileEntityAt(3, 1, 4)["id"].value == "Chest"
+    assert len(schematic.getTileEntitiesInBox(BoundingBox((0, 0, 0), (2, 2, 3)))) == 6
+    assert len(schematic.getTileEntitiesInBox(schematic.bounds)) == 32 * 32
+
+    # editing the list directly is noticed
+    schematic.removeTileEntitiesInBox(BoundingBox((5, 1, 5), (1, 1, 1)))
+    schematic.TileEntities.append(positionTag("Hopper", (5, 2, 5)))
+    assert schematic.tileEntityAt(5, 1, 5) is None
+    assert schematic.tileEntityAt(5, 2, 5) is not None
+    del schematic.TileEntities[:]
+    assert schematic.tileEntityAt(3, 1, 4) is None
+
+    for i in range(10):
+        schematic.addEntity(entityTag("Pig", (i * 3 + 0.5, 2, 1.5)))
+    assert len(schematic.getEntitiesInBox(BoundingBox((0, 0, 0), (16, 16, 16)))) == 6
+    assert len(schematic.getEntitiesInBox(BoundingBox((15, 2, 1), (6, 1, 1)))) == 2
+
+    schematic.addTileTick(positionTag("minecraft:stone", (1, 1, 1)))
+    schematic.addTileTick(positionTag("minecraft:stone", (1, 1, 1)))
+    assert len(schematic.getTileTicksInBox(schematic.bounds)) == 1
+
+    # tile entities moved in place are found after the index is reset
+    schematic.addTileEntity(positionTag("Chest", (0, 1, 2)))
+    schematic.rotateLeft()
+    assert schematic.tileEntityAt(2, 1, 31) is not None
@@ -3,9 +3,10 @@ import os
 from os.path import join
 import time
 import unittest
+import zlib
 import numpy
 from pymclevel import nbt
-from templevel import TempLevel
+from templevel import TempLevel, mktemp
 
 __author__ = 'Rio'
 
@@ -129,6 +130,94 @@ class TestNBT():
         level["Entities"][0] = nbt.TAG_Compound([nbt.TAG_String("Creeper", "id"),
                                                  nbt.TAG_List([nbt.TAG_Double(d) for d in (1, 1, 1)], "Pos")])
 
+    def testLoadViews(self):
+        level = nbt.TAG_Compound()
+        level["Map"] = nbt.TAG_Compound()
+        level["Map"]["Blocks"] = nbt.TAG_Byte_Array(numpy.arange(64, dtype='uint8'))
+        level["Ints"] = nbt.TAG_Int_Array(numpy.arange(5, dtype='>u4'))
+        level["Longs"] = nbt.TAG_Long_Array(numpy.arange(-3, 3, dtype='>q'))
+        level["Empty"] = nbt.TAG_Byte_Array()
+        data = level.save(compressed=False)
+
+        copied = nbt.load(buf=data)
+        viewed = nbt.load(buf=data, views=True)
+        for name in ("Ints", "Longs", "Empty"):
+            assert (copied[name].value == viewed[name].value).all()
+            assert copied[name].value.dtype == viewed[name].value.dtype
+        assert (copied["Map"]["Blocks"].value == viewed["Map"]["Blocks"].value).all()
+
+        def bufferOf(arr):
+            while getattr(arr, "base", None) is not None:
+                arr = arr.base
+            return arr
+
+        # all arrays share one buffer, and changing one leaves the others alone
+        assert bufferOf(viewed["Ints"].value) is bufferOf(viewed["Map"]["Blocks"].value)
+        viewed["Ints"].value[:] = 7
+        viewed = nbt.load(buf=viewed.save(compressed=False))
+        assert (viewed["Ints"].value == 7).all()
+        assert (copied["Longs"].value == viewed["Longs"].value).all()
+        assert (copied["Map"]["Blocks"].value == viewed["Map"]["Blocks"].value).all()
+
+    @staticmethod
+    def testLoadPaths():
+        chunkTag = nbt.TAG_Compound()
+        levelTag = chunkTag["Level"] = nbt.TAG_Compound()
+        levelTag["xPos"] = nbt.TAG_Int(3)
+        levelTag["LastUpdate"] = nbt.TAG_Long(1234)
+        levelTag["HeightMap"] = nbt.TAG_Int_Array(numpy.arange(256, dtype='>u4'))
+        levelTag["Sections"] = nbt.TAG_List([nbt.TAG_Compound([nbt.TAG_Byte(y, "Y"),
+                                                               nbt.TAG_Byte_Array(numpy.zeros(4096, 'uint8'),
+                                                                                  "Blocks")])
+                                             for y in range(3)])
+        levelTag["Entities"] = nbt.TAG_List([nbt.TAG_Compound([nbt.TAG_String("Pig", "id"),
+                                                               nbt.TAG_List([nbt.TAG_Double(d) for d in (1, 2, 3)],
+                                                                            "Pos"),
+                                                               nbt.TAG_List([nbt.TAG_String("a")], "Tags"),
+                                                               nbt.TAG_Compound([nbt.TAG_Float(0.5, "f")], "Extra")])
+                                             for i in range(5)])
+        levelTag["TileTicks"] = nbt.TAG_List()
+        data = chunkTag.save(compressed=False)
+
+        tag = nbt.load(buf=data, paths=["Level/xPos", "Level/LastUpdate"])
+        assert sorted(tag["Level"].keys()) == ["LastUpdate", "xPos"]
+        assert tag["Level"]["LastUpdate"].value == 1234
+
+        tag = nbt.load(buf=data, paths=["Level/Entities/id", "Level/Sections"])
+        assert sorted(tag["Level"].keys()) == ["Entities", "Sections"]
+        assert [entity.keys() for entity in tag["Level"]["Entities"]] == [["id"]] * 5
+        assert [(section["Y"].value, len(section["Blocks"].value)) for section in tag["Level"]["Sections"]] == \
+            [(0, 4096), (1, 4096), (2, 4096)]
+
+        # a path to a tag loads everything inside it, even if longer paths into it are also given
+        tag = nbt.load(buf=data, paths=["Level/Entities/Pos", "Level"])
+        assert tag.save(compressed=False) == data
+
+        assert not nbt.load(buf=data, paths=["Missing"]).keys()
+
+    @staticmethod
+    def testStream():
+        level = nbt.TAG_Compound()
+        level["Blocks"] = nbt.TAG_Byte_Array(numpy.arange(100000, dtype='uint32').astype('uint8'))
+        level["Heights"] = nbt.TAG_Int_Array(numpy.arange(512, dtype='>u4').reshape(16, 32)[:, ::2])
+        level["Entities"] = nbt.TAG_List([nbt.TAG_Compound([nbt.TAG_String("Pig", "id")]) for i in range(5000)])
+        data = level.save(compressed=False)
+
+        pieces = []
+        level.stream(pieces.append)
+        assert "".join(str(piece) for piece in pieces) == data
+        assert len(pieces) > 2
+
+        assert zlib.decompress(level.save_deflated(2)) == data
+        assert (nbt.load(buf=level.save())["Heights"].value == level["Heights"].value.ravel()).all()
+
+        path = mktemp("stream.dat")
+        level.save(path)
+        try:
+            assert nbt.load(path).save(compressed=False) == data
+        finally:
+            os.unlink(path)
+
     @staticmethod
     def testMultipleCompound():
         """ According to rumor, some TAG_Compounds store several tags with the same name. Once I find a chunk file
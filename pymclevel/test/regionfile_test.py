@@ -0,0 +1,204 @@
+import gc
+import os
+import unittest
+
+import numpy
+
+from pymclevel import nbt, regionfile
+from pymclevel.regionfile import MCRegionFile
+from templevel import mktemp
+
+__author__ = 'Rio'
+
+
+def chunkData(cx, cz, size=0):
+    chunkTag = nbt.TAG_Compound()
+    chunkTag["Level"] = nbt.TAG_Compound()
+    chunkTag["Level"]["xPos"] = nbt.TAG_Int(cx)
+    chunkTag["Level"]["zPos"] = nbt.TAG_Int(cz)
+    chunkTag["Level"]["Padding"] = nbt.TAG_Byte_Array(numpy.fromstring(os.urandom(size), "uint8"))
+    return chunkTag.save(compressed=False)
+
+
+class TestRegionFile(unittest.TestCase):
+    def setUp(self):
+        self.oldUseMmap = MCRegionFile.useMmap
+        self.paths = []
+
+    def tearDown(self):
+        MCRegionFile.useMmap = self.oldUseMmap
+        for path in self.paths:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def openRegion(self, name="r.0.0.mca"):
+        path = mktemp(name)
+        self.paths.append(path)
+        return MCRegionFile(path, (0, 0))
+
+    def roundTrip(self):
+        rf = self.openRegion()
+        saved = {}
+        for cx, cz in ((0, 0), (1, 0), (31, 31), (5, 7)):
+            saved[cx, cz] = chunkData(cx, cz, 6000)
+            rf.saveChunk(cx, cz, saved[cx, cz])
+
+        # grow one chunk past its allocation and shrink another
+        saved[1, 0] = chunkData(1, 0, 20000)
+        rf.saveChunk(1, 0, saved[1, 0])
+        saved[0, 0] = chunkData(0, 0, 10)
+        rf.saveChunk(0, 0, saved[0, 0])
+
+        for (cx, cz), data in saved.iteritems():
+            assert rf.readChunk(cx, cz) == data
+
+        path = rf.path
+        rf.close()
+        rf = MCRegionFile(path, (0, 0))
+        for (cx, cz), data in saved.iteritems():
+            assert rf.readChunk(cx, cz) == data
+        assert rf.chunkCount == len(saved)
+        rf.close()
+
+    def testRoundTrip(self):
+        MCRegionFile.useMmap = False
+        self.roundTrip()
+
+    def testRoundTripMmap(self):
+        MCRegionFile.useMmap = True
+        self.roundTrip()
+
+    def testSaveChunks(self):
+        rf = self.openRegion()
+        rf.saveChunk(3, 3, chunkData(3, 3, 100))
+        saved = dict(((cx, cz), chunkData(cx, cz, 3000 * cx)) for cx in range(6) for cz in range(2))
+        rf.saveChunks((cx, cz, data) for (cx, cz), data in saved.iteritems())
+        # rewrite some of them larger so they have to move
+        for cx in range(3):
+            saved[cx, 0] = chunkData(cx, 0, 9000)
+        rf.saveChunks((cx, 0, saved[cx, 0]) for cx in range(3))
+        saved[3, 3] = rf.readChunk(3, 3)
+
+        path = rf.path
+        rf.close()
+        rf = MCRegionFile(path, (0, 0))
+        for (cx, cz), data in saved.iteritems():
+            assert rf.readChunk(cx, cz) == data
+            assert rf.getTimestamp(cx, cz) > 0
+        assert rf.chunkCount == len(saved)
+        assert rf.usedSectors + len(rf.sectors.freeRuns()) <= rf.sectorCount
+        rf.close()
+
+    def testSaveChunksTooBig(self):
+        rf = self.openRegion()
+        rf.compressMode = MCRegionFile.VERSION_UNCOMPRESSED
+        a = chunkData(0, 0, 100)
+        rf.saveChunk(0, 0, a)
+        offsets = rf.offsets.copy()
+        usedSectors = rf.usedSectors
+
+        # the first chunk would move before the second one turns out too big
+        self.assertRaises(regionfile.ChunkTooBig, rf.saveChunks,
+                          [(0, 0, chunkData(0, 0, 9000)), (2, 0, chunkData(2, 0, 1100000))])
+        assert (rf.offsets == offsets).all()
+        assert rf.usedSectors == usedSectors
+
+        rf.saveChunk(3, 0, chunkData(3, 0, 3000))
+        assert rf.readChunk(0, 0) == a
+
+        # moved chunks don't reuse the sectors freed in the same batch
+        oldSector = rf.getOffset(0, 0) >> 8
+        rf.saveChunks([(0, 0, chunkData(0, 0, 9000)), (4, 0, chunkData(4, 0, 10))])
+        assert rf.getOffset(4, 0) >> 8 != oldSector
+        assert rf.sectors.isFree(oldSector)
+        rf.close()
+
+    def testCompression(self):
+        data = chunkData(0, 0) + "\0" * 60000
+        for compressMode, compressLevel in ((MCRegionFile.VERSION_DEFLATE, 9),
+                                            (MCRegionFile.VERSION_UNCOMPRESSED, 0),
+                                            MCRegionFile.fastestCompression()):
+            rf = self.openRegion()
+            rf.compressMode = compressMode
+            rf.compressLevel = compressLevel
+            rf.saveChunk(0, 0, data)
+            rf.saveChunks([(1, 0, data)])
+            assert rf.readChunk(0, 0) == data
+            assert rf.readChunk(1, 0) == data
+            assert rf._readChunk(0, 0)[1] == compressMode
+            rf.close()
+
+    def testOpenRegionLimit(self):
+        MCRegionFile.useMmap = True
+        oldLimit = regionfile.openRegionFiles.limit
+        regionfile.openRegionFiles.limit = 2
+        try:
+            regions = [self.openRegion("r.%d.0.mca" % i) for i in range(4)]
+            for i, rf in enumerate(regions):
+                rf.saveChunk(0, 0, chunkData(i, 0))
+            assert len(regionfile.openRegionFiles) == 2
+            assert regions[0] not in regionfile.openRegionFiles
+
+            # evicted region files are reopened on demand
+            for i, rf in enumerate(regions):
+                assert nbt.load(buf=rf.readChunk(0, 0))["Level"]["xPos"].value == i
+
+            target = regions[0]
+            for source in regions[1:]:
+                target.copyChunkFrom(source, 0, 0)
+                assert target.readChunk(0, 0) == source.readChunk(0, 0)
+        finally:
+            for rf in regions:
+                rf.close()
+            regionfile.openRegionFiles.limit = oldLimit
+
+    def testUnreferencedRegionClosed(self):
+        MCRegionFile.useMmap = True
+        rf = self.openRegion()
+        rf.saveChunk(0, 0, chunkData(0, 0))
+        assert rf in regionfile.openRegionFiles
+        count = len(regionfile.openRegionFiles)
+        f = rf._file
+
+        # a region file of a level that was never closed doesn't stay open
+        del rf
+        gc.collect()
+        assert len(regionfile.openRegionFiles) == count - 1
+        assert f.closed
+
+
+class TestSectorAllocator(unittest.TestCase):
+    def testBestFit(self):
+        sectors = regionfile.SectorAllocator(20)
+        sectors.reserve(2, 18)
+        sectors.free(4, 5)
+        sectors.free(12, 2)
+        assert sectors.freeRuns() == [(4, 5), (12, 2)]
+
+        assert sectors.allocate(2) == 12
+        assert sectors.allocate(3) == 4
+        assert sectors.freeRuns() == [(7, 2)]
+        assert sectors.usedCount == 18
+
+    def testMerge(self):
+        sectors = regionfile.SectorAllocator(12)
+        sectors.reserve(2, 10)
+        sectors.free(3, 2)
+        sectors.free(7, 2)
+        sectors.free(5, 2)
+        assert sectors.freeRuns() == [(3, 6)]
+
+    def testGrow(self):
+        sectors = regionfile.SectorAllocator(10)
+        sectors.reserve(2, 6)
+        # the free run at the end of the file is extended instead of skipped
+        assert sectors.allocate(4) == 8
+        assert sectors.sectorCount == 12
+        assert sectors.allocateMany([1, 3]) == [12, 13]
+        assert sectors.sectorCount == 16
+
+    def testReserveOverlap(self):
+        sectors = regionfile.SectorAllocator(10)
+        assert not sectors.reserve(2, 3)
+        assert sectors.reserve(4, 2)
+        assert sectors.reserve(8, 4)
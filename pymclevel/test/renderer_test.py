@@ -0,0 +1,400 @@
+"""
+Tests for greedy meshing, partial chunk rebuilds and the vertex buffer path of the renderer. mergeFaces, changedSections,
+packVertices and BufferPool are tested without a display, BufferPool with FakeGL in place of OpenGL.GL. TestDraw draws chunks in different ways and compares
+the pixels; it needs Mesa's software GL and only runs with PYOPENGL_PLATFORM set to osmesa or egl:
+
+    PYOPENGL_PLATFORM=egl EGL_PLATFORM=surfaceless python -m pytest test/renderer_test.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from pymclevel.box import BoundingBox
+import renderer
+from renderer import mergeFaces, packVertices, packedVertexScale
+
+try:
+    import glutils
+except ImportError:
+    glutils = None
+
+
+def vertexArray(count, textured, random):
+    """ Returns a vertex array of count quads on the grid that packVertices can pack exactly """
+    buf = numpy.zeros((count, 4, 6 if textured else 4), 'float32')
+    buf[..., :3] = random.randint(-32, 256 * packedVertexScale, (count, 4, 3)) / float(packedVertexScale)
+    if textured:
+        buf[..., 3:5] = random.randint(0, 576, (count, 4, 2))
+    buf.view('uint8')[..., -4:] = random.randint(0, 256, (count, 4, 4))
+    return buf
+
+
+class TestMergeFaces(unittest.TestCase):
+    def testCover(self):
+        random = numpy.random.RandomState(3)
+        for shape, keyCount in (((3, 16, 16), 2), ((2, 16, 48), 4), ((1, 5, 7), 1), ((2, 1, 9), 3)):
+            keys = random.randint(0, keyCount, shape)
+            keys[random.randint(0, 4, shape) == 0] = -1
+            covered = numpy.zeros(shape, 'int32')
+            rects = zip(*mergeFaces(keys))
+            for n, v, u, lengthV, lengthU in rects:
+                rect = numpy.s_[n, v:v + lengthV, u:u + lengthU]
+                assert keys[rect].shape == (lengthV, lengthU)
+                assert (keys[rect] == keys[n, v, u]).all()
+                covered[rect] += 1
+
+            # every face is covered by exactly one rectangle, and nothing else is
+            assert (covered == (keys >= 0)).all()
+            assert len(rects) < (keys >= 0).sum()
+
+        assert len(mergeFaces(numpy.zeros((2, 4, 4), 'int32'))[0]) == 2
+        assert len(mergeFaces(numpy.zeros((2, 4, 4), 'int32') - 1)[0]) == 0
+
+
+class TestGreedyBlockRenderer(unittest.TestCase):
+    def testTextureAxes(self):
+        # the x, z and y axes of the block arrays are the x, y and z columns of the templates
+        columns = {0: 0, 1: 2, 2: 1}
+        for direction, axes in renderer.GreedyBlockRenderer.textureAxes.iteritems():
+            template = renderer.faceVertexTemplates[direction]
+            for i, axis in enumerate(axes):
+                # s or t goes across the tile as the position goes across the block, one way or the other
+                position = template[:, columns[axis]]
+                texture = template[:, 3 + i] / 16
+                assert (texture == position).all() or (texture == 1 - position).all(), (direction, i)
+
+
+class TestChangedSections(unittest.TestCase):
+    def setUp(self):
+        from pymclevel.infiniteworld import MCInfdevOldLevel
+        self.tempFolder = tempfile.mkdtemp("renderer_test")
+        self.level = level = MCInfdevOldLevel(filename=os.path.join(self.tempFolder, "World"), create=True)
+        level.createChunksInBox(BoundingBox((0, 0, 0), (48, level.Height, 48)))
+        level.fillBlocks(BoundingBox((0, 0, 0), (48, 64, 48)), level.materials.Stone)
+        level.generateLights()
+
+    def tearDown(self):
+        self.level.close()
+        shutil.rmtree(self.tempFolder, True)
+
+    @staticmethod
+    def geometry(cr):
+        return sorted((type(br).__name__, getattr(br, "y", None), buf.tostring())
+                      for br in cr.blockRenderers for buf in br.vertexArrays)
+
+    def testRoof(self):
+        level = self.level
+        mesher = renderer.ChunkMesher(level, 0, [renderer.Layer.Blocks])
+        cr = mesher.meshChunk(1, 1)
+        before = self.geometry(cr)
+
+        # the roof shades the ground far below it, in sections the box doesn't reach
+        box = BoundingBox((4, 100, 4), (40, 1, 40))
+        level.fillBlocks(box, level.materials.Stone)
+        sections = renderer.changedSections(level, box.expand(1))
+        assert sections == range(0, 112, 16)
+
+        cr.invalidate([renderer.Layer.Blocks], sections)
+        for _ in cr.calcFaces():
+            pass
+        after = self.geometry(mesher.meshChunk(1, 1))
+        assert after != before
+        assert self.geometry(cr) == after
+
+        # once the chunks are lit, only the sections the box reaches change
+        level.generateLights()
+        assert renderer.changedSections(level, box.expand(1)) == [96]
+
+
+class TestPackVertices(unittest.TestCase):
+    def testRoundTrip(self):
+        random = numpy.random.RandomState(0)
+        arrays = [vertexArray(50, True, random), vertexArray(20, False, random)]
+        textured, flat = packVertices(arrays)
+        assert textured.dtype == renderer.packedVertexDtype and textured.itemsize == 16
+        assert flat.dtype == renderer.packedFlatVertexDtype and flat.itemsize == 12
+
+        for buf, packed in zip(arrays, (textured, flat)):
+            floats = buf.reshape(-1, buf.shape[-1])
+            assert (packed["xyz"] / float(packedVertexScale) == floats[:, :3]).all()
+            assert (packed["rgba"] == floats.view('uint8')[:, -4:]).all()
+        assert (textured["st"] == arrays[0].reshape(-1, 6)[:, 3:5]).all()
+
+    def testOffGrid(self):
+        random = numpy.random.RandomState(1)
+        for index, value in (((3, 1, 0), 0.3),  # a position between 1/64ths
+                             ((3, 1, 4), 0.5),  # a texture coordinate between texels
+                             ((3, 1, 1), 600.)):  # too far for a short
+            buf = vertexArray(10, True, random)
+            buf[index] = value
+            assert packVertices([vertexArray(10, False, random), buf]) is None
+
+        assert packVertices([numpy.zeros((2, 4, 6), 'float64')]) is None
+
+
+class FakeGL(object):
+    """ Just enough of OpenGL.GL for a BufferPool. The buffers are bytearrays. """
+    GL_ARRAY_BUFFER = 0x8892
+    GL_DYNAMIC_DRAW = 0x88E8
+
+    def __init__(self):
+        self.buffers = {}
+        self.lastBuffer = 0
+        self.bound = 0
+
+    def glGenBuffers(self, count):
+        self.lastBuffer += 1
+        return self.lastBuffer
+
+    def glBindBuffer(self, target, buffer):
+        self.bound = buffer
+
+    def glBufferData(self, target, size, data, usage):
+        self.buffers[self.bound] = bytearray(size)
+
+    def glBufferSubData(self, target, offset, size, data):
+        self.buffers[self.bound][offset:offset + size] = data.tostring()
+
+    def glDeleteBuffers(self, count, buffers):
+        for buffer in buffers:
+            del self.buffers[buffer]
+
+
+@unittest.skipIf(glutils is None, "glutils needs PyOpenGL")
+class TestBufferPool(unittest.TestCase):
+    def setUp(self):
+        self.oldGL = glutils.GL
+        self.gl = glutils.GL = FakeGL()
+
+    def tearDown(self):
+        glutils.GL = self.oldGL
+
+    def testUpload(self):
+        pool = glutils.BufferPool(4096)
+        first = pool.upload(numpy.arange(10, dtype='uint8'))
+        data = numpy.arange(17, dtype='uint8') + 100
+        second = pool.upload(data)
+        assert (first.offset, first.size) == (0, 16)
+        assert (second.offset, second.size) == (16, 32)
+        assert pool.usedBytes == 48
+        assert self.gl.buffers[second.buffer][16:33] == data.tostring()
+        assert self.gl.bound == 0
+
+    def testFirstFit(self):
+        pool = glutils.BufferPool(4096)
+        a, b, c = [pool.allocate(100) for i in range(3)]
+        assert [r.offset for r in (a, b, c)] == [0, 112, 224]
+        b.free()
+        assert pool.allocate(50).offset == 112
+        # the 48 bytes left of b's range are too small
+        assert pool.allocate(60).offset == 336
+        assert pool.freeRanges[a.buffer] == [[176, 48], [400, 3696]]
+
+    def testCoalesce(self):
+        pool = glutils.BufferPool(4096)
+        ranges = [pool.allocate(100) for i in range(4)]
+        for i in (0, 2, 1):
+            ranges[i].free()
+        assert pool.freeRanges[ranges[0].buffer] == [[0, 336], [448, 3648]]
+        ranges[3].free()
+        ranges[3].free()
+        assert pool.freeRanges[ranges[0].buffer] == [[0, 4096]]
+        assert pool.usedBytes == 0
+
+    def testEmptyBuffers(self):
+        pool = glutils.BufferPool(1024)
+        a = pool.allocate(1000)
+        b = pool.allocate(1000)
+        big = pool.allocate(5000)
+        assert len(set([a.buffer, b.buffer, big.buffer])) == 3
+        assert pool.bufferSizes[big.buffer] == 5008
+
+        big.free()
+        assert big.buffer not in self.gl.buffers
+        a.free()
+        b.free()
+        # one empty buffer is kept for the next ranges
+        assert len(pool.bufferSizes) == 1 and len(self.gl.buffers) == 1
+        assert pool.usedBytes == 0
+
+        pool.allocate(10)
+        pool.delete()
+        assert not self.gl.buffers and not pool.bufferSizes
+
+
+def makeContext(width, height):
+    """ Makes a GL context with Mesa's software GL and returns a function that reads its pixels """
+    from OpenGL import GL
+    if os.environ["PYOPENGL_PLATFORM"] == "osmesa":
+        from OpenGL import arrays, osmesa
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        pixels = arrays.GLubyteArray.zeros((height, width, 4))
+        osmesa.OSMesaMakeCurrent(context, pixels, GL.GL_UNSIGNED_BYTE, width, height)
+    else:
+        import ctypes
+        from OpenGL import EGL
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        EGL.eglInitialize(display, ctypes.pointer(EGL.EGLint()), ctypes.pointer(EGL.EGLint()))
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context = EGL.eglCreateContext(display, EGL.EGLConfig(), EGL.EGL_NO_CONTEXT, None)
+        EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, GL.glGenFramebuffers(1))
+        for storage, attachment in ((GL.GL_RGBA8, GL.GL_COLOR_ATTACHMENT0),
+                                    (GL.GL_DEPTH_COMPONENT24, GL.GL_DEPTH_ATTACHMENT)):
+            GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, GL.glGenRenderbuffers(1))
+            GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, storage, width, height)
+            GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER, attachment, GL.GL_RENDERBUFFER,
+                                         GL.glGetIntegerv(GL.GL_RENDERBUFFER_BINDING))
+    GL.glViewport(0, 0, width, height)
+
+    def readPixels():
+        data = GL.glReadPixels(0, 0, width, height, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
+        return numpy.frombuffer(data, 'uint8').reshape(height, width, 4).copy()
+
+    return readPixels
+
+
+@unittest.skipIf(os.environ.get("PYOPENGL_PLATFORM") not in ("osmesa", "egl") or glutils is None,
+                 "needs PyOpenGL with PYOPENGL_PLATFORM=osmesa or egl")
+class TestDraw(unittest.TestCase):
+    size = 256
+
+    # Display lists and vertex arrays take different paths through Mesa, which may round a few pixels at the edges
+    # of faces differently
+    maxDifferentPixels = 0.001
+
+    @classmethod
+    def setUpClass(cls):
+        import meshbench
+        from pymclevel.infiniteworld import MCInfdevOldLevel
+        cls.tempFolder = tempfile.mkdtemp("renderer_test")
+        path = os.path.join(cls.tempFolder, "World")
+        meshbench.makeWorld(path, 3)
+        cls.level = MCInfdevOldLevel(filename=path, readonly=True)
+        cls.readPixels = staticmethod(makeContext(cls.size, cls.size))
+
+        # a terrain texture of random texels, so that wrong texture coordinates change the pixels
+        GL = renderer.GL
+        texels = numpy.random.RandomState(2).randint(0, 256, (512, 512, 4)).astype('uint8')
+        texels[..., 3] = 255
+        terrainTexture = glutils.Texture(lambda: GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, 512, 512, 0,
+                                                                 GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, texels))
+        terrainTexture.data = texels
+        glutils.makeTileTextures(terrainTexture, 512)
+        materials = cls.level.materials
+        cls.oldTerrainTexture = materials.__dict__.get("_terrainTexture")
+        materials.terrainTexture = terrainTexture
+
+        GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glLoadIdentity()
+        GL.glOrtho(-16, 16, -16, 16, -200, 200)
+        GL.glMatrixMode(GL.GL_TEXTURE)
+        GL.glLoadIdentity()
+        GL.glScale(1 / 512., 1 / 512., 1)
+        # like MCRenderer.draw, which the renderstates expect
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glEnable(GL.GL_CULL_FACE)
+        GL.glAlphaFunc(GL.GL_NOTEQUAL, 0)
+        for state in (GL.GL_VERTEX_ARRAY, GL.GL_TEXTURE_COORD_ARRAY, GL.GL_COLOR_ARRAY):
+            GL.glEnableClientState(state)
+
+    @classmethod
+    def tearDownClass(cls):
+        materials = cls.level.materials
+        del materials.__dict__["_terrainTexture"]
+        if cls.oldTerrainTexture is not None:
+            materials.terrainTexture = cls.oldTerrainTexture
+        cls.level.close()
+        shutil.rmtree(cls.tempFolder, True)
+
+    def meshChunk(self, detailLevel, greedy, cx=1, cz=1, pitch=30, yaw=45):
+        mesher = renderer.ChunkMesher(self.level, detailLevel, [renderer.Layer.Blocks])
+        mesher.chunkCalculator.greedyMeshing = greedy
+        cr = mesher.meshChunk(cx, cz)
+
+        GL = renderer.GL
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+        GL.glLoadIdentity()
+        GL.glRotate(pitch, 1, 0, 0)
+        GL.glRotate(yaw, 0, 1, 0)
+        GL.glTranslate(-(cx << 4) - 8, -64, -(cz << 4) - 8)
+        return cr
+
+    def drawChunk(self, cr, pool):
+        GL = renderer.GL
+        GL.glClearColor(0.2, 0.3, 0.4, 1.0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+        self.level.materials.terrainTexture.bind()
+        draws = []
+        for br in cr.blockRenderers:
+            br.renderstate.bind()
+            if pool is None:
+                GL.glCallList(br.makeArrayList(cr.chunkPosition, False))
+            else:
+                draw = br.makeVertexBufferDraw(cr.chunkPosition, pool, False)
+                draw.draw()
+                draws.append(draw)
+            br.renderstate.release()
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glFinish()
+        return self.readPixels(), draws
+
+    def assertSamePixels(self, pixels, otherPixels, maxDifferent=0):
+        assert (pixels != pixels[0, 0]).any()
+        different = (pixels != otherPixels).any(-1).mean()
+        assert different <= maxDifferent, different
+
+    def testVertexBuffers(self):
+        packed = unpacked = 0
+        for detailLevel, greedy in ((0, False), (0, True), (1, False)):
+            cr = self.meshChunk(detailLevel, greedy)
+            listPixels, _ = self.drawChunk(cr, None)
+            pool = glutils.BufferPool()
+            bufferPixels, draws = self.drawChunk(cr, pool)
+
+            self.assertSamePixels(listPixels, bufferPixels, self.maxDifferentPixels)
+            for draw in draws:
+                for vertexRange in draw.ranges:
+                    if vertexRange.packed:
+                        packed += 1
+                    else:
+                        unpacked += 1
+                draw.free()
+            assert pool.usedBytes == 0
+            pool.delete()
+
+        # both the packed format and the float fallback were drawn
+        assert packed and unpacked
+
+    def testGreedyMeshing(self):
+        GL = renderer.GL
+        GL.glEnable(GL.GL_DEPTH_TEST)
+        textureCount = len(glutils.Texture.allTextures)
+        pool = glutils.BufferPool()
+        try:
+            # from above on two sides and from below, so that faces pointing every way are seen
+            for pitch, yaw in ((30, 45), (30, 225), (-30, 135)):
+                cr = self.meshChunk(0, False, pitch=pitch, yaw=yaw)
+                pixels, _ = self.drawChunk(cr, None)
+                greedyCr = self.meshChunk(0, True, pitch=pitch, yaw=yaw)
+                greedyPixels, _ = self.drawChunk(greedyCr, None)
+                bufferPixels, draws = self.drawChunk(greedyCr, pool)
+                for draw in draws:
+                    draw.free()
+
+                # the merged faces look the same, textures included
+                self.assertSamePixels(pixels, greedyPixels, self.maxDifferentPixels)
+                self.assertSamePixels(greedyPixels, bufferPixels, self.maxDifferentPixels)
+        finally:
+            GL.glDisable(GL.GL_DEPTH_TEST)
+            pool.delete()
+
+        # the tile textures were all made with the terrain texture
+        assert len(glutils.Texture.allTextures) == textureCount
+
+        assert any(isinstance(br, renderer.GreedyBlockRenderer) for br in greedyCr.blockRenderers)
+        assert greedyCr.bufferSize < cr.bufferSize
@@ -15,6 +15,14 @@ def natural_relight():
     world.chunkCount, t, t / world.chunkCount * 1000)
 
 
+def fast_lights():
+    world = mclevel.fromFile("testfiles/AnvilWorld")
+    chunks = list(world.getChunks())
+    t = timeit(lambda: [chunk.genFastLights() for chunk in chunks], number=1)
+    print "Fast lights: %d chunks in %.02f seconds (%.02fms per chunk)" % (
+    len(chunks), t, t / len(chunks) * 1000)
+
+
 def manmade_relight():
     t = templevel.TempLevel("TimeRelight", createFunc=lambda f: MCInfdevOldLevel(f, create=True))
 
@@ -33,5 +41,6 @@ def manmade_relight():
 
 
 if __name__ == '__main__':
+    fast_lights()
     natural_relight()
     manmade_relight()
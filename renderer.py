@@ -35,6 +35,11 @@ MCRenderer:
             Has "vertexArrays"
             One per block type, plus one for low detail and one for Entity
 
+        ChunkMeshJob
+            Recalculates the BlockRenderers of a ChunkRenderer.
+            The block geometry is calculated from a ChunkSnapshot, on one of
+            MCRenderer's mesh worker threads unless meshWorkers is 0
+
 BlockRender documentation
 
   Each Block renderer renders a particular block types or entities.
@@ -67,6 +72,8 @@ BlockRender documentation
 
   The makeVertices function is called on the block renderer to gat a
   list of vertexArrays that will draw the blocks for a 16x16x16 chunk.
+  It may be called on a mesh worker thread, so it must only use its
+  parameters and must not use the level or OpenGL.
 
    parameters:
 
@@ -195,7 +202,7 @@ BlockRender documentation
 
     renderer's for entities are similar to blocks but:
       - they extend EntityRendererGeneric class
-      - they are added to the list in calcFacesForChunkRenderer method
+      - they are added to the list in ChunkMeshJob.prepare
       - makeChunkVertices(chunk) where chunk is a chunk object
         is called rather than makeVertices
 
@@ -215,17 +222,29 @@ BlockRender documentation
 """
 
 from collections import defaultdict, deque
+import ctypes
 from datetime import datetime, timedelta
 from depths import DepthOffset
-from glutils import gl, Texture
-from albow.resource import _2478aq_heot
 import logging
+from multiprocessing.pool import ThreadPool
 import numpy
-from OpenGL import GL
 import pymclevel
 import sys
 from config import config
-# import time
+from timeit import default_timer
+
+try:
+    from OpenGL import GL
+    from glutils import gl, Texture, DisplayList, BufferPool
+except ImportError:
+    # Without OpenGL, only the CPU side of the renderer works: ChunkCalculator, the block renderers' vertex arrays
+    # and ChunkMesher. meshbench.py uses them this way.
+    GL = gl = Texture = DisplayList = BufferPool = None
+try:
+    from albow.resource import _2478aq_heot
+except ImportError:
+    # without pygame, the block renderers can still draw into a GL context made elsewhere, like in the tests
+    _2478aq_heot = None
 
 def chunkMarkers(chunkSet):
     """ Returns a mapping { size: [position, ...] } for different powers of 2
@@ -277,6 +296,7 @@ class ChunkRenderer(object):
         self.blockRenderers = []
         self.detailLevel = 0
         self.invalidLayers = set(Layer.AllLayers)
+        self.invalidSections = None  # the y of the sections whose blocks changed, or None for all of them
 
         self.chunkPosition = chunkPosition
         self.bufferSize = 0
@@ -294,7 +314,10 @@ class ChunkRenderer(object):
                 a = self.renderstateLists.get(k, [])
                 # print a
                 for i in a:
-                    gl.glDeleteLists(i, 1)
+                    if isinstance(i, VertexBufferDraw):
+                        i.free()
+                    else:
+                        gl.glDeleteLists(i, 1)
 
             if states:
                 del self.renderstateLists[states]
@@ -318,6 +341,7 @@ class ChunkRenderer(object):
         lists = defaultdict(list)
 
         showRedraw = self.renderer.showRedraw
+        pool = self.renderer.vertexBufferPool
 
         if not (showRedraw and self.needsBlockRedraw):
             GL.glEnableClientState(GL.GL_COLOR_ARRAY)
@@ -330,7 +354,10 @@ class ChunkRenderer(object):
             if blockRenderer.layer not in self.visibleLayers:
                 continue
 
-            l = blockRenderer.makeArrayList(self.chunkPosition, self.needsBlockRedraw and showRedraw)
+            if pool is not None:
+                l = blockRenderer.makeVertexBufferDraw(self.chunkPosition, pool, self.needsBlockRedraw and showRedraw)
+            else:
+                l = blockRenderer.makeArrayList(self.chunkPosition, self.needsBlockRedraw and showRedraw)
             lists[blockRenderer.renderstate].append(l)
 
         if not (showRedraw and self.needsBlockRedraw):
@@ -343,12 +370,22 @@ class ChunkRenderer(object):
     def needsBlockRedraw(self):
         return Layer.Blocks in self.invalidLayers
 
-    def invalidate(self, layers=None):
+    def invalidate(self, layers=None, sections=None):
+        """ Marks layers for calculating again. sections is the y of the 16 block high sections whose blocks changed,
+        or None if any may have; the blocks of the other sections keep their geometry. """
         if layers is None:
             layers = Layer.AllLayers
 
         if layers:
             layers = set(layers)
+            if Layer.Blocks in layers:
+                if sections is None:
+                    self.invalidSections = None
+                elif Layer.Blocks not in self.invalidLayers:
+                    self.invalidSections = set(sections)
+                elif self.invalidSections is not None:
+                    self.invalidSections.update(sections)
+
             self.invalidLayers.update(layers)
             blockRenderers = [br for br in self.blockRenderers
                               if br.layer is Layer.Blocks
@@ -361,6 +398,19 @@ class ChunkRenderer(object):
                 self.needsRedisplay = True
 
     def calcFaces(self):
+        job = self.meshJob()
+        if job is None:
+            raise StopIteration
+
+        for _ in job.prepare():
+            yield
+        for _ in job.calculate():
+            yield
+        job.finish()
+
+    def meshJob(self):
+        """ Updates the detail level of this chunk and returns a ChunkMeshJob to recalculate its geometry, or None if
+        the renderer has no chunk calculator. """
         minlod = self.renderer.detailLevelForChunk(self.chunkPosition)
 
         minlod = min(minlod, self.maxlod)
@@ -368,6 +418,7 @@ class ChunkRenderer(object):
             self.forgetDisplayLists()
             self.detailLevel = minlod
             self.invalidLayers.add(Layer.Blocks)
+            self.invalidSections = None
 
             # discard the standard detail renderers
             if minlod > 0:
@@ -380,11 +431,8 @@ class ChunkRenderer(object):
                 self.blockRenderers = blockRenderers
 
         if self.renderer.chunkCalculator:
-            for _ in self.renderer.chunkCalculator.calcFacesForChunkRenderer(self):
-                yield
-
-        else:
-            raise StopIteration
+            return ChunkMeshJob(self.renderer.chunkCalculator, self)
+        return None
 
     def vertexArraysDone(self):
         bufferSize = 0
@@ -394,6 +442,7 @@ class ChunkRenderer(object):
                 br.setAlpha(self.renderer.alpha)
         self.bufferSize = bufferSize
         self.invalidLayers = set()
+        self.invalidSections = None
         self.needsRedisplay = True
         self.renderer.invalidateMasterList()
 
@@ -589,6 +638,91 @@ def makeVertexTemplates(xmin=0, ymin=0, zmin=0, xmax=1, ymax=1, zmax=1):
 
 elementByteLength = 24
 
+# Vertex buffers hold vertices packed into shorts when that is exact: positions in 1/64ths of a block and whole texel
+# texture coordinates, with the color after them, take 16 bytes instead of 24. Vertices without texture coordinates
+# take 12 bytes instead of 16.
+packedVertexScale = 64
+packedVertexDtype = numpy.dtype([("xyz", "i2", 3), ("unused", "i2"), ("st", "i2", 2), ("rgba", "u1", 4)])
+packedFlatVertexDtype = numpy.dtype([("xyz", "i2", 3), ("unused", "i2"), ("rgba", "u1", 4)])
+
+
+def packVertices(vertexArrays):
+    """ Returns the vertex arrays of a block renderer in the packed vertex formats, or None if any of them can't be
+    packed exactly """
+    packed = []
+    for buf in vertexArrays:
+        if buf.dtype != numpy.float32 or buf.shape[-1] not in (4, 6):
+            return None
+        floats = numpy.ascontiguousarray(buf).reshape(-1, buf.shape[-1])
+        textured = floats.shape[1] == 6
+        xyz = floats[:, :3] * packedVertexScale
+        if (numpy.round(xyz) != xyz).any() or numpy.abs(xyz).max() > 32767:
+            return None
+        vertices = numpy.zeros(len(floats), packedVertexDtype if textured else packedFlatVertexDtype)
+        vertices["xyz"] = xyz
+        if textured:
+            st = floats[:, 3:5]
+            if (numpy.round(st) != st).any() or numpy.abs(st).max() > 32767:
+                return None
+            vertices["st"] = st
+        vertices["rgba"] = floats.view("uint8")[:, -4:]
+        packed.append(vertices)
+    return packed
+
+
+class VertexRange(object):
+    """ The quads of a vertex array copied to a range of a BufferPool's buffers. Block renderers draw it like the
+    array. """
+
+    def __init__(self, bufferRange, quads, textured, packed):
+        self.bufferRange = bufferRange
+        self.quads = quads
+        self.textured = textured
+        self.packed = packed
+
+    def __len__(self):
+        return self.quads
+
+    def pointers(self):
+        if self.packed:
+            positionType, textureOffset = GL.GL_SHORT, 8
+            stride = packedVertexDtype.itemsize if self.textured else packedFlatVertexDtype.itemsize
+        else:
+            positionType, textureOffset = GL.GL_FLOAT, 12
+            stride = elementByteLength if self.textured else 16
+
+        offset = self.bufferRange.offset
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.bufferRange.buffer)
+        GL.glVertexPointer(3, positionType, stride, ctypes.c_void_p(offset))
+        if self.textured:
+            GL.glTexCoordPointer(2, positionType, stride, ctypes.c_void_p(offset + textureOffset))
+        # the color is the last four bytes of each vertex in every format
+        GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, stride, ctypes.c_void_p(offset + stride - 4))
+
+
+class VertexBufferDraw(object):
+    """ Draws the vertex ranges of a block renderer. Takes the place of its display list when the chunks are drawn
+    from vertex buffers. """
+
+    def __init__(self, blockRenderer, chunkPosition, ranges, scale, showRedraw):
+        self.blockRenderer = blockRenderer
+        self.chunkPosition = chunkPosition
+        self.ranges = ranges
+        self.scale = scale
+        self.showRedraw = showRedraw
+
+    def draw(self):
+        if self.showRedraw:
+            GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+        self.blockRenderer.drawArrays(self.chunkPosition, self.showRedraw, self.ranges, self.scale)
+        if self.showRedraw:
+            GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+
+    def free(self):
+        for vertexRange in self.ranges:
+            vertexRange.bufferRange.free()
+        self.ranges = []
+
 
 def createPrecomputedVertices():
     height = 16
@@ -639,6 +773,7 @@ class ChunkCalculator(object):
                                         dtype=self.precomputedVertices[0].dtype)
         config.settings.fastLeaves.addObserver(self)
         config.settings.roughGraphics.addObserver(self)
+        config.settings.greedyMeshing.addObserver(self)
 
     class renderstatePlain(object):
         @classmethod
@@ -728,6 +863,7 @@ class ChunkCalculator(object):
             TorchBlockRenderer,
             WaterBlockRenderer,
             SlabBlockRenderer,
+            GreedyBlockRenderer,
         ]
         if materials.name in ("Alpha", "Pocket"):
             self.blockRendererClasses += [
@@ -776,6 +912,11 @@ class ChunkCalculator(object):
         self.exposedMaterialMap = numpy.array(materialMap)
         self.addTransparentMaterials(self.exposedMaterialMap, materialCount)
 
+        # With greedy meshing, the opaque blocks drawn as full cubes go to GreedyBlockRenderer instead
+        opaqueCubes = (materialMap == GenericBlockRenderer.materialIndex) & (self.exposedMaterialMap == materialMap)
+        self.greedyMaterialMap = numpy.array(materialMap)
+        self.greedyMaterialMap[opaqueCubes] = GreedyBlockRenderer.materialIndex
+
     def addTransparentMaterials(self, mats, materialCount):
         logging.debug("renderer::ChunkCalculator: Dynamically adding transparent materials.")
         for b in self.level.materials:
@@ -794,72 +935,44 @@ class ChunkCalculator(object):
     roughMaterials = numpy.ones((pymclevel.materials.id_limit,), dtype='uint8')
     roughMaterials[0] = 0
 
-    def calcFacesForChunkRenderer(self, cr):
-        if not cr.invalidLayers:
-            return
+    # When set to a defaultdict(float), the seconds spent making the vertex arrays of each block renderer class are
+    # added to it. Used by meshbench.py with a single thread.
+    timings = None
 
-        lod = cr.detailLevel
-        cx, cz = cr.chunkPosition
-        level = cr.renderer.level
-        try:
-            chunk = level.getChunk(cx, cz)
-        except Exception as e:
-            if "Session lock lost" in e.message:
-                yield
+    def timedWork(self, work, blockRendererClass):
+        """ Returns work, or an iterator over its work units that adds the time spent in them to timings """
+        if self.timings is None:
+            return work
+        return self._timedWork(iter(work), blockRendererClass)
+
+    def _timedWork(self, work, blockRendererClass):
+        timings = self.timings
+        while True:
+            start = default_timer()
+            try:
+                work.next()
+            except StopIteration:
+                timings[blockRendererClass] += default_timer() - start
                 return
-            logging.warn(u"Error reading chunk: %s", e)
-            traceback.print_exc()
+            timings[blockRendererClass] += default_timer() - start
             yield
-            return
-
-        yield
-        brs = []
-        append = brs.append
-        classes = (
-            TileEntityRenderer,
-            MonsterRenderer,
-            ItemRenderer,
-            TileTicksRenderer,
-            TerrainPopulatedRenderer,
-            ChunkBorderRenderer,
-            LowDetailBlockRenderer,
-            OverheadBlockRenderer,
-        )
-        existingBlockRenderers = dict(((type(b), b) for b in cr.blockRenderers))
-
-        for blockRendererClass in classes:
-            if cr.detailLevel not in blockRendererClass.detailLevels:
-                continue
-            if blockRendererClass.layer not in cr.visibleLayers:
-                continue
-            if blockRendererClass.layer not in cr.invalidLayers:
-                if blockRendererClass in existingBlockRenderers:
-                    append(existingBlockRenderers[blockRendererClass])
-
-                continue
-
-            br = blockRendererClass(self)
-            br.detailLevel = cr.detailLevel
-
-            for _ in br.makeChunkVertices(chunk):
-                yield
-            append(br)
 
-        blockRenderers = []
+    # Layers of blocks read above and below the sections being calculated: the blocks next to them, and the ones
+    # above those for the light of slabs and the other half of doors
+    sectionMargin = 2
 
-        # Recalculate high detail blocks if needed, otherwise retain the high detail renderers
-        if lod == 0 and Layer.Blocks in cr.invalidLayers:
-            for _ in self.calcHighDetailFaces(cr, blockRenderers):
-                yield
-        else:
-            blockRenderers.extend(br for br in cr.blockRenderers if not isinstance(br, classes))
+    def sectionBounds(self, sections, height):
+        """ Returns the lowest y and the highest y (exclusive) of the blocks read to calculate the sections """
+        return (max(min(sections) - self.sectionMargin, 0),
+                min(max(sections) + 16 + self.sectionMargin, height))
 
-        # Add the layer renderers
-        blockRenderers.extend(brs)
-        cr.blockRenderers = blockRenderers
-
-        cr.vertexArraysDone()
-        raise StopIteration
+    def calcFacesForChunkRenderer(self, cr):
+        job = ChunkMeshJob(self, cr)
+        for _ in job.prepare():
+            yield
+        for _ in job.calculate():
+            yield
+        job.finish()
 
     @staticmethod
     def getNeighboringChunks(chunk):
@@ -1025,19 +1138,16 @@ class ChunkCalculator(object):
 
         return areaBlockLights
 
-    def calcHighDetailFaces(self, cr, blockRenderers):
+    def calcHighDetailFaces(self, cr, blockRenderers, chunk, neighboringChunks, showHiddenOres, sections=None):
         """ calculate the geometry for a chunk renderer from its blockMats, data,
-        and lighting array. fills in the cr's blockRenderers with verts
-        for each block facing and material"""
+        and lighting array. fills in blockRenderers with verts
+        for each block facing and material. chunk is usually a ChunkSnapshot,
+        and neighboringChunks its neighbors' edges, so this may run on a mesh worker.
+        sections is the y of the sections to calculate, or None for all of them;
+        a snapshot must then hold at least the blocks of sectionBounds"""
 
         # chunkBlocks and chunkLights shall be indexed [x,z,y] to follow infdev's convention
-        cx, cz = cr.chunkPosition
-        level = cr.renderer.level
-
-        chunk = level.getChunk(cx, cz)
-#         if isinstance(chunk, pymclevel.level.FakeChunk):
-#             return
-        neighboringChunks = self.getNeighboringChunks(chunk)
+        level = chunk.world
 
         areaBlocks = self.getAreaBlocks(chunk, neighboringChunks)
         yield
@@ -1052,7 +1162,6 @@ class ChunkCalculator(object):
                 areaBlockLights[slabs] = areaBlockLights[:, :, 1:][slabs[:, :, :-1]]
             yield
 
-        showHiddenOres = cr.renderer.showHiddenOres
         if showHiddenOres:
             facingMats = self.hiddenOreMaterials[areaBlocks]
         else:
@@ -1062,16 +1171,20 @@ class ChunkCalculator(object):
 
         if self.roughGraphics:
             areaBlockMats = self.roughMaterials[areaBlocks]
+        elif self.greedyMeshing:
+            areaBlockMats = self.greedyMaterialMap[areaBlocks]
         else:
             areaBlockMats = self.materialMap[areaBlocks]
 
         facingBlockIndices = self.getFacingBlockIndices(areaBlocks, facingMats)
         yield
 
-        for _ in self.computeGeometry(chunk, areaBlockMats, facingBlockIndices, areaBlockLights, cr, blockRenderers):
+        for _ in self.computeGeometry(chunk, areaBlockMats, facingBlockIndices, areaBlockLights, cr, blockRenderers,
+                                      sections):
             yield
 
-    def computeGeometry(self, chunk, areaBlockMats, facingBlockIndices, areaBlockLights, chunkRenderer, blockRenderers):
+    def computeGeometry(self, chunk, areaBlockMats, facingBlockIndices, areaBlockLights, chunkRenderer, blockRenderers,
+                        sections=None):
         blocks, blockData = chunk.Blocks, chunk.Data
         # pcm1k - data limit
         blockData &= 0xf
@@ -1104,9 +1217,14 @@ class ChunkCalculator(object):
         sx = sz = slice(0, 16)
         asx = asz = slice(0, 18)
 
-        for y in xrange(0, chunk.world.Height, 16):
-            sy = slice(y, y + 16)
-            asy = slice(y, y + 18)
+        # the arrays of a snapshot of some sections start at its bottom
+        bottom = getattr(chunk, "bottom", 0)
+        if sections is None:
+            sections = xrange(0, chunk.world.Height, 16)
+
+        for y in sections:
+            sy = slice(y - bottom, y - bottom + 16)
+            asy = slice(y - bottom, y - bottom + 18)
 
             for _ in self.computeCubeGeometry(
                     y,
@@ -1137,8 +1255,8 @@ class ChunkCalculator(object):
             blockRenderer = blockRendererClass(self)
             blockRenderer.y = y
             blockRenderer.materials = materials
-            for _ in blockRenderer.makeVertices(facingBlockIndices, blocks, blockMaterials, blockData, areaBlockLights,
-                                                texMap):
+            for _ in self.timedWork(blockRenderer.makeVertices(facingBlockIndices, blocks, blockMaterials, blockData,
+                                                               areaBlockLights, texMap), blockRendererClass):
                 yield
             append(blockRenderer)
 
@@ -1148,6 +1266,233 @@ class ChunkCalculator(object):
         return self.precomputedVertices[direction][numpy.where(blockIndices)]
 
 
+def _copyArray(array, bounds=None):
+    """ Returns a copy of array, or of its layers of blocks from bounds[0] up to bounds[1] """
+    if array is None:
+        return None
+    if bounds is None:
+        return numpy.array(array)
+
+    bottom, top = bounds
+    layers = array[..., bottom:top]
+    if layers.shape[-1] < top - bottom:
+        # a chunk lower than the level, like a 128 block high chunk next to a 256 block high one
+        padding = numpy.zeros(layers.shape[:-1] + (top - bottom - layers.shape[-1],), layers.dtype)
+        return numpy.concatenate((layers, padding), axis=-1)
+    return numpy.array(layers)
+
+
+class ChunkEdge(object):
+    """ A copy of the blocks and lights of the edge of a chunk that faces one of its neighbors, from bounds[0] up to
+    bounds[1]. A chunk lower than that, like a 128 block high chunk in a 256 block high level, is padded with air. """
+
+    # the part of a chunk's arrays next to the neighbor in each direction
+    edgeSlices = {
+        pymclevel.faces.FaceXDecreasing: numpy.s_[-1:],
+        pymclevel.faces.FaceXIncreasing: numpy.s_[:1],
+        pymclevel.faces.FaceZDecreasing: numpy.s_[:, -1:],
+        pymclevel.faces.FaceZIncreasing: numpy.s_[:, :1],
+    }
+
+    def __init__(self, chunk, direction, bounds):
+        edge = self.edgeSlices[direction]
+        self.Blocks = _copyArray(chunk.Blocks[edge], bounds)
+        self.SkyLight = _copyArray(chunk.SkyLight[edge], bounds)
+        self.BlockLight = _copyArray(chunk.BlockLight[edge], bounds)
+
+
+class ChunkSnapshot(object):
+    """ A copy of the arrays of a chunk that the block renderers read. The geometry of a snapshot can be calculated
+    on a mesh worker while the chunk itself is edited, saved or unloaded by the main thread. With bounds, only the
+    blocks from bounds[0] up to bounds[1] are copied, and bottom is the y of the first layer of the arrays. """
+
+    def __init__(self, chunk, lights=False, heightMap=False, bounds=None):
+        self.chunkPosition = chunk.chunkPosition
+        self.world = chunk.world
+        self.materials = chunk.materials
+        self.bottom = bounds[0] if bounds is not None else 0
+        self.Blocks = _copyArray(chunk.Blocks, bounds)
+        self.Data = _copyArray(chunk.Data, bounds)
+        if lights:
+            self.BlockLight = _copyArray(chunk.BlockLight, bounds)
+            self.SkyLight = _copyArray(chunk.SkyLight, bounds)
+        if heightMap:
+            self.HeightMap = numpy.array(chunk.HeightMap)
+
+
+class ChunkMeshJob(object):
+    """ Recalculates the geometry of a chunk renderer in three steps.
+
+    prepare reads the chunk from the level, builds the entity and marker layers, and copies the arrays needed for
+    the block layers into a ChunkSnapshot. calculate builds the block layers from the snapshot. finish gives the new
+    block renderers to the chunk renderer. Only calculate may run on a mesh worker; the other steps use the level and
+    the chunk renderer and must run on the main thread. Display lists are made later, when the chunk is drawn.
+
+    If only some sections of a high detail chunk were invalidated, only those are calculated again, from a snapshot
+    of the blocks around them, and the other sections keep their block renderers. """
+
+    def __init__(self, calculator, cr):
+        self.calculator = calculator
+        self.chunkRenderer = cr
+        self.snapshot = None
+        self.neighboringChunks = None
+        self.showHiddenOres = cr.renderer.showHiddenOres
+        self.layerRenderers = []  # block renderers, or classes of the ones to be made from the snapshot
+        self.sections = None  # the y of the high detail sections to calculate, or None for all of them
+        self.keptRenderers = []  # the block renderers of the high detail sections that are not calculated again
+        self.blockRenderers = None  # None if the job has nothing to do
+        self.stale = False  # the chunk was invalidated again before the job was finished
+
+    def prepare(self):
+        cr = self.chunkRenderer
+        if not cr.invalidLayers:
+            return
+
+        cx, cz = cr.chunkPosition
+        level = cr.renderer.level
+        try:
+            chunk = level.getChunk(cx, cz)
+        except Exception as e:
+            if "Session lock lost" in e.message:
+                yield
+                return
+            logging.warn(u"Error reading chunk: %s", e)
+            traceback.print_exc()
+            yield
+            return
+
+        yield
+        append = self.layerRenderers.append
+        classes = (
+            TileEntityRenderer,
+            MonsterRenderer,
+            ItemRenderer,
+            TileTicksRenderer,
+            TerrainPopulatedRenderer,
+            ChunkBorderRenderer,
+            LowDetailBlockRenderer,
+            OverheadBlockRenderer,
+        )
+        existingBlockRenderers = dict(((type(b), b) for b in cr.blockRenderers))
+        lowDetail = False
+
+        for blockRendererClass in classes:
+            if cr.detailLevel not in blockRendererClass.detailLevels:
+                continue
+            if blockRendererClass.layer not in cr.visibleLayers:
+                continue
+            if blockRendererClass.layer not in cr.invalidLayers:
+                if blockRendererClass in existingBlockRenderers:
+                    append(existingBlockRenderers[blockRendererClass])
+
+                continue
+
+            if issubclass(blockRendererClass, LowDetailBlockRenderer):
+                # made from the snapshot by calculate
+                lowDetail = True
+                append(blockRendererClass)
+                continue
+
+            br = blockRendererClass(self.calculator)
+            br.detailLevel = cr.detailLevel
+
+            for _ in self.calculator.timedWork(br.makeChunkVertices(chunk), blockRendererClass):
+                yield
+            append(br)
+
+        # Recalculate high detail blocks if needed, otherwise retain the high detail renderers
+        highDetail = cr.detailLevel == 0 and Layer.Blocks in cr.invalidLayers
+        bounds = None
+        if highDetail and cr.invalidSections is not None:
+            self.sections = sorted(cr.invalidSections)
+            self.keptRenderers = [br for br in cr.blockRenderers
+                                  if not isinstance(br, classes) and br.y not in cr.invalidSections]
+            highDetail = bool(self.sections)
+            if highDetail:
+                bounds = self.calculator.sectionBounds(self.sections, chunk.world.Height)
+
+        if highDetail:
+            edgeBounds = bounds if bounds is not None else (0, chunk.world.Height)
+            self.neighboringChunks = dict((direction, ChunkEdge(neighbor, direction, edgeBounds))
+                                          for direction, neighbor in
+                                          self.calculator.getNeighboringChunks(chunk).iteritems())
+        else:
+            self.blockRenderers = [br for br in cr.blockRenderers if not isinstance(br, classes)]
+
+        if highDetail or lowDetail:
+            self.snapshot = ChunkSnapshot(chunk, lights=highDetail, heightMap=lowDetail, bounds=bounds)
+
+    def calculate(self):
+        if self.snapshot is None:
+            return
+
+        detailLevel = self.chunkRenderer.detailLevel
+        for i, br in enumerate(self.layerRenderers):
+            if isinstance(br, type):
+                blockRendererClass = br
+                br = blockRendererClass(self.calculator)
+                br.detailLevel = detailLevel
+                for _ in self.calculator.timedWork(br.makeChunkVertices(self.snapshot), blockRendererClass):
+                    yield
+                self.layerRenderers[i] = br
+
+        if self.neighboringChunks is not None:
+            blockRenderers = list(self.keptRenderers)
+            for _ in self.calculator.calcHighDetailFaces(self.chunkRenderer, blockRenderers, self.snapshot,
+                                                         self.neighboringChunks, self.showHiddenOres, self.sections):
+                yield
+            if self.keptRenderers:
+                # draw the sections in the same order as when the whole chunk is calculated
+                blockRenderers.sort(key=lambda br: br.y)
+            self.blockRenderers = blockRenderers
+
+        self.snapshot = self.neighboringChunks = None
+
+    def run(self):
+        for _ in self.calculate():
+            pass
+
+    def finish(self):
+        if self.blockRenderers is None:
+            return
+
+        # Add the layer renderers
+        cr = self.chunkRenderer
+        cr.blockRenderers = self.blockRenderers + self.layerRenderers
+        cr.vertexArraysDone()
+
+
+class ChunkMesher(object):
+    """ Calculates the geometry of chunks on the calling thread, without OpenGL or a display. Takes the place of
+    MCRenderer for the ChunkRenderers it makes, which never make display lists. """
+
+    alpha = 0xff
+    showRedraw = False
+    showHiddenOres = False
+
+    def __init__(self, level, detailLevel=0, layers=None):
+        self.level = level
+        self.detailLevel = detailLevel
+        self.visibleLayers = set(layers if layers is not None else Layer.AllLayers)
+        self.chunkCalculator = ChunkCalculator(level)
+
+    def detailLevelForChunk(self, cpos):
+        return self.detailLevel
+
+    def invalidateMasterList(self):
+        pass
+
+    def discardMasterList(self):
+        pass
+
+    def meshChunk(self, cx, cz):
+        """ Returns a ChunkRenderer holding the block renderers and vertex arrays for the chunk """
+        cr = ChunkRenderer(self, (cx, cz))
+        for _ in cr.calcFaces():
+            pass
+        return cr
+
+
 class Layer:
     Blocks = "Blocks"
     Entities = "Entities"
@@ -1219,24 +1564,41 @@ class BlockRenderer(object):
         GL.glEndList()
         return l
 
-    def drawArrays(self, chunkPosition, showRedraw):
+    def makeVertexBufferDraw(self, chunkPosition, pool, showRedraw):
+        """ Copies the vertex arrays to pool, packed if they can be, and returns a VertexBufferDraw for them """
+        arrays = [buf for buf in self.vertexArrays if buf.size]
+        packed = packVertices(arrays)
+        ranges = []
+        for buf, data in zip(arrays, packed or arrays):
+            bufferRange = pool.upload(numpy.ascontiguousarray(data))
+            ranges.append(VertexRange(bufferRange, len(buf), buf.shape[-1] == 6, packed is not None))
+
+        scale = 1. / packedVertexScale if packed is not None else 1
+        return VertexBufferDraw(self, chunkPosition, ranges, scale, showRedraw)
+
+    def drawArrays(self, chunkPosition, showRedraw, buffers=None, scale=1):
+        """ Draws the vertex arrays, or buffers, VertexRanges whose positions are multiplied by scale """
         cx, cz = chunkPosition
         y = getattr(self, "y", 0)
         with gl.glPushMatrix(GL.GL_MODELVIEW):
             GL.glTranslate(cx << 4, y, cz << 4)
+            if scale != 1:
+                GL.glScale(scale, scale, scale)
 
             if showRedraw:
                 GL.glColor(1.0, 0.25, 0.25, 1.0)
 
-            self.drawVertices()
+            self.drawVertices(self.vertexArrays if buffers is None else buffers)
 
-    def drawVertices(self):
-        if self.vertexArrays:
-            for buf in self.vertexArrays:
+    def drawVertices(self, buffers):
+        if buffers:
+            for buf in buffers:
                 self.drawFaceVertices(buf)
 
-    def drawFaceVertices(self, buf):
-        if not len(buf):
+    def vertexPointers(self, buf):
+        """ Points GL at the positions, texture coordinates and colors of buf, a vertex array or a VertexRange """
+        if isinstance(buf, VertexRange):
+            buf.pointers()
             return
         stride = elementByteLength
 
@@ -1244,6 +1606,11 @@ class BlockRenderer(object):
         GL.glTexCoordPointer(2, GL.GL_FLOAT, stride, (buf.ravel()[3:]))
         GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, stride, (buf.view(dtype=numpy.uint8).ravel()[20:]))
 
+    def drawFaceVertices(self, buf):
+        if not len(buf):
+            return
+        self.vertexPointers(buf)
+
         GL.glDrawArrays(GL.GL_QUADS, 0, len(buf) * 4)
 
 
@@ -1254,11 +1621,7 @@ class EntityRendererGeneric(BlockRenderer):
     def drawFaceVertices(self, buf):
         if not len(buf):
             return
-        stride = elementByteLength
-
-        GL.glVertexPointer(3, GL.GL_FLOAT, stride, (buf.ravel()))
-        GL.glTexCoordPointer(2, GL.GL_FLOAT, stride, (buf.ravel()[3:]))
-        GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, stride, (buf.view(dtype=numpy.uint8).ravel()[20:]))
+        self.vertexPointers(buf)
 
         GL.glDepthMask(False)
 
@@ -1401,11 +1764,7 @@ class TerrainPopulatedRenderer(EntityRendererGeneric):
     def drawFaceVertices(self, buf):
         if not len(buf):
             return
-        stride = elementByteLength
-
-        GL.glVertexPointer(3, GL.GL_FLOAT, stride, (buf.ravel()))
-        GL.glTexCoordPointer(2, GL.GL_FLOAT, stride, (buf.ravel()[3:]))
-        GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, stride, (buf.view(dtype=numpy.uint8).ravel()[20:]))
+        self.vertexPointers(buf)
 
         GL.glDepthMask(False)
 
@@ -1481,11 +1840,7 @@ class ChunkBorderRenderer(EntityRendererGeneric):
     def drawFaceVertices(self, buf):
         if not len(buf):
             return
-        stride = elementByteLength
-
-        GL.glVertexPointer(3, GL.GL_FLOAT, stride, (buf.ravel()))
-        GL.glTexCoordPointer(2, GL.GL_FLOAT, stride, (buf.ravel()[3:]))
-        GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, stride, (buf.view(dtype=numpy.uint8).ravel()[20:]))
+        self.vertexPointers(buf)
 
         GL.glPolygonMode(GL.GL_FRONT_AND_BACK, GL.GL_LINE)
 
@@ -1504,14 +1859,20 @@ class LowDetailBlockRenderer(BlockRenderer):
     renderstate = ChunkCalculator.renderstateLowDetail
     detailLevels = (1,)
 
-    def drawFaceVertices(self, buf):
-        if not len(buf):
+    def vertexPointers(self, buf):
+        if isinstance(buf, VertexRange):
+            buf.pointers()
             return
         stride = 16
 
         GL.glVertexPointer(3, GL.GL_FLOAT, stride, numpy.ravel(buf.ravel()))
         GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, stride, (buf.view(dtype='uint8').ravel()[12:]))
 
+    def drawFaceVertices(self, buf):
+        if not len(buf):
+            return
+        self.vertexPointers(buf)
+
         GL.glDisableClientState(GL.GL_TEXTURE_COORD_ARRAY)
         GL.glDrawArrays(GL.GL_QUADS, 0, len(buf) * 4)
         GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
@@ -1661,6 +2022,150 @@ class GenericBlockRenderer(BlockRenderer):
     makeVertices = makeGenericVertices
 
 
+def mergeFaces(keys):
+    """ Covers the faces of a (normal, v, u) array of keys with rectangles. Faces are merged when they have the same
+    key, first into runs along u, then runs of the same length and key next to each other along v into rectangles.
+    keys is -1 where there is no face. Returns the normal, v and u of the first face of each rectangle, and its
+    length along v and along u. """
+    faces = keys >= 0
+    changed = numpy.ones(keys.shape, bool)
+    changed[..., 1:] = keys[..., 1:] != keys[..., :-1]
+    runStarts = faces & changed
+    runEnds = numpy.array(faces)
+    runEnds[..., :-1] &= changed[..., 1:]
+
+    n, v, u = runStarts.nonzero()
+    runLengths = numpy.zeros(keys.shape, 'int32')
+    runLengths[n, v, u] = runEnds.nonzero()[2] - u + 1
+
+    runs = runLengths > 0
+    continued = numpy.zeros(keys.shape, bool)
+    continued[:, 1:] = runs[:, 1:] & (runLengths[:, 1:] == runLengths[:, :-1]) & (keys[:, 1:] == keys[:, :-1])
+    rectStarts = runs & ~continued
+    rectEnds = numpy.array(runs)
+    rectEnds[:, :-1] &= ~continued[:, 1:]
+
+    # order the rectangles by normal and u, so each start is followed by its end along v
+    n, u, v = rectStarts.transpose(0, 2, 1).nonzero()
+    lengthV = rectEnds.transpose(0, 2, 1).nonzero()[2] - v + 1
+    return n, v, u, lengthV, runLengths[n, v, u]
+
+
+class GreedyBlockRenderer(BlockRenderer):
+    """ Draws the opaque full cubes when greedy meshing is on. Faces of the same block and light that point the same
+    way and touch are merged into larger quads, which need far less vertex memory. The terrain texture can't repeat
+    across a merged quad, so the quads are grouped by the tile of the terrain they show, and each group is drawn with
+    a texture of only that tile, made by glutils.makeTileTextures when the terrain texture was loaded. Their texture
+    coordinates count tiles instead of pixels. """
+
+    # axes of the (x, z, y) block arrays for each face: (normal, v, u)
+    faceAxes = {
+        pymclevel.faces.FaceXIncreasing: (0, 2, 1),
+        pymclevel.faces.FaceXDecreasing: (0, 2, 1),
+        pymclevel.faces.FaceYIncreasing: (2, 0, 1),
+        pymclevel.faces.FaceYDecreasing: (2, 0, 1),
+        pymclevel.faces.FaceZIncreasing: (1, 2, 0),
+        pymclevel.faces.FaceZDecreasing: (1, 2, 0),
+    }
+    # axes of the block arrays that s and t follow in faceVertexTemplates
+    textureAxes = {
+        pymclevel.faces.FaceXIncreasing: (1, 2),
+        pymclevel.faces.FaceXDecreasing: (1, 2),
+        pymclevel.faces.FaceYIncreasing: (0, 1),
+        pymclevel.faces.FaceYDecreasing: (0, 1),
+        pymclevel.faces.FaceZIncreasing: (0, 2),
+        pymclevel.faces.FaceZDecreasing: (0, 2),
+    }
+
+    tiles = ()  # the s, t of the terrain tile of each vertex array
+
+    def getBlocktypes(self, mats):
+        # the blocks are chosen by ChunkCalculator.greedyMaterialMap
+        return []
+
+    def tileTextures(self):
+        """ Returns the tile texture for each vertex array. Without them, as with the flat texture used when the terrain
+        couldn't be loaded, the terrain texture is used. """
+        terrainTexture = self.materials.terrainTexture
+        tileTextures = getattr(terrainTexture, "tileTextures", {})
+        return [tileTextures.get(tile, terrainTexture) for tile in self.tiles]
+
+    def drawVertices(self, buffers):
+        textures = self.tileTextures()
+        with gl.glPushMatrix(GL.GL_TEXTURE):
+            GL.glLoadIdentity()
+            for buf, texture in zip(buffers, textures):
+                texture.bind()
+                self.drawFaceVertices(buf)
+        self.materials.terrainTexture.bind()
+
+    def makeGreedyVertices(self, facingBlockIndices, blocks, blockMaterials, blockData, areaBlockLights, texMap):
+        quads = []
+        quadTiles = []
+        materialIndices = self.getMaterialIndices(blockMaterials)
+        yield
+
+        for (direction, exposedFaceIndices) in enumerate(facingBlockIndices):
+            blockIndices = materialIndices & exposedFaceIndices
+            if not blockIndices.any():
+                continue
+
+            # faces can only be merged if they look the same
+            facingBlockLight = areaBlockLights[self.directionOffsets[direction]]
+            keys = (blocks.astype('int32') << 9) | ((blockData.astype('int32') & 0xf) << 5) | facingBlockLight
+            keys[~blockIndices] = -1
+
+            axes = self.faceAxes[direction]
+            n, v, u, lengthV, lengthU = mergeFaces(keys.transpose(axes))
+            origins = [None] * 3
+            sizes = [None] * 3
+            origins[axes[0]], origins[axes[1]], origins[axes[2]] = n, v, u
+            sizes[axes[0]], sizes[axes[1]], sizes[axes[2]] = numpy.ones_like(n), lengthV, lengthU
+
+            template = faceVertexTemplates[direction]
+            vertexArray = numpy.zeros((len(n), 4, 6), dtype='float32')
+            for i, axis in enumerate((0, 2, 1)):  # x, y and z of the vertices
+                vertexArray[..., i] = (origins[axis][:, numpy.newaxis] +
+                                       template[:, i] * sizes[axis][:, numpy.newaxis])
+            # the tile repeats once for each block
+            for i, axis in enumerate(self.textureAxes[direction]):
+                vertexArray[..., 3 + i] = template[:, 3 + i] / 16 * sizes[axis][:, numpy.newaxis]
+
+            # the same colors as GenericBlockRenderer
+            x, z, y = origins
+            theseBlocks = blocks[x, z, y]
+            colors = vertexArray.view('uint8')[_RGBA]
+            colors[..., :3] = template[0, 5]
+            colors[..., :3] *= facingBlockLight[x, z, y][:, numpy.newaxis, numpy.newaxis]
+            colors[..., 3] = 0xff
+            if self.materials.name in ("Alpha", "Pocket"):
+                if direction == pymclevel.faces.FaceYIncreasing:
+                    grass = theseBlocks == pymclevel.materials.alphaMaterials.Grass.ID
+                    colors[..., :3][grass] = colors[..., :3][grass].astype(float) * GenericBlockRenderer.grassColor
+            yield
+
+            quads.append(vertexArray)
+            quadTiles.append(texMap(theseBlocks, blockData[x, z, y], direction)[:, 0:2])
+
+        vertexArrays = []
+        tiles = []
+        if quads:
+            quads = numpy.concatenate(quads)
+            quadTiles = numpy.concatenate(quadTiles).astype('int32')
+            tileKeys = quadTiles[:, 0] << 16 | quadTiles[:, 1]
+            order = numpy.argsort(tileKeys, kind='mergesort')
+            tileKeys = tileKeys[order]
+            starts = numpy.flatnonzero(numpy.concatenate(([True], tileKeys[1:] != tileKeys[:-1])))
+            for start, end in zip(starts, list(starts[1:]) + [len(order)]):
+                vertexArrays.append(quads[order[start:end]])
+                tiles.append(tuple(int(c) for c in quadTiles[order[start]]))
+
+        self.vertexArrays = vertexArrays
+        self.tiles = tiles
+
+    makeVertices = makeGreedyVertices
+
+
 class LeafBlockRenderer(BlockRenderer):
 
     @classmethod
@@ -3172,7 +3677,17 @@ class IceBlockRenderer(BlockRenderer):
 
     makeFaceVertices = iceFaceVertices
 
-from glutils import DisplayList
+
+def changedSections(level, box):
+    """ Returns the y of the 16 block high sections whose geometry may have changed after the blocks in box were edited.
+    Editing blocks may also change the sky light below them right away, through the fast lighting of chunkChanged and
+    blocksChanged, which leaves their chunk needing lighting. So while any chunk in box needs lighting, the sections
+    below box are included too. """
+    miny = max(box.miny, 0)
+    needsLighting = getattr(level, "chunksNeedingLighting", None)
+    if needsLighting is None or not set(box.chunkPositions).isdisjoint(needsLighting):
+        miny = 0
+    return range(miny & ~0xf, min(box.maxy, level.Height), 16)
 
 
 class MCRenderer(object):
@@ -3187,6 +3702,7 @@ class MCRenderer(object):
 
         self.invalidChunkQueue = deque()
         self._chunkWorker = None
+        self._meshJobs = {}  # maps (cx, cz) to (ChunkMeshJob, AsyncResult) for chunks being meshed by the pool
         self.chunkRenderers = {}
         self.loadableChunkMarkers = DisplayList()
         self.visibleLayers = set(Layer.AllLayers)
@@ -3208,8 +3724,12 @@ class MCRenderer(object):
         config.settings.fastLeaves.addObserver(self)
 
         config.settings.roughGraphics.addObserver(self)
+        config.settings.greedyMeshing.addObserver(self)
         config.settings.showHiddenOres.addObserver(self)
         config.settings.vertexBufferLimit.addObserver(self)
+        config.settings.vertexBuffers.addObserver(self)
+        if not self.isPreviewer:
+            config.settings.meshWorkers.addObserver(self)
 
         config.settings.drawEntities.addObserver(self)
         config.settings.drawTileEntities.addObserver(self)
@@ -3340,6 +3860,43 @@ class MCRenderer(object):
     minWorkFactor = 1
     workFactor = 2
 
+    # --- Mesh workers ---
+
+    # Number of threads that calculate chunk geometry from snapshots of the chunks. numpy releases the GIL for most
+    # of the work, so meshing runs in parallel with drawing and input handling. 0 calculates everything on the main
+    # thread, a few work units at a time.
+    _meshWorkers = 0
+
+    _meshPool = None
+
+    @property
+    def meshWorkers(self):
+        return self._meshWorkers
+
+    @meshWorkers.setter
+    def meshWorkers(self, val):
+        val = max(0, int(val))
+        if val != self._meshWorkers:
+            self._meshWorkers = val
+            if self._meshPool is not None:
+                # jobs already given to the old pool still finish
+                self._meshPool.close()
+                self._meshPool = None
+
+    @property
+    def meshPool(self):
+        if self._meshWorkers <= 0:
+            return None
+        if self._meshPool is None:
+            self._meshPool = ThreadPool(self._meshWorkers)
+        return self._meshPool
+
+    @property
+    def meshJobLimit(self):
+        """ Maximum number of chunks given to the mesh workers at once. Kept small so the work queue follows the
+        camera. """
+        return self._meshWorkers * 4
+
     chunkCalculator = None
 
     _level = None
@@ -3422,6 +3979,7 @@ class MCRenderer(object):
 
     def discardAllChunks(self):
         self.bufferUsage = 0
+        self._meshJobs.clear()
         self.forgetAllDisplayLists()
         self.chunkRenderers = {}
         self.oldPosition = None  # xxx force reload
@@ -3464,6 +4022,7 @@ class MCRenderer(object):
 
     def discardChunk(self, cx, cz):
         " discards the chunk renderer for this chunk and compresses the chunk "
+        self._meshJobs.pop((cx, cz), None)
         if (cx, cz) in self.chunkRenderers:
             self.bufferUsage -= self.chunkRenderers[cx, cz].bufferSize
             self.chunkRenderers[cx, cz].forgetDisplayLists()
@@ -3495,6 +4054,38 @@ class MCRenderer(object):
 
         self._roughGraphics = bool(val)
 
+    _greedyMeshing = False
+
+    @property
+    def greedyMeshing(self):
+        return self._greedyMeshing
+
+    @greedyMeshing.setter
+    def greedyMeshing(self, val):
+        if self._greedyMeshing != bool(val):
+            self.discardAllChunks()
+
+        self._greedyMeshing = bool(val)
+
+    _vertexBuffers = False
+    vertexBufferPool = None
+
+    @property
+    def vertexBuffers(self):
+        return self._vertexBuffers
+
+    @vertexBuffers.setter
+    def vertexBuffers(self, val):
+        if self._vertexBuffers != bool(val):
+            # the chunks are uploaded again the next time they are drawn
+            self.forgetAllDisplayLists()
+            self.discardMasterList()
+            if self.vertexBufferPool is not None:
+                self.vertexBufferPool.delete()
+                self.vertexBufferPool = None
+
+        self._vertexBuffers = bool(val)
+
     _showHiddenOres = False
 
     @property
@@ -3513,11 +4104,14 @@ class MCRenderer(object):
         if self.showHiddenOres:
             self.discardAllChunks()
 
-    def invalidateChunk(self, cx, cz, layers=None):
+    def invalidateChunk(self, cx, cz, layers=None, sections=None):
         " marks the chunk for regenerating vertex data and display lists "
+        if (cx, cz) in self._meshJobs:
+            self._meshJobs[cx, cz][0].stale = True
+
         if (cx, cz) in self.chunkRenderers:
 
-            self.chunkRenderers[(cx, cz)].invalidate(layers)
+            self.chunkRenderers[(cx, cz)].invalidate(layers, sections)
 
             self.invalidChunkQueue.append((cx, cz))  # xxx encapsulate
 
@@ -3525,7 +4119,8 @@ class MCRenderer(object):
         # If the box is at the edge of any chunks, expanding by 1 makes sure the neighboring chunk gets redrawn.
         box = box.expand(1)
 
-        self.invalidateChunks(box.chunkPositions, layers)
+        # Only the sections changed by the edit have their blocks calculated again
+        self.invalidateChunks(box.chunkPositions, layers, changedSections(self.level, box))
 
     def invalidateEntitiesInBox(self, box):
         self.invalidateChunks(box.chunkPositions, [Layer.Entities])
@@ -3533,9 +4128,9 @@ class MCRenderer(object):
     def invalidateTileTicksInBox(self, box):
         self.invalidateChunks(box.chunkPositions, [Layer.TileTicks])
 
-    def invalidateChunks(self, chunks, layers=None):
+    def invalidateChunks(self, chunks, layers=None, sections=None):
         for (cx, cz) in chunks:
-            self.invalidateChunk(cx, cz, layers)
+            self.invalidateChunk(cx, cz, layers, sections)
 
         self.stopWork()
         self.discardMasterList()
@@ -3686,6 +4281,9 @@ class MCRenderer(object):
                 cr.debugDraw()
     else:
         def createMasterLists(self):
+            if self.vertexBuffers and self.vertexBufferPool is None and BufferPool.available():
+                self.vertexBufferPool = BufferPool()
+
             if self.shouldRecreateMasterList:
                 lists = {}
                 chunkLists = defaultdict(list)
@@ -3705,7 +4303,11 @@ class MCRenderer(object):
                             chunkLists[rs] += ch.renderstateLists[rs]
 
                 for rs in chunkLists:
-                    if len(chunkLists[rs]):
+                    if not len(chunkLists[rs]):
+                        continue
+                    if self.vertexBufferPool is not None:
+                        lists[rs] = chunkLists[rs]
+                    else:
                         lists[rs] = numpy.array(chunkLists[rs], dtype='uint32').ravel()
 
                 self.masterLists = lists
@@ -3721,7 +4323,14 @@ class MCRenderer(object):
                     GL.glEnable(GL.GL_BLEND)
                 renderstate.bind()
 
-                GL.glCallLists(self.masterLists[renderstate])
+                if self.vertexBufferPool is not None:
+                    GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+                    for vertexBufferDraw in self.masterLists[renderstate]:
+                        vertexBufferDraw.draw()
+                    GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+                    GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+                else:
+                    GL.glCallLists(self.masterLists[renderstate])
 
                 renderstate.release()
                 if self.alpha != 0xff and renderstate is not ChunkCalculator.renderstateLowDetail:
@@ -3786,8 +4395,12 @@ class MCRenderer(object):
         addDebugString("BU: {0} MB, ".format(
             self.bufferUsage / 1000000,
         ))
+        if self.vertexBufferPool is not None:
+            addDebugString("VBO: {0} MB, ".format(self.vertexBufferPool.usedBytes / 1000000))
 
         addDebugString("WQ: {0}, ".format(len(self.invalidChunkQueue)))
+        if self._meshJobs:
+            addDebugString("MJ: {0}, ".format(len(self._meshJobs)))
         if self.chunkIterator:
             addDebugString("[LR], ")
 
@@ -3805,6 +4418,13 @@ class MCRenderer(object):
                 if self.level is None:
                     raise StopIteration
 
+                if self._meshJobs:
+                    self.finishMeshJobs()
+                    if len(self._meshJobs) >= self.meshJobLimit:
+                        self.waitForMeshJob()
+                        yield
+                        continue
+
                 if len(self.invalidChunkQueue) > 1024:
                     self.invalidChunkQueue.clear()
 
@@ -3815,10 +4435,17 @@ class MCRenderer(object):
                     self.invalidChunkQueue.popleft()
 
                 elif self.chunkIterator is None:
-                    raise StopIteration
+                    if not self._meshJobs:
+                        raise StopIteration
+                    self.waitForMeshJob()
 
                 else:
-                    c = self.chunkIterator.next()
+                    try:
+                        c = self.chunkIterator.next()
+                    except StopIteration:
+                        # keep working until the mesh workers are done
+                        self.chunkIterator = None
+                        continue
                     if self.vertexBufferLimit:
                         while self.bufferUsage > (0.9 * (self.vertexBufferLimit << 20)):
                             deadChunk = None
@@ -3878,6 +4505,11 @@ class MCRenderer(object):
                                                     self.level.Height / 2):
                     raise StopIteration
 
+            if self.meshPool is not None:
+                for _ in self.startMeshJob(cr):
+                    yield
+                raise StopIteration
+
             faceInfoCalculator = self.calcFacesForChunkRenderer(cr)
             try:
                 for _ in faceInfoCalculator:
@@ -3893,6 +4525,74 @@ class MCRenderer(object):
 
                 logging.info(u"Skipped chunk {f}: {e}".format(e=e, f=fn))
 
+    def startMeshJob(self, cr):
+        """ Prepares the chunk on this thread and hands the rest of its geometry to the mesh workers """
+        c = cr.chunkPosition
+        if c in self._meshJobs:
+            # invalidateChunk marks the job in progress stale when the chunk changes, so it is only calculated again
+            # here if it is to be drawn at another detail level
+            if min(self.detailLevelForChunk(c), cr.maxlod) != cr.detailLevel:
+                self._meshJobs[c][0].stale = True
+            raise StopIteration
+
+        job = cr.meshJob()
+        if job is None:
+            raise StopIteration
+
+        work = 0
+        try:
+            for _ in job.prepare():
+                work += 1
+                if (work % MCRenderer.workFactor) == 0:
+                    yield
+        except Exception as e:
+            traceback.print_exc()
+            logging.info(u"Skipped chunk {f}: {e}".format(e=e, f=c))
+            raise StopIteration
+
+        if job.snapshot is None:
+            self.finishMeshJob(job)
+        else:
+            self._meshJobs[c] = job, self.meshPool.apply_async(job.run)
+
+    # Seconds to wait for a mesh worker when there is nothing else to do. Waiting instead of polling leaves the GIL
+    # to the workers.
+    meshWaitTime = 0.002
+
+    def waitForMeshJob(self):
+        job, result = next(self._meshJobs.itervalues())
+        result.wait(self.meshWaitTime)
+
+    def finishMeshJobs(self):
+        """ Gives the geometry calculated by the mesh workers to the chunk renderers """
+        for c, (job, result) in self._meshJobs.items():
+            if not result.ready():
+                continue
+            del self._meshJobs[c]
+            try:
+                result.get()
+            except Exception as e:
+                traceback.print_exc()
+                logging.info(u"Skipped chunk {f}: {e}".format(e=e, f=c))
+                continue
+
+            self.finishMeshJob(job)
+
+    def finishMeshJob(self, job):
+        cr = job.chunkRenderer
+        invalidLayers = set(cr.invalidLayers)
+        invalidSections = cr.invalidSections
+        self.bufferUsage -= cr.bufferSize
+        job.finish()
+        if job.stale:
+            # the geometry may already be out of date, so the chunk stays invalid and is calculated again
+            cr.invalidLayers.update(invalidLayers)
+            cr.invalidSections = invalidSections
+            self.invalidChunkQueue.append(cr.chunkPosition)
+
+        self.chunkDone(cr, 1)
+        self.invalidateMasterList()
+
     redrawChunks = 0
 
     def chunkDone(self, chunkRenderer, work):
@@ -203,4 +203,6 @@ class GLDisplayContext(object):
                     functools.partial(makeTerrainTexture, mats)
                 )
             mats.terrainTexture = self.terrainTextures[mats.name]
+            # for greedy meshing, see renderer.GreedyBlockRenderer
+            glutils.makeTileTextures(mats.terrainTexture, 512 if mats.name in ("Alpha", "Pocket") else 256)
 
@@ -1272,7 +1272,19 @@ class CameraViewport(GLViewport):
                         tag = self.editor.level.getPlayerTag(player)
                         tag["Inventory"].value = [t for t in tag["Inventory"].value if not matches(t)]
 
-                    for chunk in self.editor.level.getChunks():
+                    level = self.editor.level
+                    if hasattr(level, "getEntityIndex") and not (id < 256 and deleteBlocksToo.value):
+                        # only the chunks holding the item need to be loaded
+                        index = level.getEntityIndex()
+                        positions = set(index.findChunks("TileEntities", field="Items.id", values=[id]))
+                        positions.update(index.findChunks("Entities", ["Item"], "Item.id", [id]))
+                        chunks = level.getChunks(sorted(positions))
+                        chunkCount = len(positions)
+                    else:
+                        chunks = level.getChunks()
+                        chunkCount = level.chunkCount
+
+                    for chunk in chunks:
                         if id < 256 and deleteBlocksToo.value:
                             matchingBlocks = chunk.Blocks == id
                             if deleteSameDamage.value:
@@ -1295,7 +1307,7 @@ class CameraViewport(GLViewport):
                             chunk.Entities.value = entities
                             chunk.dirty = True
 
-                        yield (i, self.editor.level.chunkCount)
+                        yield (i, chunkCount)
                         i += 1
 
                 progressInfo = _("Deleting the item {0} from the entire world ({1} chunks)").format(